@@ -0,0 +1,233 @@
+"""
+Control de admisión: limita cuántas peticiones de cada clase se atienden a la vez
+para que los reportes y exportaciones pesadas no acaparen el threadpool ni el
+pool de conexiones y las lecturas baratas sigan respondiendo rápido.
+
+Clases (ver classify):
+    auth   inicio de sesión y registro (bcrypt usa CPU)
+    heavy  reportes, importaciones, sugerencias de compra, conciliación/archivo
+           y consultas de kardex con limit > HEAVY_LIMIT
+    write  el resto de POST/PUT/PATCH/DELETE
+    read   el resto de GET
+
+Cada clase tiene un máximo de peticiones en curso, una cola de espera acotada y
+una espera máxima; si la cola está llena o se agota la espera responde 503 con
+Retry-After sin tocar la base. Además, un token bucket por cliente limita los
+intentos de login (por IP) y las peticiones pesadas (por usuario del token, o
+por IP sin token válido): al agotarse responde 429 con Retry-After.
+
+La IP es la del socket salvo que la conexión venga de un proxy listado en
+FORWARDED_ALLOW_IPS (la misma variable que leen uvicorn y gunicorn; "*" confía
+en cualquiera, como detrás del proxy de Render): solo entonces se usa la última
+entrada de X-Forwarded-For, la que agregó ese proxy. Sin la variable el header se
+ignora y un cliente no puede cambiar de bucket inventándolo.
+
+Los límites son por proceso (con gunicorn, por worker). Se configuran con
+ADMISSION_<CLASE>="en curso,en cola,espera en segundos" (p. ej.
+ADMISSION_HEAVY="1,2,10") y los buckets con RATE_LIMIT_LOGIN y
+RATE_LIMIT_HEAVY="peticiones/segundos" (p. ej. "10/60"). Las tasas son totales:
+cada worker aplica su parte (dividida por WEB_CONCURRENCY), así que el límite
+efectivo se aproxima al configurado si el balanceo reparte las peticiones. Los
+límites de concurrencia y cola, en cambio, se multiplican por la cantidad de
+workers.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+
+from app.routers.auth import token_subject
+
+HEAVY_LIMIT = int(os.getenv("ADMISSION_HEAVY_LIMIT", "200"))
+HEAVY_PREFIXES = ("/reports", "/import", "/purchases/suggestions", "/kardex/reconcile", "/kardex/archive")
+SAFE_METHODS = {"GET", "HEAD"}
+WORKERS = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("FORWARDED_ALLOW_IPS", "").split(",") if ip.strip()}
+
+
+def _limits(name, default):
+    concurrency, queue, wait = os.getenv(f"ADMISSION_{name.upper()}", default).split(",")
+    return int(concurrency), int(queue), float(wait)
+
+
+def _rate(name, default):
+    # La tasa configurada es para todos los workers: cada uno aplica su parte
+    requests, _, seconds = os.getenv(f"RATE_LIMIT_{name.upper()}", default).partition("/")
+    return max(int(requests) / WORKERS, 1), float(seconds)
+
+
+# En total no superan el threadpool de anyio (40 hilos)
+LIMITS = {
+    "read": _limits("read", "16,128,5"),
+    "write": _limits("write", "8,64,5"),
+    "heavy": _limits("heavy", "2,4,10"),
+    "auth": _limits("auth", "4,32,5"),
+}
+RATES = {
+    "login": _rate("login", "10/60"),
+    "heavy": _rate("heavy", "20/60"),
+}
+
+
+def classify(method: str, path: str, query_string: bytes) -> str:
+    if path.startswith("/auth"):
+        return "auth"
+    if path.startswith(HEAVY_PREFIXES):
+        return "heavy"
+    if method not in SAFE_METHODS:
+        return "write"
+    if path.startswith("/kardex") and query_string:
+        for key, value in parse_qsl(query_string.decode("latin-1")):
+            if key == "limit" and value.isdigit() and int(value) > HEAVY_LIMIT:
+                return "heavy"
+    return "read"
+
+
+class Gate:
+    """
+    Semáforo con cola acotada. Todo corre en el event loop, así que los
+    contadores no necesitan lock; los lugares se ceden en orden de llegada.
+    """
+
+    def __init__(self, concurrency: int, queue: int, wait: float):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.wait = wait
+        self.active = 0
+        self._waiters = deque()
+
+    async def acquire(self) -> bool:
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # release() le cedió el lugar justo cuando vencía la espera: devolverlo
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            return False
+        # release() transfiere el lugar sin descontar `active`
+        return True
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+
+class TokenBuckets:
+    """Un bucket por clave: `capacity` peticiones de ráfaga que se reponen en `period` segundos."""
+
+    MAX_KEYS = 10000
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._buckets = {}
+
+    def take(self, key) -> float:
+        """0 si la petición entra; si no, los segundos hasta que haya un token."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+        if len(self._buckets) >= self.MAX_KEYS and key not in self._buckets:
+            self._prune(now)
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    def _prune(self, now):
+        # Los buckets que ya se repusieron equivalen a no tener entrada
+        full = [k for k, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.capacity]
+        for k in full:
+            del self._buckets[k]
+        if len(self._buckets) >= self.MAX_KEYS:
+            self._buckets.clear()
+
+
+def _header(scope, name: bytes):
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value
+    return None
+
+
+def _client_ip(scope):
+    client = scope.get("client")
+    peer = client[0] if client else None
+    # X-Forwarded-For solo vale si lo agregó un proxy de confianza. Las primeras
+    # entradas las puede inventar el cliente; la última la agrega el proxy
+    if TRUSTED_PROXIES and ("*" in TRUSTED_PROXIES or peer in TRUSTED_PROXIES):
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(b",")[-1].strip().decode("latin-1")
+    return peer
+
+
+async def _reject(send, status: int, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI que aplica los buckets y los límites por clase antes de llegar al router."""
+
+    def __init__(self, app, limits=None, rates=None):
+        self.app = app
+        self.gates = {name: Gate(*values) for name, values in (limits or LIMITS).items()}
+        self.buckets = {name: TokenBuckets(*values) for name, values in (rates or RATES).items()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        route_class = classify(method, path, scope.get("query_string", b""))
+
+        retry_after = 0.0
+        if route_class == "auth" and method == "POST" and path == "/auth/login":
+            retry_after = self.buckets["login"].take(_client_ip(scope))
+        elif route_class == "heavy":
+            # Por usuario: renovar el token no da un bucket nuevo; sin token válido, por IP
+            user = token_subject(_header(scope, b"authorization"))
+            key = ("user", user) if user is not None else ("ip", _client_ip(scope))
+            retry_after = self.buckets["heavy"].take(key)
+        if retry_after:
+            await _reject(send, 429, retry_after, "Demasiadas solicitudes, reintente más tarde")
+            return
+
+        gate = self.gates[route_class]
+        if not await gate.acquire():
+            await _reject(send, 503, gate.wait, "Servidor ocupado, reintente en unos segundos")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
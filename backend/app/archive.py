@@ -0,0 +1,222 @@
+"""
+Archivo de movimientos antiguos del kardex.
+
+Los meses completos anteriores al horizonte (KARDEX_ARCHIVE_HORIZON_DAYS) se
+mueven a tablas mensuales kardex_archive_YYYYMM con las mismas columnas e ids.
+Por cada ítem queda un checkpoint con el stock al cierre de su último movimiento
+archivado, que la conciliación usa como punto de partida de la cadena.
+
+Las consultas del kardex leen primero la tabla caliente y solo recurren al
+archivo (un único UNION ALL de los meses que tocan el rango pedido) cuando no
+alcanzan el límite de filas.
+
+Las sugerencias de compra suman los meses archivados al cargar su historial
+(ver app/suggestions.py).
+
+Uso: python -m app.archive [--horizon-days N] [--chunk-size N]
+"""
+import argparse
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Column, Index, MetaData, Table, and_, delete, func, inspect, select, union_all
+from sqlalchemy.orm import Session
+
+from app import models
+from app.reports import month_range, next_month
+
+HORIZON_DAYS = int(os.getenv("KARDEX_ARCHIVE_HORIZON_DAYS", "365"))
+CHUNK_SIZE = int(os.getenv("KARDEX_ARCHIVE_CHUNK_SIZE", "20000"))
+
+KARDEX = models.Kardex.__table__
+COLUMNS = [c.name for c in KARDEX.columns]
+archive_metadata = MetaData()
+
+
+def table_name(month: date) -> str:
+    return f"kardex_archive_{month:%Y%m}"
+
+
+def archive_table(month: date) -> Table:
+    """Tabla de archivo del mes (misma estructura que kardex, sin claves foráneas)."""
+    name = table_name(month)
+    table = archive_metadata.tables.get(name)
+    if table is None:
+        table = Table(
+            name, archive_metadata,
+            *[Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False) for c in KARDEX.columns],
+            Index(f"ix_{name}_user_date", "user_id", "date"),
+            Index(f"ix_{name}_material", "material_id"),
+            Index(f"ix_{name}_product", "product_id"),
+        )
+    return table
+
+
+def sync_archive_tables(db: Session):
+    """Agrega a las tablas de archivo existentes las columnas nuevas de kardex (p. ej. unit_cost)."""
+    from app.database import add_missing_columns
+
+    inspector = inspect(db.get_bind())
+    for month in archived_months(db):
+        table = archive_table(month)
+        if inspector.has_table(table.name):
+            add_missing_columns(table, inspector)
+
+
+def archived_months(db: Session):
+    """Meses (primer día) que ya están en tablas de archivo."""
+    return {month for (month,) in db.query(models.KardexArchiveMonth.month).all()}
+
+
+def _update_checkpoints(db: Session, table: Table, low_id: int, high_id: int, month: date):
+    """Guarda el stock del último movimiento de cada ítem dentro del bloque archivado."""
+    last = select(func.max(table.c.id).label("id")).where(
+        table.c.id >= low_id, table.c.id <= high_id
+    ).group_by(table.c.material_id, table.c.product_id).subquery()
+    rows = db.execute(
+        select(table.c.id, table.c.material_id, table.c.product_id, table.c.stock_nuevo)
+        .join(last, last.c.id == table.c.id)
+    ).all()
+
+    existing = {
+        (cp.material_id, cp.product_id): cp
+        for cp in db.query(models.KardexCheckpoint).all()
+    } if rows else {}
+    for kardex_id, material_id, product_id, stock in rows:
+        if material_id is None and product_id is None:
+            continue
+        checkpoint = existing.get((material_id, product_id))
+        if checkpoint is None:
+            checkpoint = models.KardexCheckpoint(material_id=material_id, product_id=product_id, last_kardex_id=0)
+            db.add(checkpoint)
+            existing[(material_id, product_id)] = checkpoint
+        if checkpoint.last_kardex_id < kardex_id:
+            checkpoint.last_kardex_id = kardex_id
+            checkpoint.stock = stock
+            checkpoint.archived_until = next_month(month)
+
+
+def archive_month(db: Session, month: date, chunk_size: int = CHUNK_SIZE) -> int:
+    """Mueve los movimientos del mes a su tabla de archivo por bloques de ids. Devuelve cuántos movió."""
+    table = archive_table(month)
+    table.create(bind=db.get_bind(), checkfirst=True)
+
+    # Los movimientos de contadores fraccionados aún sin compactar se quedan en kardex
+    conditions = [
+        KARDEX.c.date >= month,
+        KARDEX.c.date < next_month(month),
+        KARDEX.c.stock_nuevo.isnot(None),
+    ]
+    catalog = db.query(models.KardexArchiveMonth).filter(models.KardexArchiveMonth.month == month).first()
+    moved = 0
+    last_id = 0
+    while True:
+        ids = db.execute(
+            select(KARDEX.c.id).where(*conditions, KARDEX.c.id > last_id).order_by(KARDEX.c.id).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            break
+        low_id, high_id = ids[0], ids[-1]
+        chunk = and_(*conditions, KARDEX.c.id >= low_id, KARDEX.c.id <= high_id)
+
+        # Copiar y borrar en la misma transacción: un bloque nunca queda en ambas tablas
+        db.execute(table.insert().from_select(COLUMNS, select(*[KARDEX.c[name] for name in COLUMNS]).where(chunk)))
+        db.execute(delete(KARDEX).where(chunk))
+        _update_checkpoints(db, table, low_id, high_id, month)
+
+        if catalog is None:
+            catalog = models.KardexArchiveMonth(month=month, table_name=table.name, rows=0, min_kardex_id=low_id)
+            db.add(catalog)
+        catalog.rows += len(ids)
+        catalog.min_kardex_id = min(catalog.min_kardex_id or low_id, low_id)
+        catalog.max_kardex_id = max(catalog.max_kardex_id or high_id, high_id)
+        db.commit()
+
+        moved += len(ids)
+        last_id = high_id
+    return moved
+
+
+def archive(db: Session, horizon_days: int = HORIZON_DAYS, chunk_size: int = CHUNK_SIZE):
+    """Archiva todos los meses completos anteriores a hoy - horizon_days."""
+    cutoff = (date.today() - timedelta(days=horizon_days)).replace(day=1)
+    oldest = db.query(func.min(models.Kardex.date)).filter(models.Kardex.date < cutoff).scalar()
+    months = []
+    if oldest is not None:
+        last_month = (cutoff - timedelta(days=1)).replace(day=1)
+        for month in month_range(oldest.date().replace(day=1), last_month):
+            rows = archive_month(db, month, chunk_size)
+            if rows:
+                months.append({"month": month.strftime("%Y-%m"), "rows": rows})
+    return {
+        "cutoff": cutoff,
+        "months": months,
+        "moved": sum(m["rows"] for m in months),
+    }
+
+
+def query_archive(db: Session, user_id: int, limit: int, start: date = None, end: date = None,
+                  material_id: int = None, product_id: int = None):
+    """
+    Movimientos archivados del usuario, más recientes primero, como diccionarios con
+    los nombres de material y producto. Dos consultas: el catálogo y un UNION ALL.
+    """
+    catalog = db.query(models.KardexArchiveMonth.month).order_by(models.KardexArchiveMonth.month.desc())
+    if start is not None:
+        catalog = catalog.filter(models.KardexArchiveMonth.month >= start.replace(day=1))
+    if end is not None:
+        catalog = catalog.filter(models.KardexArchiveMonth.month <= end)
+    months = [m for (m,) in catalog.all()]
+    if not months:
+        return []
+
+    selects = []
+    for month in months:
+        table = archive_table(month)
+        conditions = [table.c.user_id == user_id]
+        if material_id:
+            conditions.append(table.c.material_id == material_id)
+        if product_id:
+            conditions.append(table.c.product_id == product_id)
+        if start is not None:
+            conditions.append(table.c.date >= start)
+        if end is not None:
+            conditions.append(table.c.date < end + timedelta(days=1))
+        selects.append(select(table).where(*conditions))
+    movements = (union_all(*selects) if len(selects) > 1 else selects[0]).subquery()
+
+    rows = db.execute(
+        select(movements, models.Material.name.label("material_name"), models.Product.name.label("product_name"))
+        .outerjoin(models.Material, models.Material.id == movements.c.material_id)
+        .outerjoin(models.Product, models.Product.id == movements.c.product_id)
+        .order_by(movements.c.date.desc(), movements.c.id.desc())
+        .limit(limit)
+    ).all()
+    return [dict(row._mapping) for row in rows]
+
+
+def main():
+    from app.database import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Archiva movimientos antiguos del kardex")
+    parser.add_argument("--horizon-days", type=int, default=HORIZON_DAYS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        started = datetime.utcnow()
+        result = archive(db, horizon_days=args.horizon_days, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+
+    print(f"Corte: {result['cutoff']}  Movimientos archivados: {result['moved']} "
+          f"en {(datetime.utcnow() - started).total_seconds():.1f}s")
+    for month in result["months"]:
+        print(f"  {month['month']}: {month['rows']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
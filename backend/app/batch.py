@@ -0,0 +1,29 @@
+from typing import List, Optional
+
+from fastapi import HTTPException, Response, status
+
+# Máximo de ids por consulta batch (?ids=1,2,3)
+MAX_BATCH_IDS = 500
+MISSING_HEADER = "X-Missing-Ids"
+
+
+def parse_ids(ids: Optional[str]) -> Optional[List[int]]:
+    """Convierte "1,2,3" en [1, 2, 3] sin repetidos; None si no se pidió un batch."""
+    if ids is None:
+        return None
+    try:
+        parsed = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids debe ser una lista de enteros separados por comas")
+    if len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Se permiten hasta {MAX_BATCH_IDS} ids por consulta")
+    return parsed
+
+
+def report_missing(response: Response, requested: List[int], found):
+    """Devuelve los registros en el orden pedido e informa los ids inexistentes en X-Missing-Ids."""
+    by_id = {item.id: item for item in found}
+    missing = [i for i in requested if i not in by_id]
+    if missing:
+        response.headers[MISSING_HEADER] = ",".join(map(str, missing))
+    return [by_id[i] for i in requested if i in by_id]
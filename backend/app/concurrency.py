@@ -0,0 +1,57 @@
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+# Reintentos para operaciones que aplican un delta (add/remove) ante un conflicto de versión
+MAX_RETRIES = 3
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Extrae la versión de un encabezado If-Match ("3", W/"3" o 3). '*' no impone versión."""
+    if not if_match or if_match.strip() == "*":
+        return None
+    value = if_match.split(",")[0].strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        return -1
+
+
+def retry_on_conflict(db: Session, attempt):
+    """
+    Ejecuta attempt() (carga el registro, aplica el delta y hace commit) y lo
+    repite si otra petición cambió la versión entre la lectura y el UPDATE.
+    Devuelve lo que retorne attempt(), o None si se agotaron los reintentos.
+    """
+    for _ in range(MAX_RETRIES):
+        try:
+            return attempt()
+        except StaleDataError:
+            db.rollback()
+    return None
+
+
+def conflict_response(current, detail: str, status_code: int = status.HTTP_409_CONFLICT,
+                      not_found: str = "Registro no encontrado") -> JSONResponse:
+    """
+    Respuesta de conflicto con el estado actual del recurso para que el cliente reintente.
+    Si el recurso ya no existe (otra petición lo borró) responde 404 con not_found.
+    """
+    if current is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found)
+    state = {column.name: getattr(current, column.name) for column in current.__table__.columns}
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail, "current": jsonable_encoder(state)},
+        headers={"ETag": etag(current.version_id)},
+    )
@@ -0,0 +1,180 @@
+"""
+Coordinación entre workers cuando la API corre con varios procesos (gunicorn).
+
+Cada worker mantiene estado en memoria (índice de stock bajo, índice de
+búsqueda). Cuando un worker lo modifica publica un evento (canal, clave) en la
+tabla change_events; un hilo de cada worker lee cada CHANGE_EVENTS_POLL_INTERVAL
+segundos los eventos nuevos de los demás y los aplica con los manejadores
+registrados para el canal, releyendo el estado desde la base. Solo hace falta
+la base de datos: no hay broker ni comunicación directa entre procesos.
+
+Los eventos publicados se acumulan en memoria y el mismo hilo los inserta por
+lotes, así que publicar no agrega consultas a la petición. Los manejadores deben
+ser idempotentes: un evento puede aplicarse más de una vez.
+
+Con un solo proceso (CROSS_WORKER_EVENTS distinto de 1) nada se publica ni se
+consulta.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("CROSS_WORKER_EVENTS", "0") == "1"
+POLL_INTERVAL = float(os.getenv("CHANGE_EVENTS_POLL_INTERVAL", "1"))
+RETENTION = timedelta(seconds=float(os.getenv("CHANGE_EVENTS_RETENTION", "3600")))
+# Con varios workers insertando a la vez, un id menor puede confirmarse después
+# de uno mayor: se vuelve a mirar esta cantidad de ids por debajo del último leído
+LOOKBACK_IDS = 200
+BATCH_SIZE = 5000
+PRUNE_EVERY = 300
+
+EVENTS = models.ChangeEvent.__table__
+
+
+class ChangeEvents:
+    """Publicación y escucha de eventos entre workers a través de la base."""
+
+    def __init__(self, session_factory, interval: float = POLL_INTERVAL, enabled: bool = ENABLED):
+        self._session_factory = session_factory
+        self.interval = interval
+        self.enabled = enabled
+        self.origin = None
+        self._handlers = {}
+        self._outbox = []
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._seen = set()
+        self._ticks = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, channel: str, handler):
+        """Registra handler(db, claves) para los eventos del canal publicados por otros workers."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, key: str):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        with self._lock:
+            self._outbox.append((channel, str(key)))
+
+    def prime(self, db: Session):
+        """
+        Fija el punto de partida antes de cargar el estado en memoria: los eventos
+        posteriores se aplicarán encima de la carga, así no se pierde ninguno.
+        """
+        if not self.enabled:
+            return
+        # El id del proceso se toma en el worker, no en el maestro que precargó la app
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self._last_id = db.execute(select(func.max(EVENTS.c.id))).scalar() or 0
+        self._seen = set(db.execute(
+            select(EVENTS.c.id).where(EVENTS.c.id > self._last_id - LOOKBACK_IDS)
+        ).scalars())
+
+    def start(self):
+        if not self.enabled:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="change-events", daemon=True)
+            self._thread.start()
+            logger.info("Eventos entre workers activos (%s, cada %.1fs)", self.origin, self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+        # Lo que quedó sin enviar se publica antes de salir
+        if self.enabled:
+            db = self._session_factory()
+            try:
+                self._flush(db)
+            except Exception:
+                logger.exception("Error publicando eventos entre workers")
+            finally:
+                db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = self._session_factory()
+            try:
+                self.tick(db)
+            except Exception:
+                db.rollback()
+                logger.exception("Error procesando eventos entre workers")
+            finally:
+                db.close()
+
+    def tick(self, db: Session):
+        """Publica lo pendiente, aplica lo recibido y cada tanto borra eventos viejos."""
+        self._flush(db)
+        self._poll(db)
+        self._ticks += 1
+        if self._ticks % PRUNE_EVERY == 0:
+            db.execute(delete(EVENTS).where(EVENTS.c.created_at < datetime.utcnow() - RETENTION))
+            db.commit()
+
+    def _flush(self, db: Session):
+        with self._lock:
+            outbox, self._outbox = self._outbox, []
+        if not outbox:
+            return
+        now = datetime.utcnow()
+        rows = [
+            {"channel": channel, "key": key, "origin": self.origin, "created_at": now}
+            for channel, key in dict.fromkeys(outbox)
+        ]
+        db.execute(EVENTS.insert(), rows)
+        db.commit()
+
+    def _poll(self, db: Session):
+        rows = db.execute(
+            select(EVENTS.c.id, EVENTS.c.channel, EVENTS.c.key, EVENTS.c.origin)
+            .where(EVENTS.c.id > self._last_id - LOOKBACK_IDS)
+            .order_by(EVENTS.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        db.rollback()
+        keys = {}
+        for event_id, channel, key, origin in rows:
+            if event_id in self._seen:
+                continue
+            self._seen.add(event_id)
+            self._last_id = max(self._last_id, event_id)
+            if origin != self.origin:
+                keys.setdefault(channel, {})[key] = None
+        floor = self._last_id - LOOKBACK_IDS
+        self._seen = {event_id for event_id in self._seen if event_id > floor}
+
+        for channel, channel_keys in keys.items():
+            for handler in self._handlers.get(channel, ()):
+                try:
+                    handler(db, list(channel_keys))
+                except Exception:
+                    db.rollback()
+                    logger.exception("Error aplicando eventos del canal %s", channel)
+
+
+def item_keys(keys):
+    """Agrupa claves 'material:12' por tipo: {'material': {12, ...}}. Ignora las demás."""
+    ids = {}
+    for key in keys:
+        kind, sep, item_id = key.partition(":")
+        if sep and item_id.isdigit():
+            ids.setdefault(kind, set()).add(int(item_id))
+    return ids
+
+
+change_events = ChangeEvents(SessionLocal)
@@ -0,0 +1,94 @@
+"""
+Costo promedio ponderado y valorización del inventario.
+
+Cada material y producto guarda su costo promedio por unidad (avg_cost). Una
+entrada con costo conocido lo actualiza en O(1) con el stock previo:
+
+    nuevo promedio = (stock previo * promedio + cantidad * costo) / (stock previo + cantidad)
+
+(el stock previo negativo cuenta como cero). Las salidas y las entradas sin costo
+(ajustes manuales) no lo cambian y se registran al promedio vigente. Cada
+movimiento del kardex guarda su costo unitario (unit_cost), así que el valor de
+un movimiento es quantity * unit_cost sin recorrer el historial.
+
+En los ítems con contadores fraccionados el promedio se actualiza al compactar,
+cuando se completa la cadena del kardex (ver app/shards.py); hasta entonces las
+salidas quedan sin unit_cost y el ítem se valoriza con el stock y el promedio de
+la última compactación.
+
+La valorización del catálogo es stock * avg_cost de cada ítem en una consulta:
+O(ítems), no O(historial).
+"""
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from app import models
+
+MODELS = {
+    "material": models.Material,
+    "product": models.Product,
+}
+
+
+def weighted_average(stock, avg_cost, quantity, unit_cost):
+    """Promedio después de recibir quantity unidades a unit_cost con stock previo stock."""
+    held = max(stock or 0, 0)
+    if held + quantity <= 0:
+        return avg_cost or 0.0
+    return (held * (avg_cost or 0.0) + quantity * unit_cost) / (held + quantity)
+
+
+def average_cost_update(model, received, costs):
+    """
+    Expresión SQL del nuevo avg_cost para un UPDATE por lotes: received es
+    {id: cantidad que entra} y costs {id: costo unitario}. Lee el stock previo,
+    así que debe asignarse antes que stock (MySQL evalúa el SET en orden).
+    """
+    stock = func.coalesce(model.stock, 0)
+    held = case((stock > 0, stock), else_=0)
+    quantity = case(received, value=model.id, else_=0)
+    cost = case({item_id: float(c) for item_id, c in costs.items()}, value=model.id, else_=0.0)
+    return case(
+        (model.id.in_(list(costs)), (held * func.coalesce(model.avg_cost, 0.0) + quantity * cost) / (held + quantity)),
+        else_=model.avg_cost,
+    )
+
+
+def valuation(db: Session, kind: str = None):
+    """Valor del inventario (stock * costo promedio) de materiales y/o productos, en una consulta."""
+    kinds = [kind] if kind else list(MODELS)
+    selects = []
+    for name in kinds:
+        model = MODELS[name]
+        stock = func.coalesce(model.stock, 0)
+        cost = func.coalesce(model.avg_cost, 0.0)
+        selects.append(select(
+            literal(name).label("kind"), model.id.label("id"), model.name.label("name"),
+            stock.label("stock"), cost.label("avg_cost"), (stock * cost).label("value"),
+        ))
+    statement = selects[0] if len(selects) == 1 else union_all(*selects)
+    rows = db.execute(statement).all()
+
+    items = sorted(
+        (
+            {
+                "kind": row.kind,
+                "id": row.id,
+                "name": row.name,
+                "stock": int(row.stock),
+                "avg_cost": round(float(row.avg_cost), 4),
+                "value": round(float(row.value), 2),
+            }
+            for row in rows
+        ),
+        key=lambda item: (item["kind"], item["id"]),
+    )
+    return {
+        "kind": kind,
+        "generated_at": datetime.utcnow(),
+        "total_units": sum(int(row.stock) for row in rows),
+        "total_value": round(sum(float(row.value) for row in rows), 2),
+        "items": items,
+    }
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -41,3 +41,38 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Agregar columnas e índices declarados en los modelos que falten en tablas ya
+# existentes (create_all solo los crea al crear la tabla)
+def sync_schema():
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        add_missing_columns(table, inspector)
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+
+
+def add_missing_columns(table, inspector=None):
+    """Agrega a una tabla existente las columnas declaradas que le falten."""
+    inspector = inspector or inspect(engine)
+    columns = {c["name"] for c in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in columns:
+            _add_column(table, column)
+
+
+def _add_column(table, column):
+    quote = engine.dialect.identifier_preparer.quote
+    ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=engine.dialect)}"
+    if column.server_default is not None:
+        default = column.server_default.arg
+        ddl += f" DEFAULT {getattr(default, 'text', None) or repr(str(default))}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
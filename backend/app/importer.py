@@ -0,0 +1,240 @@
+"""
+Importación masiva de materiales, productos y proveedores desde CSV o XLSX.
+
+El archivo se lee en streaming y se procesa por bloques de CHUNK_SIZE filas:
+cada fila se valida con el mismo esquema que el endpoint de creación, las
+referencias (nombres de proveedor ya usados, materiales por id o por nombre) se
+resuelven con una consulta por bloque y las filas válidas se insertan con
+bulk_insert_mappings (executemany) en una transacción por bloque.
+
+Las filas con errores no se insertan; se informan con su número de fila en el
+archivo (la cabecera es la fila 1).
+
+Si el archivo deja de poder leerse (codificación inválida, CSV mal formado) la
+importación se detiene ahí: sin bloques confirmados se propaga el error; si ya
+se insertaron bloques, se devuelve el resumen parcial con read_error y los
+índices en memoria se actualizan con lo insertado.
+"""
+import csv
+import io
+import os
+
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.lowstock import low_stock
+from app.search import catalog_search
+from app.supplier_materials import backfill_supplier_materials
+
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+MAX_ERRORS = 1000
+
+KINDS = {
+    "materials": (models.Material, schemas.MaterialCreate),
+    "products": (models.Product, schemas.ProductCreate),
+    "suppliers": (models.Supplier, schemas.SupplierCreate),
+}
+# Columnas de proveedores que referencian un material por nombre
+MATERIAL_NAME_COLUMNS = ("material", "material_name")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _header(values):
+    return [str(v).strip().lower() if v is not None else "" for v in values]
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+    # Celda vacía: que aplique el valor por defecto del esquema
+    return None if value == "" else value
+
+
+def _csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    header = _header(next(reader, []))
+    for values in reader:
+        yield header, values
+
+
+def _xlsx_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError("Para importar XLSX instale openpyxl")
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as exc:
+        raise ImportFormatError(f"Archivo XLSX inválido: {exc}")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = _header(next(rows, []))
+        for values in rows:
+            yield header, values
+    finally:
+        workbook.close()
+
+
+def iter_rows(stream, filename: str):
+    """Genera (número de fila, dict columna -> valor) sin cargar el archivo completo."""
+    name = (filename or "").lower()
+    if name.endswith(".xlsx"):
+        rows = _xlsx_rows(stream)
+    elif name.endswith(".csv") or name.endswith(".txt"):
+        rows = _csv_rows(stream)
+    else:
+        raise ImportFormatError("Formato no soportado: use .csv o .xlsx")
+    for number, (header, values) in enumerate(rows, start=2):
+        row = {}
+        for column, value in zip(header, values):
+            value = _clean(value)
+            if column and value is not None:
+                row[column] = value
+        if row:
+            yield number, row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _messages(exc: ValidationError):
+    return [f"{'.'.join(str(p) for p in e['loc']) or 'fila'}: {e['msg']}" for e in exc.errors()]
+
+
+def _resolve_suppliers(db: Session, valid, raw, seen_names):
+    """
+    Verifica nombres únicos y resuelve el material de cada proveedor con una
+    consulta por tipo de referencia. Devuelve {número de fila: [errores]}.
+    """
+    errors = {}
+    names = {data["name"] for _, data in valid if data.get("name")}
+    taken = {n for (n,) in db.query(models.Supplier.name).filter(models.Supplier.name.in_(names)).all()} if names else set()
+
+    ids = {data["material_id"] for _, data in valid if data.get("material_id") is not None}
+    known_ids = {i for (i,) in db.query(models.Material.id).filter(models.Material.id.in_(ids)).all()} if ids else set()
+
+    material_names = {}
+    for number, _ in valid:
+        reference = next((raw[number][c] for c in MATERIAL_NAME_COLUMNS if c in raw[number]), None)
+        if reference is not None:
+            material_names[number] = str(reference)
+    by_name = {}
+    if material_names:
+        rows = db.query(models.Material.id, models.Material.name).filter(
+            models.Material.name.in_(set(material_names.values()))
+        ).all()
+        for material_id, name in rows:
+            by_name.setdefault(name, []).append(material_id)
+
+    for number, data in valid:
+        row_errors = []
+        name = data.get("name")
+        if name and (name in taken or name in seen_names):
+            row_errors.append("name: Ya existe un proveedor con este nombre")
+        if data.get("material_id") is not None:
+            if data["material_id"] not in known_ids:
+                row_errors.append("material_id: Material no encontrado")
+        elif number in material_names:
+            matches = by_name.get(material_names[number], [])
+            if len(matches) == 1:
+                data["material_id"] = matches[0]
+            elif not matches:
+                row_errors.append("material: Material no encontrado")
+            else:
+                row_errors.append("material: Nombre de material ambiguo, use material_id")
+        if row_errors:
+            errors[number] = row_errors
+        elif name:
+            seen_names.add(name)
+    return errors
+
+
+def import_rows(db: Session, kind: str, rows, chunk_size: int = CHUNK_SIZE):
+    """
+    Valida e inserta las filas (iterable de (número, dict)) por bloques.
+    Devuelve el resumen con los errores por fila (hasta MAX_ERRORS) y, si el
+    archivo dejó de leerse después de insertar algo, read_error.
+    """
+    model, schema = KINDS[kind]
+    last_id = db.query(func.max(model.id)).scalar() or 0
+    result = {"kind": kind, "rows": 0, "inserted": 0, "error_count": 0, "errors": [], "read_error": None}
+    seen_names = set()
+    last_number = 1
+
+    def fail(number, messages):
+        result["error_count"] += 1
+        if len(result["errors"]) < MAX_ERRORS:
+            result["errors"].append({"row": number, "errors": messages})
+
+    chunks = _chunks(rows, chunk_size)
+    while True:
+        try:
+            chunk = next(chunks, None)
+        except (UnicodeDecodeError, ValueError, csv.Error) as exc:
+            if not result["inserted"]:
+                raise
+            result["read_error"] = f"No se pudo leer el archivo después de la fila {last_number}: {exc}"
+            break
+        if chunk is None:
+            break
+        last_number = chunk[-1][0]
+        result["rows"] += len(chunk)
+        raw = dict(chunk)
+        valid = []
+        for number, row in chunk:
+            try:
+                valid.append((number, schema(**row).dict()))
+            except ValidationError as exc:
+                fail(number, _messages(exc))
+
+        if kind == "suppliers" and valid:
+            errors = _resolve_suppliers(db, valid, raw, seen_names)
+            for number, messages in errors.items():
+                fail(number, messages)
+            valid = [(number, data) for number, data in valid if number not in errors]
+        if not valid:
+            continue
+
+        try:
+            db.bulk_insert_mappings(model, [data for _, data in valid])
+            db.commit()
+        except IntegrityError as exc:
+            db.rollback()
+            detail = str(exc.orig).splitlines()[0] if exc.orig else str(exc)
+            for number, _ in valid:
+                fail(number, [f"No se pudo insertar el bloque: {detail}"])
+            continue
+        result["inserted"] += len(valid)
+
+    # Los proveedores se insertan con su material_id: crear la relación proveedor-material
+    if result["inserted"] and kind == "suppliers":
+        backfill_supplier_materials(db)
+    # Los ítems nuevos pueden quedar bajo el mínimo: recargar el índice una sola vez
+    if result["inserted"] and kind in ("materials", "products"):
+        low_stock.load(db)
+    # bulk_insert_mappings no devuelve los ids: indexar lo que quedó después del último id previo
+    if result["inserted"]:
+        catalog_search.load_new(db, kind.rstrip("s"), last_id)
+    result["errors_truncated"] = result["error_count"] > len(result["errors"])
+    return result
@@ -0,0 +1,404 @@
+"""
+Reportes pesados en segundo plano.
+
+La petición solo registra el trabajo en la tabla report_jobs y responde; un pool
+de hilos del proceso (JOBS_WORKERS) lo genera con su propia sesión y deja el
+resultado en un archivo de REPORT_ARTIFACTS_DIR. No hay broker: la tabla es la
+cola y el estado, y un UPDATE condicional (pendiente -> en_proceso) garantiza que
+con varios workers de gunicorn cada trabajo se ejecute una sola vez.
+
+Cada trabajo guarda la huella de sus parámetros y la versión de los datos con que
+se generó (último id del kardex y, según el reporte, una firma del catálogo). Un
+pedido con los mismos parámetros sobre los mismos datos reutiliza el trabajo en
+curso o el archivo ya generado en lugar de calcularlo otra vez.
+
+Reportes:
+    kardex_export   CSV con todos los movimientos del usuario (archivo incluido)
+    abc             clasificación ABC y rotación (JSON, igual que /reports/abc)
+    period_summary  entradas y salidas por ítem y mes (CSV)
+
+Variables de entorno:
+    JOBS_WORKERS            hilos por proceso (2)
+    JOBS_MAX_ACTIVE         trabajos pendientes o en proceso por usuario (5)
+    JOBS_RETENTION_HOURS    horas que se conservan trabajos y archivos terminados (24)
+    JOBS_STALE_SECONDS      un trabajo en_proceso más viejo se considera abandonado (3600)
+    REPORT_ARTIFACTS_DIR    carpeta de los archivos (<tmp>/pyglass-reports); con
+                            varios procesos debe ser compartida
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+from app.reports import ITEMS, MAX_REPORT_MONTHS, abc_report, data_version, month_range, next_month, parse_period
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+MAX_ACTIVE = int(os.getenv("JOBS_MAX_ACTIVE", "5"))
+RETENTION = timedelta(hours=float(os.getenv("JOBS_RETENTION_HOURS", "24")))
+STALE_AFTER = timedelta(seconds=float(os.getenv("JOBS_STALE_SECONDS", "3600")))
+ARTIFACTS_DIR = os.getenv("REPORT_ARTIFACTS_DIR") or os.path.join(tempfile.gettempdir(), "pyglass-reports")
+STREAM_ROWS = 1000
+PRUNE_INTERVAL = 3600
+# Segundos durante los que un archivo nuevo no se borra aunque ningún trabajo lo referencie
+PRUNE_GRACE = 300
+
+PENDING, RUNNING, DONE, FAILED = "pendiente", "en_proceso", "terminado", "error"
+ACTIVE = (PENDING, RUNNING)
+
+
+def _kardex_version(db: Session):
+    """Último id del kardex, contando los meses archivados (si la tabla caliente quedó vacía)."""
+    return db.query(
+        func.coalesce(
+            db.query(func.max(models.Kardex.id)).scalar_subquery(),
+            db.query(func.max(models.KardexArchiveMonth.max_kardex_id)).scalar_subquery(),
+            0,
+        )
+    ).scalar()
+
+
+def _period(params: dict):
+    kind = params.get("kind", "product")
+    if kind not in ITEMS:
+        raise ValueError("kind debe ser product o material")
+    start, end = parse_period(params.get("start"), params.get("end"), MAX_REPORT_MONTHS)
+    return {"kind": kind, "start": start.strftime("%Y-%m"), "end": end.strftime("%Y-%m")}
+
+
+def _optional_date(params: dict, key: str):
+    value = params.get(key)
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise ValueError(f"{key} debe ser una fecha YYYY-MM-DD")
+
+
+def _optional_id(params: dict, key: str):
+    value = params.get(key)
+    if value in (None, ""):
+        return None
+    if isinstance(value, bool) or not str(value).isdigit():
+        raise ValueError(f"{key} debe ser un id numérico")
+    return int(value)
+
+
+# -------- GENERADORES --------
+def _open_csv(path):
+    handle = open(path, "w", newline="", encoding="utf-8")
+    return handle, csv.writer(handle)
+
+
+def _archive_tables(db: Session, start=None, end=None):
+    from app.archive import archive_table
+
+    catalog = db.query(models.KardexArchiveMonth.month).order_by(models.KardexArchiveMonth.month)
+    if start is not None:
+        catalog = catalog.filter(models.KardexArchiveMonth.month >= start.replace(day=1))
+    if end is not None:
+        catalog = catalog.filter(models.KardexArchiveMonth.month <= end)
+    return [archive_table(month) for (month,) in catalog.all()]
+
+
+def _export_kardex(db: Session, params: dict, path: str):
+    """Movimientos del usuario en orden cronológico: primero los meses archivados, luego la tabla caliente."""
+    start = date.fromisoformat(params["start"]) if params["start"] else None
+    end = date.fromisoformat(params["end"]) if params["end"] else None
+    materials = dict(db.query(models.Material.id, models.Material.name).all())
+    products = dict(db.query(models.Product.id, models.Product.name).all())
+
+    handle, writer = _open_csv(path)
+    with handle:
+        writer.writerow(["id", "fecha", "tipo", "material_id", "material", "producto_id", "producto",
+                         "cantidad", "stock_anterior", "stock_nuevo", "costo_unitario", "observaciones"])
+        for table in _archive_tables(db, start, end) + [models.Kardex.__table__]:
+            conditions = [table.c.user_id == params["user_id"]]
+            if params["material_id"]:
+                conditions.append(table.c.material_id == params["material_id"])
+            if params["product_id"]:
+                conditions.append(table.c.product_id == params["product_id"])
+            if start is not None:
+                conditions.append(table.c.date >= start)
+            if end is not None:
+                conditions.append(table.c.date < end + timedelta(days=1))
+            # Por lotes, sin cargar todo el historial en memoria
+            rows = db.execute(
+                select(table).where(*conditions).order_by(table.c.id).execution_options(yield_per=STREAM_ROWS)
+            )
+            for row in rows:
+                writer.writerow([
+                    row.id, row.date.isoformat() if row.date else "", row.movement_type,
+                    row.material_id or "", materials.get(row.material_id, "") if row.material_id else "",
+                    row.product_id or "", products.get(row.product_id, "") if row.product_id else "",
+                    row.quantity, row.stock_anterior, row.stock_nuevo,
+                    "" if row.unit_cost is None else row.unit_cost, row.observaciones or "",
+                ])
+
+
+def _abc(db: Session, params: dict, path: str):
+    start, end = parse_period(params["start"], params["end"])
+    report = abc_report(db, params["kind"], start, end)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, ensure_ascii=False, default=str)
+
+
+def _period_summary(db: Session, params: dict, path: str):
+    """Entradas, salidas y cantidad de movimientos de cada ítem por mes, una consulta por mes."""
+    from app.archive import archive_table, archived_months
+
+    kind = params["kind"]
+    model, item_column = ITEMS[kind]
+    names = dict(db.query(model.id, model.name).all())
+    archived = archived_months(db)
+    start, end = parse_period(params["start"], params["end"])
+
+    handle, writer = _open_csv(path)
+    with handle:
+        writer.writerow(["mes", "id", "nombre", "entradas", "salidas", "neto", "movimientos"])
+        for month in month_range(start, end):
+            table = archive_table(month) if month in archived else models.Kardex.__table__
+            column = table.c[item_column.name]
+            rows = db.execute(
+                select(
+                    column,
+                    func.sum(case((table.c.movement_type == "entrada", table.c.quantity), else_=0)),
+                    func.sum(case((table.c.movement_type == "salida", table.c.quantity), else_=0)),
+                    func.count(table.c.id),
+                ).where(
+                    column.isnot(None), table.c.date >= month, table.c.date < next_month(month),
+                ).group_by(column).order_by(column)
+            ).all()
+            label = month.strftime("%Y-%m")
+            for item_id, ins, outs, movements in rows:
+                ins, outs = ins or 0, outs or 0
+                writer.writerow([label, item_id, names.get(item_id, ""), ins, outs, ins - outs, movements])
+
+
+class Report:
+    """Tipo de reporte: cómo validar sus parámetros, medir la versión de sus datos y generar el archivo."""
+
+    def __init__(self, extension, media_type, normalize, version, generate, per_user=False):
+        self.extension = extension
+        self.media_type = media_type
+        self.normalize = normalize
+        self.version = version
+        self.generate = generate
+        # Los de un usuario solo los ve quien los pidió; el resto se comparte entre usuarios
+        self.per_user = per_user
+
+
+def _kardex_params(params, user_id):
+    return {
+        "user_id": user_id,
+        "material_id": _optional_id(params, "material_id"),
+        "product_id": _optional_id(params, "product_id"),
+        "start": _optional_date(params, "start"),
+        "end": _optional_date(params, "end"),
+    }
+
+
+REPORTS = {
+    "kardex_export": Report(
+        "csv", "text/csv; charset=utf-8", _kardex_params,
+        lambda db, params: _kardex_version(db), _export_kardex, per_user=True,
+    ),
+    "abc": Report(
+        "json", "application/json", lambda params, user_id: _period(params),
+        lambda db, params: data_version(db, params["kind"]), _abc,
+    ),
+    "period_summary": Report(
+        "csv", "text/csv; charset=utf-8", lambda params, user_id: _period(params),
+        lambda db, params: _kardex_version(db), _period_summary,
+    ),
+}
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def artifact_path(job: models.ReportJob) -> str:
+    return os.path.join(ARTIFACTS_DIR, job.artifact)
+
+
+def _artifact_ready(job: models.ReportJob) -> bool:
+    return job.status == DONE and bool(job.artifact) and os.path.exists(artifact_path(job))
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+class JobRunner:
+    """Cola de reportes sobre la tabla report_jobs, ejecutada por un pool de hilos del proceso."""
+
+    def __init__(self, session_factory, workers: int = WORKERS):
+        self._session_factory = session_factory
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def submit(self, db: Session, report: str, params: dict, user_id: int):
+        """
+        Registra el reporte y lo encola, o devuelve (trabajo, True) si ya hay uno con
+        los mismos parámetros y datos pendiente, en proceso o con su archivo listo.
+        Lanza ValueError si los parámetros no son válidos y TooManyJobs si el
+        usuario ya tiene MAX_ACTIVE trabajos sin terminar.
+        """
+        spec = REPORTS.get(report)
+        if spec is None:
+            raise ValueError(f"Reporte desconocido; opciones: {', '.join(sorted(REPORTS))}")
+        params = spec.normalize(params or {}, user_id)
+        params_hash = _digest([report, params])
+        version = _digest(spec.version(db, params))
+
+        candidates = db.query(models.ReportJob).filter(
+            models.ReportJob.report == report,
+            models.ReportJob.params_hash == params_hash,
+            models.ReportJob.data_version == version,
+            models.ReportJob.status.in_(ACTIVE + (DONE,)),
+        ).order_by(models.ReportJob.id.desc()).all()
+        for job in candidates:
+            if job.status in ACTIVE or _artifact_ready(job):
+                return job, True
+
+        active = db.query(func.count(models.ReportJob.id)).filter(
+            models.ReportJob.user_id == user_id, models.ReportJob.status.in_(ACTIVE),
+        ).scalar()
+        if active >= MAX_ACTIVE:
+            raise TooManyJobs()
+
+        job = models.ReportJob(
+            report=report, params=json.dumps(params, sort_keys=True), params_hash=params_hash,
+            data_version=version, status=PENDING, user_id=user_id,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._enqueue(job.id)
+        return job, False
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report-job")
+
+    def stop(self):
+        # Los trabajos que no terminen quedan en la tabla y se retoman al iniciar
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def recover(self, db: Session):
+        """Al iniciar: retoma los trabajos abandonados por un proceso que terminó y borra los vencidos."""
+        os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+        db.execute(
+            update(models.ReportJob)
+            .where(models.ReportJob.status == RUNNING, models.ReportJob.started_at < datetime.utcnow() - STALE_AFTER)
+            .values(status=PENDING, started_at=None)
+        )
+        db.commit()
+        self.prune(db)
+        for (job_id,) in db.query(models.ReportJob.id).filter(models.ReportJob.status == PENDING).all():
+            self._enqueue(job_id)
+
+    def prune(self, db: Session):
+        """Borra los trabajos terminados hace más de RETENTION y los archivos que ya nadie referencia."""
+        self._last_prune = time.monotonic()
+        cutoff = datetime.utcnow() - RETENTION
+        db.query(models.ReportJob).filter(
+            models.ReportJob.status.in_((DONE, FAILED)), models.ReportJob.finished_at < cutoff,
+        ).delete(synchronize_session=False)
+        db.commit()
+        referenced = {name for (name,) in db.query(models.ReportJob.artifact).filter(
+            models.ReportJob.artifact.isnot(None)
+        ).all()}
+        recent = time.time() - PRUNE_GRACE
+        for entry in os.scandir(ARTIFACTS_DIR):
+            # Los temporales de un trabajo en curso empiezan con "."; los archivos
+            # recientes pueden ser de un trabajo que aún no se ve en la consulta
+            if entry.is_file() and entry.name not in referenced and not entry.name.startswith(".") \
+                    and entry.stat().st_mtime < recent:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    logger.warning("No se pudo borrar el archivo de reporte %s", entry.path)
+
+    def _enqueue(self, job_id: int):
+        with self._lock:
+            executor = self._executor
+        if executor is not None:
+            executor.submit(self.run, job_id)
+
+    def run(self, job_id: int):
+        """Ejecuta el trabajo si este proceso logra tomarlo (otro worker pudo haberlo tomado antes)."""
+        db = self._session_factory()
+        try:
+            claimed = db.execute(
+                update(models.ReportJob)
+                .where(models.ReportJob.id == job_id, models.ReportJob.status == PENDING)
+                .values(status=RUNNING, started_at=datetime.utcnow())
+            ).rowcount
+            db.commit()
+            if not claimed:
+                return
+            job = db.query(models.ReportJob).filter(models.ReportJob.id == job_id).one()
+            self._generate(db, job)
+            if time.monotonic() - self._last_prune > PRUNE_INTERVAL:
+                self.prune(db)
+        except Exception:
+            logger.exception("Error al ejecutar el trabajo de reporte %s", job_id)
+        finally:
+            db.close()
+
+    def _generate(self, db: Session, job: models.ReportJob):
+        spec = REPORTS[job.report]
+        params = json.loads(job.params)
+        started = time.perf_counter()
+        # Versión leída antes que los datos: el archivo nunca es más viejo que la versión que declara
+        job.data_version = _digest(spec.version(db, params))
+        name = f"{job.report}-{job.params_hash[:16]}-{job.data_version[:16]}.{spec.extension}"
+        os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+        temporary = os.path.join(ARTIFACTS_DIR, f".{name}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            spec.generate(db, params, temporary)
+            # El nombre queda registrado antes de que el archivo exista: un prune o
+            # recover() concurrente nunca lo ve como huérfano
+            job.artifact, job.size = name, os.path.getsize(temporary)
+            db.commit()
+            # Visible solo cuando está completo
+            os.replace(temporary, os.path.join(ARTIFACTS_DIR, name))
+        except Exception as exc:
+            db.rollback()
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            logger.exception("Falló el reporte %s (trabajo %s)", job.report, job.id)
+            job.status, job.error, job.finished_at = FAILED, str(exc)[:1000], datetime.utcnow()
+            job.artifact = job.size = None
+            db.commit()
+            return
+        job.status, job.finished_at = DONE, datetime.utcnow()
+        db.commit()
+        logger.info(
+            "Reporte %s generado (trabajo %s)", job.report, job.id,
+            extra={"job_id": job.id, "bytes": job.size, "duration_ms": round((time.perf_counter() - started) * 1000, 2)},
+        )
+
+
+job_runner = JobRunner(SessionLocal)
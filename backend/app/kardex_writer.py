@@ -0,0 +1,230 @@
+"""
+Escritura agrupada (group commit) de movimientos de kardex.
+
+Con KARDEX_WRITE_MODE distinto de "sync" el movimiento no se inserta en la
+transacción del endpoint: un hilo junta los de todas las peticiones
+concurrentes y los inserta con un INSERT de varias filas en una sola
+transacción, cada KARDEX_FLUSH_INTERVAL_MS o al llegar a KARDEX_FLUSH_SIZE.
+
+Modos:
+* sync (por defecto): el movimiento se inserta en la misma transacción que el
+                      cambio de stock.
+* ack_after_flush:    la petición espera a que su lote quede confirmado; el
+                      movimiento es durable cuando el endpoint responde.
+* async:              la petición responde sin esperar el lote; una caída del
+                      proceso puede perder el último intervalo (la conciliación
+                      lo detecta).
+
+Un lote que no se puede escribir no se descarta: el stock ya se confirmó, así que
+el hilo lo reintenta con espera creciente (hasta KARDEX_RETRY_MAX_SECONDS) y los
+siguientes esperan detrás, en orden. Solo al detener el proceso, pasado
+KARDEX_STOP_TIMEOUT, se abandona y sus filas quedan completas en el log de error
+para reproducirlas.
+
+La fecha del movimiento la asigna la base (server_default) al insertar, igual que
+en modo sync: no se usa el reloj del proceso.
+
+Orden y completitud: el movimiento se encola después del UPDATE del stock y
+antes del commit, mientras la fila del ítem sigue bloqueada, así que el orden de
+la cola es el orden de los cambios de stock. El hilo solo escribe un movimiento
+cuando su transacción terminó (y lo descarta si se revirtió), respetando el orden
+de la cola.
+
+Esa garantía vale dentro de un proceso: con varios workers cada uno tiene su
+cola y sus lotes, los ids del kardex dejan de seguir el orden de los cambios de
+un mismo ítem y la conciliación reportaría cortes falsos. Por eso los modos con
+cola se rechazan si WEB_CONCURRENCY (que gunicorn.conf.py exporta) es mayor que 1.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+MODES = ("sync", "ack_after_flush", "async")
+WRITE_MODE = os.getenv("KARDEX_WRITE_MODE", "sync")
+FLUSH_INTERVAL = float(os.getenv("KARDEX_FLUSH_INTERVAL_MS", "10")) / 1000
+FLUSH_SIZE = int(os.getenv("KARDEX_FLUSH_SIZE", "500"))
+ACK_TIMEOUT = float(os.getenv("KARDEX_ACK_TIMEOUT", "30"))
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+RETRY_BASE = 0.1
+RETRY_MAX = float(os.getenv("KARDEX_RETRY_MAX_SECONDS", "5"))
+STOP_TIMEOUT = float(os.getenv("KARDEX_STOP_TIMEOUT", "30"))
+
+# Sin id ni fecha: los asigna la base
+COLUMNS = [c.name for c in models.Kardex.__table__.columns if c.name not in ("id", "date")]
+
+
+class _Entry:
+    """Movimiento encolado; queda resuelto cuando la transacción del stock termina."""
+
+    __slots__ = ("row", "future", "committed", "resolved")
+
+    def __init__(self, row):
+        self.row = row
+        self.future = Future()
+        self.committed = False
+        self.resolved = threading.Event()
+
+    def resolve(self, committed: bool):
+        self.committed = committed
+        self.resolved.set()
+
+
+class KardexWriter:
+    def __init__(self, engine=None, mode: str = WRITE_MODE,
+                 interval: float = FLUSH_INTERVAL, max_batch: int = FLUSH_SIZE, workers: int = WORKERS):
+        if mode not in MODES:
+            raise ValueError(f"KARDEX_WRITE_MODE inválido: {mode} (opciones: {', '.join(MODES)})")
+        if mode != "sync" and workers > 1:
+            raise ValueError(
+                f"KARDEX_WRITE_MODE={mode} requiere un solo proceso (WEB_CONCURRENCY={workers}): "
+                "con varios workers el orden de los ids del kardex no sigue al de los cambios de stock"
+            )
+        self.engine = engine
+        self.mode = mode
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stop_deadline = None
+        self.flushes = 0
+        self.written = 0
+
+    @property
+    def buffered(self):
+        return self.mode != "sync" and self._thread is not None
+
+    def start(self):
+        if self.mode == "sync" or (self._thread is not None and self._thread.is_alive()):
+            return
+        if self.engine is None:
+            from app.database import engine
+            self.engine = engine
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="kardex-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo después de escribir todo lo encolado."""
+        if self._thread is None:
+            return
+        self._stop_deadline = time.monotonic() + STOP_TIMEOUT
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def commit(self, db: Session, **values):
+        """
+        Confirma la sesión (que ya modificó el stock) junto con el movimiento de kardex.
+        Los errores de versión (StaleDataError) se propagan antes de encolar nada.
+        """
+        if not self.buffered:
+            db.add(models.Kardex(**values))
+            db.commit()
+            return
+        self._commit_buffered(db, [values])
+
+    def commit_many(self, db: Session, rows):
+        """Como commit() para varios movimientos: en modo sync, un solo INSERT de varias filas."""
+        if not self.buffered:
+            if rows:
+                db.execute(models.Kardex.__table__.insert(), rows)
+            db.commit()
+            return
+        self._commit_buffered(db, rows)
+
+    def _commit_buffered(self, db: Session, rows):
+        # El UPDATE bloquea la fila del ítem hasta el commit: encolar en este punto
+        # fija el orden del movimiento respecto de los demás cambios del mismo ítem
+        db.flush()
+        entries = []
+        for values in rows:
+            entries.append(_Entry({column: values.get(column) for column in COLUMNS}))
+            self._queue.put(entries[-1])
+        try:
+            db.commit()
+        except BaseException:
+            for entry in entries:
+                entry.resolve(False)
+            raise
+        for entry in entries:
+            entry.resolve(True)
+        if self.mode == "ack_after_flush":
+            for entry in entries:
+                entry.future.result(timeout=ACK_TIMEOUT)
+
+    def _next(self, timeout):
+        """Siguiente movimiento confirmado en orden de cola, o None."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=max(remaining, 0.001))
+            except queue.Empty:
+                return None
+            # El commit de la petición está en curso: esperarlo sin adelantar a otros
+            if not entry.resolved.wait(ACK_TIMEOUT):
+                logger.error("Transacción de stock sin terminar tras %ss; se escribe su movimiento", ACK_TIMEOUT)
+                entry.committed = True
+            if entry.committed:
+                return entry
+            entry.future.set_result(None)
+            if remaining <= 0:
+                return None
+
+    def _run(self):
+        while True:
+            first = self._next(0.5)
+            if first is None:
+                if self._stop.is_set() and self._queue.empty():
+                    return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                entry = self._next(remaining)
+                if entry is None:
+                    break
+                batch.append(entry)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        rows = [entry.row for entry in batch]
+        attempt = 0
+        while True:
+            try:
+                # Una transacción y un INSERT de varias filas para todo el lote
+                with self.engine.begin() as conn:
+                    conn.execute(models.Kardex.__table__.insert(), rows)
+                break
+            except Exception as exc:
+                attempt += 1
+                if self._stop.is_set() and time.monotonic() >= self._stop_deadline:
+                    logger.error("No se pudieron escribir %d movimientos de kardex al detener: %s", len(rows), exc,
+                                 extra={"kardex_rows": rows})
+                    for entry in batch:
+                        entry.future.set_exception(exc)
+                    return
+                logger.warning("Error escribiendo %d movimientos de kardex (intento %d): %s",
+                               len(rows), attempt, exc)
+                time.sleep(min(RETRY_BASE * 2 ** (attempt - 1), RETRY_MAX))
+
+        self.flushes += 1
+        self.written += len(rows)
+        for entry in batch:
+            entry.future.set_result(None)
+
+
+kardex_writer = KardexWriter()
@@ -0,0 +1,174 @@
+"""
+Logging estructurado que no bloquea a las peticiones.
+
+Los hilos de las peticiones solo crean el registro y lo encolan (QueueHandler);
+un QueueListener en un hilo aparte lo formatea como una línea JSON y lo escribe
+en stdout. Cada registro lleva el contexto de la petición en curso (request_id,
+usuario, ruta) y los campos pasados en `extra`.
+
+Usar formato diferido para que los niveles desactivados no cuesten nada:
+    logger.debug("Material %s actualizado", material_id)
+
+Variables de entorno:
+    LOG_LEVEL     nivel general (INFO)
+    LOG_LEVELS    niveles por módulo, p. ej. "app.routers.materials=DEBUG,app.search=WARNING"
+    LOG_REQUESTS  1 = un registro por petición con estado y duración (1)
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "1") == "1"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+logger = logging.getLogger("app.requests")
+
+# Contexto de la petición: un diccionario mutable para que lo que fije una
+# dependencia en un hilo del threadpool (el usuario) se vea en toda la petición
+_context = ContextVar("log_context", default=None)
+
+# Atributos propios de LogRecord: lo demás son campos de `extra`
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+def request_context():
+    """Contexto de la petición en curso ({request_id, user, scope}) o None fuera de una petición."""
+    return _context.get()
+
+
+def set_user(username):
+    context = _context.get()
+    if context is not None:
+        context["user"] = username
+
+
+class ContextQueueHandler(QueueHandler):
+    """Encola el registro tal cual, con el contexto de la petición; el formato se arma en el listener."""
+
+    def prepare(self, record):
+        context = _context.get()
+        if context is not None:
+            record.request_id = context["request_id"]
+            record.user = context["user"]
+            # La ruta se conoce recién cuando el router eligió el endpoint
+            route = context["scope"].get("route")
+            record.route = getattr(route, "path", None) or context["scope"].get("path")
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _Logging:
+    def __init__(self):
+        self.handler = None
+        self.output = None
+        self.listener = None
+
+    def configure(self):
+        """Instala el QueueHandler en el logger raíz y arranca el listener (una sola vez por proceso)."""
+        if self.handler is not None:
+            return
+        # Datos que el JSON no usa y son lo más caro de armar cada registro
+        # (ver "Optimization" en la documentación de logging)
+        logging._srcfile = None
+        logging.logMultiprocessing = False
+        self.output = logging.StreamHandler(sys.stdout)
+        self.output.setFormatter(JsonFormatter())
+        self.handler = ContextQueueHandler(queue.SimpleQueue())
+        root = logging.getLogger()
+        root.addHandler(self.handler)
+        root.setLevel(LOG_LEVEL)
+        for item in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+            name, _, level = item.partition("=")
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+        self._start()
+        # Escribir lo que quede en la cola al salir
+        atexit.register(self.stop)
+        # Con gunicorn --preload el hilo del listener no sobrevive al fork: uno nuevo por worker
+        os.register_at_fork(after_in_child=self._restart)
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _start(self):
+        self.listener = QueueListener(self.handler.queue, self.output, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart(self):
+        self.handler.queue = queue.SimpleQueue()
+        self._start()
+
+
+logs = _Logging()
+
+
+class RequestLogMiddleware:
+    """
+    Middleware ASGI que abre el contexto de cada petición (request_id tomado de
+    X-Request-ID o generado), lo devuelve en la respuesta y al terminar registra
+    método, ruta, estado y duración.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        incoming = None
+        for name, value in scope.get("headers") or ():
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")[:64]
+                break
+        context = {"request_id": incoming or uuid.uuid4().hex, "user": None, "scope": scope}
+        token = _context.set(context)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-request-id", context["request_id"].encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if LOG_REQUESTS:
+                logger.info(
+                    "%s %s %s", scope["method"], scope.get("path"), status,
+                    extra={
+                        "method": scope["method"],
+                        "status": status,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    },
+                )
+            _context.reset(token)
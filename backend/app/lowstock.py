@@ -0,0 +1,144 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from app import models, shards
+from app.coordination import change_events, item_keys
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "low_stock"
+
+MODELS = {
+    "material": models.Material,
+    "product": models.Product,
+}
+
+
+def _is_low(stock, min_stock):
+    return stock is not None and min_stock is not None and stock < min_stock
+
+
+def _severity(alert):
+    # Proporción faltante respecto al mínimo; desempata por faltante absoluto
+    deficit = alert["min_stock"] - alert["stock"]
+    ratio = deficit / alert["min_stock"] if alert["min_stock"] > 0 else 1.0
+    return ratio, deficit
+
+
+class LowStockIndex:
+    """
+    Conjunto en memoria de materiales y productos con stock < min_stock.
+    Se carga una vez al iniciar y lo mantienen los endpoints que modifican stock,
+    de modo que consultar faltantes cuesta O(alertas) y no O(catálogo). Con varios
+    workers, cada cambio se publica para que los demás relean el ítem.
+    """
+
+    def __init__(self, max_events: int = 200):
+        self._alerts = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.events = deque(maxlen=max_events)
+
+    def load(self, db: Session):
+        self._load(db)
+        change_events.publish(CHANNEL, "*")
+
+    def _load(self, db: Session):
+        alerts = {}
+        for kind, model in MODELS.items():
+            rows = db.query(model.id, model.name, model.stock, model.min_stock).filter(
+                model.stock < model.min_stock
+            ).all()
+            for r in rows:
+                alerts[(kind, r.id)] = self._alert(kind, r.id, r.name, r.stock, r.min_stock)
+        with self._lock:
+            self._alerts = alerts
+        logger.info("Índice de stock bajo cargado: %d alertas", len(alerts))
+
+    def update(self, kind: str, item):
+        """Reevalúa un material o producto después de modificar su stock o mínimo."""
+        self._update(kind, item)
+        change_events.publish(CHANNEL, f"{kind}:{item.id}")
+
+    def _update(self, kind: str, item):
+        key = (kind, item.id)
+        low = _is_low(item.stock, item.min_stock)
+        with self._lock:
+            was_low = key in self._alerts
+            if low:
+                self._alerts[key] = self._alert(kind, item.id, item.name, item.stock, item.min_stock)
+            elif was_low:
+                del self._alerts[key]
+        if low != was_low:
+            self._emit("bajo_minimo" if low else "repuesto", kind, item)
+
+    def remove(self, kind: str, item_id: int):
+        with self._lock:
+            self._alerts.pop((kind, item_id), None)
+        change_events.publish(CHANNEL, f"{kind}:{item_id}")
+
+    def refresh(self, db: Session, keys):
+        """Relee de la base los ítems que cambiaron en otro worker (sin volver a publicarlos)."""
+        if "*" in keys:
+            self._load(db)
+            return
+        for kind, ids in item_keys(keys).items():
+            model = MODELS[kind]
+            items = shards.overlay(db, kind, db.query(model).filter(model.id.in_(ids)).all(), fresh=True)
+            for item in items:
+                self._update(kind, item)
+            with self._lock:
+                for item_id in ids - {item.id for item in items}:
+                    self._alerts.pop((kind, item_id), None)
+        db.rollback()
+
+    def subscribe(self, callback):
+        """Registra una función que recibe cada evento de cruce de umbral."""
+        self._listeners.append(callback)
+
+    def count(self, kind: str = None) -> int:
+        with self._lock:
+            if kind is None:
+                return len(self._alerts)
+            return sum(1 for k, _ in self._alerts if k == kind)
+
+    def page(self, kind: str = None, skip: int = 0, limit: int = 50):
+        with self._lock:
+            alerts = [a for (k, _), a in self._alerts.items() if kind is None or k == kind]
+        alerts.sort(key=_severity, reverse=True)
+        return len(alerts), alerts[skip:skip + limit]
+
+    @staticmethod
+    def _alert(kind, item_id, name, stock, min_stock):
+        return {
+            "kind": kind,
+            "id": item_id,
+            "name": name,
+            "stock": stock,
+            "min_stock": min_stock,
+        }
+
+    def _emit(self, event_type, kind, item):
+        event = {
+            "event": event_type,
+            "kind": kind,
+            "id": item.id,
+            "name": item.name,
+            "stock": item.stock,
+            "min_stock": item.min_stock,
+            "date": datetime.utcnow(),
+        }
+        self.events.append(event)
+        for callback in list(self._listeners):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Error en suscriptor de alertas de stock")
+
+
+low_stock = LowStockIndex()
+change_events.subscribe(CHANNEL, low_stock.refresh)
@@ -1,16 +1,42 @@
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
-from app.routers import auth, materials, products, purchases, suppliers, kardex
-from app.database import Base, engine
+from app.routers import auth, materials, products, purchases, suppliers, kardex, dashboard, alerts, reports, imports, search, production, jobs, profiles
+from app.database import Base, engine, sync_schema, SessionLocal
+from app.admission import AdmissionMiddleware
+from app.archive import sync_archive_tables
+from app.coordination import change_events
+from app.logs import REQUEST_ID_HEADER, RequestLogMiddleware, logs
+from app import profiling
+from app.jobs import job_runner
+from app.kardex_writer import kardex_writer
+from app.lowstock import low_stock
+from app.orders import backfill_lines
+from app.search import catalog_search
+from app.shards import Compactor, compact_pending
+from app.supplier_materials import backfill_supplier_materials
 from app import models   # para registrar los modelos
 
 
+# Logging JSON en un hilo aparte (ver app/logs.py)
+logs.configure()
+
 # Crear aplicación FastAPI
 app = FastAPI()
 
 # Crear tablas si no existen
 Base.metadata.create_all(bind=engine)
+sync_schema()
+
+# Perfilado de peticiones a pedido (dentro de la admisión: no cuenta la espera en cola)
+profiling.install(engine)
+app.add_middleware(profiling.ProfilerMiddleware)
+
+# Límites de concurrencia por clase de ruta (dentro de CORS, para que el
+# navegador pueda leer los 503/429)
+app.add_middleware(AdmissionMiddleware)
 
 # Configuración del middleware CORS
 origins = [
@@ -26,7 +52,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Missing-Ids", "Retry-After", REQUEST_ID_HEADER, "X-Profile-Id"],
 )
+# request_id, usuario, ruta y duración de cada petición en los registros
+app.add_middleware(RequestLogMiddleware)
 
 # Incluir routers
 app.include_router(auth.router)
@@ -35,6 +64,64 @@ app.include_router(products.router)
 app.include_router(purchases.router)
 app.include_router(suppliers.router)
 app.include_router(kardex.router)
+app.include_router(dashboard.router)
+app.include_router(alerts.router)
+app.include_router(reports.router)
+app.include_router(imports.router)
+app.include_router(search.router)
+app.include_router(production.router)
+app.include_router(jobs.router)
+app.include_router(profiles.router)
+
+
+stock_compactor = Compactor(SessionLocal)
+
+# gunicorn.conf.py corre el mantenimiento una vez en el proceso maestro y lo marca
+# con esta variable, que heredan los workers
+MAINTENANCE_DONE = "PYGLASS_MAINTENANCE_DONE"
+
+
+def run_maintenance():
+    """Tareas de arranque que alcanza con ejecutar una vez por despliegue."""
+    db = SessionLocal()
+    try:
+        backfill_lines(db)
+        backfill_supplier_materials(db)
+        sync_archive_tables(db)
+        compact_pending(db)
+    finally:
+        db.close()
+
+
+# Cargar los índices en memoria al iniciar (con los contadores fraccionados ya compactados)
+@app.on_event("startup")
+def load_low_stock_index():
+    if os.getenv(MAINTENANCE_DONE) != "1":
+        run_maintenance()
+    db = SessionLocal()
+    try:
+        # Los cambios de otros workers posteriores a este punto se aplican sobre la carga
+        change_events.prime(db)
+        low_stock.load(db)
+        catalog_search.load(db)
+        # Retomar los reportes que quedaron pendientes
+        job_runner.start()
+        job_runner.recover(db)
+    finally:
+        db.close()
+    stock_compactor.start()
+    kardex_writer.start()
+    change_events.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    # Escribir los movimientos de kardex que aún estén en el búfer antes de salir
+    kardex_writer.stop()
+    stock_compactor.stop()
+    change_events.stop()
+    job_runner.stop()
+
 
 # Ruta principal
 @app.get("/")
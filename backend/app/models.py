@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -26,12 +26,31 @@ class Supplier(Base):
     email = Column(String(100), nullable=True)
     address = Column(String(255), nullable=True)
 
+    # Material principal (compatibilidad); los materiales que provee están en supplier_materials
     material_id = Column(Integer, ForeignKey("materials.id"), nullable=True)  # nullable=True
-    material = relationship("Material", back_populates="suppliers")
+    material = relationship("Material")
 
+    material_links = relationship("SupplierMaterial", back_populates="supplier", cascade="all, delete-orphan")
     purchase_orders = relationship("PurchaseOrder", back_populates="supplier")
 
 
+class SupplierMaterial(Base):
+    """Material que ofrece un proveedor (un proveedor puede ofrecer varios y viceversa)."""
+    __tablename__ = "supplier_materials"
+
+    id = Column(Integer, primary_key=True, index=True)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
+
+    supplier = relationship("Supplier", back_populates="material_links")
+
+    # Un índice por sentido: materiales de un proveedor y proveedores de un material
+    __table_args__ = (
+        Index("ix_supplier_materials_supplier_material", "supplier_id", "material_id", unique=True),
+        Index("ix_supplier_materials_material_supplier", "material_id", "supplier_id"),
+    )
+
+
 # -------- MATERIALS --------
 class Material(Base):
     __tablename__ = "materials"
@@ -42,11 +61,19 @@ class Material(Base):
     color = Column(String(50), nullable=True)
     stock = Column(Integer, default=0, nullable=True)
     min_stock = Column(Integer, default=0, nullable=True)
+    # Control de concurrencia optimista: cada UPDATE verifica y aumenta la versión
+    version_id = Column(Integer, nullable=False, server_default="1")
+    # > 0: los movimientos van a N contadores parciales (ver app/shards.py)
+    stock_shards = Column(Integer, nullable=False, server_default="0")
+    # Costo promedio ponderado por unidad (ver app/costing.py); Float(53) es DOUBLE en MySQL
+    avg_cost = Column(Float(53), nullable=False, server_default="0")
 
-    suppliers = relationship("Supplier", back_populates="material", cascade="all, delete-orphan")
+    suppliers = relationship("Supplier", secondary="supplier_materials", viewonly=True, order_by="Supplier.id")
     purchase_orders = relationship("PurchaseOrder", back_populates="material")
     kardex_entries = relationship("Kardex", back_populates="material")
 
+    __mapper_args__ = {"version_id_col": version_id}
+
 
 # -------- PRODUCTS --------
 class Product(Base):
@@ -59,8 +86,66 @@ class Product(Base):
     stock = Column(Integer, default=0, nullable=True)
     min_stock = Column(Integer, default=0, nullable=True)
     sale_price = Column(Float, default=0.0, nullable=True)
+    version_id = Column(Integer, nullable=False, server_default="1")
+    stock_shards = Column(Integer, nullable=False, server_default="0")
+    # Costo promedio ponderado por unidad (producción: costo de los materiales consumidos)
+    avg_cost = Column(Float(53), nullable=False, server_default="0")
 
     kardex_entries = relationship("Kardex", back_populates="product")
+    # Lista de materiales: cuánto de cada material consume una unidad del producto
+    bom = relationship("BomLine", back_populates="product", cascade="all, delete-orphan",
+                       order_by="BomLine.id")
+
+    __mapper_args__ = {"version_id_col": version_id}
+
+
+class BomLine(Base):
+    __tablename__ = "bom_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+    product = relationship("Product", back_populates="bom")
+    material = relationship("Material")
+
+    __table_args__ = (
+        Index("ix_bom_lines_product_material", "product_id", "material_id", unique=True),
+    )
+
+
+# -------- PRODUCTION ORDERS --------
+class ProductionOrder(Base):
+    __tablename__ = "production_orders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(DateTime(timezone=True), server_default=func.now())
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    product = relationship("Product")
+    user = relationship("User")
+    # Consumo real de la orden (la lista de materiales puede cambiar después)
+    lines = relationship("ProductionOrderLine", back_populates="order", cascade="all, delete-orphan",
+                         order_by="ProductionOrderLine.id")
+
+    __table_args__ = (
+        Index("ix_production_orders_user_date", "user_id", "date"),
+    )
+
+
+class ProductionOrderLine(Base):
+    __tablename__ = "production_order_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("production_orders.id"), nullable=False, index=True)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+
+    order = relationship("ProductionOrder", back_populates="lines")
+    material = relationship("Material")
 
 
 # -------- PURCHASE ORDERS --------
@@ -70,7 +155,12 @@ class PurchaseOrder(Base):
     id = Column(Integer, primary_key=True, index=True)
     date = Column(DateTime(timezone=True), server_default=func.now())
     quantity = Column(Integer, nullable=True)
+    # Costo unitario de la compra en órdenes de un solo ítem (igual al de su ítem)
+    unit_cost = Column(Float(53), nullable=True)
     status = Column(String(20), default="pendiente")
+    # Momento de la recepción o de la cancelación (para el lead time del proveedor)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    cancelled_at = Column(DateTime(timezone=True), nullable=True)
 
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=True)
     supplier = relationship("Supplier", back_populates="purchase_orders")
@@ -81,6 +171,31 @@ class PurchaseOrder(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     user = relationship("User", back_populates="purchase_orders")
 
+    # Ítems de la orden; en órdenes de un solo ítem coinciden con material_id/quantity
+    lines = relationship("PurchaseOrderLine", back_populates="order",
+                         cascade="all, delete-orphan", order_by="PurchaseOrderLine.id")
+
+    # Órdenes pendientes del usuario (dashboard y listado)
+    __table_args__ = (
+        Index("ix_purchase_orders_user_status", "user_id", "status"),
+        # Recalcular los indicadores de un proveedor sin recorrer todas las órdenes
+        Index("ix_purchase_orders_supplier_status", "supplier_id", "status"),
+    )
+
+
+class PurchaseOrderLine(Base):
+    __tablename__ = "purchase_order_lines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=False, index=True)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    # Costo unitario pactado; sin costo, la recepción entra al costo promedio vigente
+    unit_cost = Column(Float(53), nullable=True)
+
+    order = relationship("PurchaseOrder", back_populates="lines")
+    material = relationship("Material")
+
 
 # -------- KARDEX --------
 class Kardex(Base):
@@ -93,6 +208,8 @@ class Kardex(Base):
     stock_anterior = Column(Integer, nullable=True)
     stock_nuevo = Column(Integer, nullable=True)
     observaciones = Column(String(255), nullable=True)
+    # Costo unitario del movimiento: entradas al costo de compra, salidas al promedio vigente
+    unit_cost = Column(Float(53), nullable=True)
 
     material_id = Column(Integer, ForeignKey("materials.id"), nullable=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
@@ -101,3 +218,117 @@ class Kardex(Base):
     material = relationship("Material", back_populates="kardex_entries")
     product = relationship("Product", back_populates="kardex_entries")
     user = relationship("User", back_populates="kardex_entries")
+
+    # Últimos movimientos del usuario: filtro por user_id y orden por fecha
+    __table_args__ = (
+        Index("ix_kardex_user_date", "user_id", "date"),
+    )
+
+
+# -------- ARCHIVO DEL KARDEX --------
+class KardexArchiveMonth(Base):
+    """Mes del kardex movido a su tabla de archivo (kardex_archive_YYYYMM)."""
+    __tablename__ = "kardex_archive_months"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, unique=True, nullable=False)
+    table_name = Column(String(40), nullable=False)
+    rows = Column(Integer, nullable=False, default=0)
+    min_kardex_id = Column(Integer, nullable=True)
+    max_kardex_id = Column(Integer, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class KardexCheckpoint(Base):
+    """Stock de un ítem al cierre del último movimiento archivado."""
+    __tablename__ = "kardex_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=True, unique=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, unique=True)
+    stock = Column(Integer, nullable=True)
+    last_kardex_id = Column(Integer, nullable=False)
+    archived_until = Column(Date, nullable=False)
+
+
+# -------- CONTADORES DE STOCK FRACCIONADOS --------
+class StockShard(Base):
+    """Delta pendiente de un material o producto en uno de sus N contadores parciales."""
+    __tablename__ = "stock_shards"
+
+    id = Column(Integer, primary_key=True, index=True)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
+    shard = Column(Integer, nullable=False)
+    delta = Column(Integer, nullable=False, default=0)
+    # Movimientos aún sin stock_anterior/stock_nuevo en el kardex
+    movements = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_stock_shards_material", "material_id", "shard", unique=True),
+        Index("ix_stock_shards_product", "product_id", "shard", unique=True),
+    )
+
+
+# -------- CONCILIACIÓN STOCK / KARDEX --------
+class ReconcileCursor(Base):
+    """Último movimiento verificado de cada material o producto."""
+    __tablename__ = "reconcile_cursors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    material_id = Column(Integer, ForeignKey("materials.id"), nullable=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
+    last_kardex_id = Column(Integer, nullable=False)
+    stock = Column(Integer, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ReconcileRun(Base):
+    __tablename__ = "reconcile_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    from_kardex_id = Column(Integer, nullable=False, default=0)
+    to_kardex_id = Column(Integer, nullable=False, default=0)
+    movements = Column(Integer, nullable=False, default=0)
+    items = Column(Integer, nullable=False, default=0)
+    issues = Column(Integer, nullable=False, default=0)
+
+
+# -------- COORDINACIÓN ENTRE WORKERS --------
+class ChangeEvent(Base):
+    """Cambio de estado en memoria publicado por un worker para que lo apliquen los demás."""
+    __tablename__ = "change_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String(30), nullable=False)
+    key = Column(String(100), nullable=False)
+    origin = Column(String(80), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+# -------- REPORTES EN SEGUNDO PLANO --------
+class ReportJob(Base):
+    """Reporte pedido para generarse en segundo plano; el resultado queda en un archivo."""
+    __tablename__ = "report_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report = Column(String(30), nullable=False)
+    params = Column(Text, nullable=False)
+    # Huella de (reporte, parámetros) y de los datos con que se generó: misma huella, mismo archivo
+    params_hash = Column(String(64), nullable=False)
+    data_version = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False, default="pendiente")
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    artifact = Column(String(255), nullable=True)
+    size = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_report_jobs_lookup", "report", "params_hash", "data_version"),
+        Index("ix_report_jobs_status", "status"),
+    )
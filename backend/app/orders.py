@@ -0,0 +1,35 @@
+from sqlalchemy import exists, insert, select
+from sqlalchemy.orm import Session, joinedload
+
+from app import models
+
+# Ítems de la orden con el nombre de su material, en la misma consulta que la orden
+LINES = joinedload(models.PurchaseOrder.lines).joinedload(models.PurchaseOrderLine.material)
+
+
+def backfill_lines(db: Session) -> int:
+    """
+    Crea el ítem de las órdenes anteriores a purchase_order_lines a partir de
+    material_id/quantity/unit_cost de la cabecera. Idempotente; devuelve cuántas creó.
+    """
+    orders = models.PurchaseOrder.__table__
+    lines = models.PurchaseOrderLine.__table__
+    result = db.execute(insert(lines).from_select(
+        ["order_id", "material_id", "quantity", "unit_cost"],
+        select(orders.c.id, orders.c.material_id, orders.c.quantity, orders.c.unit_cost).where(
+            orders.c.material_id.isnot(None),
+            orders.c.quantity.isnot(None),
+            ~exists().where(lines.c.order_id == orders.c.id),
+        ),
+    ))
+    db.commit()
+    return result.rowcount or 0
+
+
+def with_names(order, supplier_name, user):
+    """Agrega los nombres que muestra PurchaseOrderOut (proveedor, usuario y materiales)."""
+    order.supplier_name = supplier_name or f"Proveedor ID: {order.supplier_id}"
+    order.user_name = user.username
+    for line in order.lines:
+        line.material_name = line.material.name if line.material else None
+    return order
@@ -0,0 +1,296 @@
+"""
+Perfilado por muestreo de peticiones en producción, solo para administradores.
+
+Una petición se perfila si un administrador (ADMIN_USERS) la marca con el header
+X-Profile: 1, o si le toca el muestreo de 1 cada PROFILE_SAMPLE_EVERY peticiones
+de la misma ruta. Mientras haya peticiones perfiladas en curso, un hilo toma cada
+PROFILE_INTERVAL_MS la pila de todos los hilos (sys._current_frames) y suma las
+que pertenecen a cada perfil; además se mide el tiempo de cada sentencia SQL con
+los eventos del engine.
+
+Los endpoints síncronos corren en el threadpool de anyio con una copia del
+contexto de la petición: el hilo de muestreo busca ese contexto en el fondo de la
+pila de cada hilo para saber a qué petición pertenece. El trabajo en el event loop
+(endpoints async, middlewares) no se atribuye.
+
+Se guardan los últimos PROFILE_KEEP perfiles por proceso (con gunicorn, por
+worker) y se sirven en /profiles: resumen JSON con las funciones y consultas más
+costosas, y las pilas en formato "collapsed" (flamegraph.pl, speedscope).
+
+Sin perfiles activos el costo es revisar un header y un contador por petición y
+leer un ContextVar por sentencia SQL; el hilo de muestreo no corre.
+"""
+import contextvars
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app.logs import request_context
+from app.routers.auth import is_admin, token_subject
+
+SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+PROFILE_HEADER = b"x-profile"
+MAX_SQL = 500
+# Frames del fondo de la pila donde se busca el contexto del hilo del threadpool
+CONTEXT_DEPTH = 8
+
+_current = ContextVar("profile", default=None)
+# Segmentos numéricos de la ruta: /materials/12 y /materials/13 cuentan como la misma
+_NUMBERS = re.compile(r"/\d+(?=/|$)")
+# Rutas que se recortan en los nombres de función: dependencias, biblioteca estándar y el backend
+_PREFIXES = sorted(
+    {os.path.join(path, "") for path in sys.path if path} | {os.path.dirname(os.path.dirname(__file__)) + os.sep},
+    key=len, reverse=True,
+)
+
+
+class Profile:
+    """Muestras y consultas de una petición."""
+
+    def __init__(self, profile_id, method, path, reason):
+        context = request_context()
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.route = None
+        self.reason = reason
+        self.request_id = context["request_id"] if context else None
+        self.user = None
+        self.status = None
+        self.started_at = datetime.utcnow()
+        self.duration_ms = None
+        self.samples = Counter()
+        self.sample_count = 0
+        self.sql = []
+        self.sql_count = 0
+        self.sql_ms = 0.0
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "reason": self.reason,
+            "request_id": self.request_id,
+            "user": self.user,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "samples": self.sample_count,
+            "sql_count": self.sql_count,
+            "sql_ms": round(self.sql_ms, 2),
+        }
+
+    def details(self, top: int = 30):
+        """Resumen más las funciones con más tiempo propio y acumulado y las consultas más lentas."""
+        own, total = Counter(), Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        sql = {}
+        for statement, ms in self.sql:
+            entry = sql.setdefault(statement, {"statement": statement, "count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += ms
+        scale = 100 / self.sample_count if self.sample_count else 0
+        return {
+            **self.summary(),
+            "interval_ms": INTERVAL * 1000,
+            "self": [{"function": f, "samples": n, "percent": round(n * scale, 1)} for f, n in own.most_common(top)],
+            "cumulative": [{"function": f, "samples": n, "percent": round(n * scale, 1)} for f, n in total.most_common(top)],
+            "slowest_sql": [
+                {**entry, "total_ms": round(entry["total_ms"], 2)}
+                for entry in sorted(sql.values(), key=lambda e: e["total_ms"], reverse=True)[:top]
+            ],
+        }
+
+    def collapsed(self) -> str:
+        """Una línea "raíz;...;hoja muestras" por pila distinta."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+
+class Profiler:
+    """Perfiles activos, hilo de muestreo y los últimos KEEP perfiles terminados."""
+
+    def __init__(self, interval: float = INTERVAL, keep: int = KEEP, sample_every: int = SAMPLE_EVERY):
+        self.interval = interval
+        self.sample_every = sample_every
+        self.profiles = deque(maxlen=keep)
+        self._active = set()
+        self._counters = Counter()
+        self._ids = itertools.count(1)
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def should_sample(self, method, path) -> bool:
+        if not self.sample_every:
+            return False
+        key = (method, _NUMBERS.sub("/{id}", path))
+        with self._lock:
+            self._counters[key] += 1
+            return self._counters[key] % self.sample_every == 0
+
+    def begin(self, method, path, reason) -> Profile:
+        profile = Profile(next(self._ids), method, path, reason)
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def end(self, profile: Profile):
+        with self._lock:
+            self._active.discard(profile)
+        self.profiles.append(profile)
+
+    def get(self, profile_id):
+        for profile in list(self.profiles):
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = set(self._active)
+            taken = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = self._stack(frame)
+                profile = self._owner(stack, active)
+                if profile is not None:
+                    taken.append((profile, tuple(self._label(f.f_code) for f in reversed(stack))))
+            # Un perfil terminado (end() lo saca de _active bajo el mismo lock) ya no se
+            # modifica: details() y collapsed() lo recorren sin carreras
+            with self._lock:
+                for profile, key in taken:
+                    if profile in self._active:
+                        profile.samples[key] += 1
+                        profile.sample_count += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _stack(frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        return stack
+
+    @staticmethod
+    def _owner(stack, active):
+        # El hilo del threadpool ejecuta context.run(func): el contexto está en los frames del fondo
+        for frame in stack[-CONTEXT_DEPTH:]:
+            for value in frame.f_locals.values():
+                if isinstance(value, contextvars.Context):
+                    profile = value.get(_current)
+                    return profile if profile in active else None
+        return None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for prefix in _PREFIXES:
+                if filename.startswith(prefix):
+                    filename = filename[len(prefix):]
+                    break
+            label = self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        return label
+
+
+profiler = Profiler()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, "_profile_started", None)
+    if profile is not None and started is not None:
+        ms = (time.perf_counter() - started) * 1000
+        profile.sql_count += 1
+        profile.sql_ms += ms
+        if len(profile.sql) < MAX_SQL:
+            profile.sql.append((" ".join(statement.split())[:300], ms))
+
+
+def install(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _token_user(scope):
+    for name, value in scope.get("headers") or ():
+        if name == b"authorization":
+            return token_subject(value)
+    return None
+
+
+class ProfilerMiddleware:
+    """Middleware ASGI que decide si perfilar la petición y guarda el perfil al terminar."""
+
+    def __init__(self, app, profiler: Profiler = profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        reason = None
+        for name, value in scope.get("headers") or ():
+            if name == PROFILE_HEADER:
+                # El header solo cuenta si lo manda un administrador
+                if value not in (b"", b"0") and is_admin(_token_user(scope)):
+                    reason = "header"
+                break
+        if reason is None and self.profiler.should_sample(method, path):
+            reason = "sample"
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.begin(method, path, reason)
+        token = _current.set(profile)
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (b"x-profile-id", str(profile.id).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            profile.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            route = scope.get("route")
+            profile.route = getattr(route, "path", None)
+            context = request_context()
+            profile.user = context["user"] if context else None
+            self.profiler.end(profile)
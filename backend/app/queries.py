@@ -0,0 +1,88 @@
+"""
+Sentencias precompiladas para las consultas más frecuentes.
+
+`db.query(Model).filter(Model.id == x)` arma una expresión nueva en cada llamada
+y SQLAlchemy tiene que recorrerla para calcular la clave de su caché de
+compilación. Estas sentencias se construyen una sola vez con `select()` y
+parámetros `bindparam`, así que la clave se calcula una vez y cada ejecución solo
+liga los valores (ver benchmarks/statements.py para la diferencia medida).
+
+Las variantes con filtros opcionales (listado del kardex) se construyen la primera
+vez que se usa cada combinación de filtros y quedan guardadas.
+"""
+import threading
+from datetime import timedelta
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+USER_BY_USERNAME = select(models.User).where(models.User.username == bindparam("username")).limit(1)
+
+BY_ID = {
+    model: select(model).where(model.id == bindparam("id"))
+    for model in (models.Material, models.Product, models.Supplier)
+}
+
+
+def user_by_username(db: Session, username: str):
+    return db.execute(USER_BY_USERNAME, {"username": username}).scalars().first()
+
+
+def get_by_id(db: Session, model, item_id: int):
+    """Material, producto o proveedor por id, o None."""
+    return db.execute(BY_ID[model], {"id": item_id}).scalars().first()
+
+
+_kardex_listings = {}
+_kardex_lock = threading.Lock()
+
+
+def _kardex_listing(with_names: bool, material: bool, product: bool, start: bool, end: bool):
+    key = (with_names, material, product, start, end)
+    statement = _kardex_listings.get(key)
+    if statement is not None:
+        return statement
+    kardex = models.Kardex
+    if with_names:
+        statement = select(kardex, models.Material.name, models.Product.name).outerjoin(
+            models.Material, models.Material.id == kardex.material_id
+        ).outerjoin(
+            models.Product, models.Product.id == kardex.product_id
+        )
+    else:
+        statement = select(kardex)
+    statement = statement.where(kardex.user_id == bindparam("user_id"))
+    if material:
+        statement = statement.where(kardex.material_id == bindparam("material_id"))
+    if product:
+        statement = statement.where(kardex.product_id == bindparam("product_id"))
+    if start:
+        statement = statement.where(kardex.date >= bindparam("start"))
+    if end:
+        statement = statement.where(kardex.date < bindparam("end"))
+    statement = statement.order_by(kardex.date.desc()).limit(bindparam("limit"))
+    with _kardex_lock:
+        return _kardex_listings.setdefault(key, statement)
+
+
+def kardex_listing(db: Session, user_id: int, limit: int, material_id=None, product_id=None,
+                   start=None, end=None, with_names: bool = False):
+    """
+    Movimientos de la tabla caliente del usuario, más recientes primero (start/end
+    inclusive). Con with_names devuelve filas (Kardex, nombre del material, nombre
+    del producto); si no, objetos Kardex.
+    """
+    statement = _kardex_listing(with_names, bool(material_id), bool(product_id), start is not None, end is not None)
+    params = {"user_id": user_id, "limit": limit}
+    if material_id:
+        params["material_id"] = material_id
+    if product_id:
+        params["product_id"] = product_id
+    if start is not None:
+        params["start"] = start
+    if end is not None:
+        params["end"] = end + timedelta(days=1)
+    result = db.execute(statement, params)
+    return result.all() if with_names else result.scalars().all()
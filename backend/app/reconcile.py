@@ -0,0 +1,254 @@
+"""
+Conciliación entre el stock actual y la cadena stock_anterior -> stock_nuevo del kardex.
+
+El stock se actualiza en un commit y el kardex en otro, así que ambos pueden
+divergir si una petición muere entre los dos. Este proceso recorre el kardex por
+bloques (por id), reproduce la cadena de cada ítem y reporta:
+
+* gap:            stock_anterior no coincide con el stock_nuevo del movimiento previo
+* arithmetic:     stock_nuevo - stock_anterior no corresponde a la cantidad y tipo
+* stock_mismatch: el último stock_nuevo no coincide con Material.stock / Product.stock
+
+Las corridas son incrementales: continúan desde el último id verificado menos
+LOOKBACK_IDS, porque con escritores concurrentes un id menor puede confirmarse
+después de que la corrida anterior leyó uno mayor. En esa ventana se omiten los
+movimientos que ya verificó cada ítem (su cursor), así que uno confirmado tarde
+se verifica en la corrida siguiente en lugar de aparecer como gap. Los
+movimientos archivados (app/archive.py) se reemplazan por el checkpoint de stock
+de cada ítem.
+
+Uso: python -m app.reconcile [--full] [--workers N] [--chunk-size N]
+"""
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.shards import first_pending_kardex_id
+
+CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "50000"))
+WORKERS = int(os.getenv("RECONCILE_WORKERS", str(os.cpu_count() or 1)))
+# Por debajo de este número de movimientos por bloque no vale la pena usar procesos
+PARALLEL_THRESHOLD = 20000
+# Ids por debajo del final de la corrida anterior que se vuelven a leer
+LOOKBACK_IDS = int(os.getenv("RECONCILE_LOOKBACK_IDS", "1000"))
+MAX_REPORTED_ISSUES = 1000
+
+SIGNS = {"entrada": 1, "salida": -1}
+
+
+def check_chains(segments):
+    """
+    Verifica las cadenas de un grupo de ítems. Se ejecuta en los procesos del pool,
+    por eso solo recibe y devuelve tipos simples.
+    segments: [(item, stock_previo, [(id, tipo, cantidad, anterior, nuevo), ...]), ...]
+    """
+    results = []
+    for item, previous, rows in segments:
+        issues = []
+        for kardex_id, movement_type, quantity, before, after in rows:
+            if previous is not None and before != previous:
+                issues.append({
+                    "type": "gap",
+                    "kardex_id": kardex_id,
+                    "expected": previous,
+                    "found": before,
+                })
+            sign = SIGNS.get(movement_type)
+            if sign is not None and before is not None and after is not None and quantity is not None \
+                    and after - before != sign * quantity:
+                issues.append({
+                    "type": "arithmetic",
+                    "kardex_id": kardex_id,
+                    "expected": before + sign * quantity,
+                    "found": after,
+                })
+            previous = after
+        results.append((item, rows[-1][0], previous, issues))
+    return results
+
+
+def _item_key(material_id, product_id):
+    if material_id is not None:
+        return ("material", material_id)
+    if product_id is not None:
+        return ("product", product_id)
+    return None
+
+
+def _split(segments, parts):
+    size = max(1, -(-len(segments) // parts))
+    return [segments[i:i + size] for i in range(0, len(segments), size)]
+
+
+def reconcile(db: Session, full: bool = False, workers: int = WORKERS, chunk_size: int = CHUNK_SIZE):
+    started_at = datetime.utcnow()
+
+    # Punto de partida: última corrida y último stock verificado por ítem
+    from_id = 0
+    cursors = {}
+    if not full:
+        last_run = db.query(models.ReconcileRun).order_by(models.ReconcileRun.id.desc()).first()
+        from_id = last_run.to_kardex_id if last_run else 0
+        for cursor in db.query(models.ReconcileCursor).all():
+            cursors[_item_key(cursor.material_id, cursor.product_id)] = cursor
+    else:
+        db.query(models.ReconcileCursor).delete()
+    state = {key: c.stock for key, c in cursors.items()}
+    known_ids = {key: c.last_kardex_id for key, c in cursors.items()}
+    last_ids = {}
+
+    # Movimientos archivados: el checkpoint reemplaza la parte de la cadena que ya no está en kardex
+    for checkpoint in db.query(models.KardexCheckpoint).all():
+        key = _item_key(checkpoint.material_id, checkpoint.product_id)
+        if key not in known_ids or known_ids[key] < checkpoint.last_kardex_id:
+            state[key] = checkpoint.stock
+            known_ids[key] = checkpoint.last_kardex_id
+
+    # Los movimientos de contadores fraccionados aún sin compactar no tienen
+    # stock_anterior/stock_nuevo: se verifica solo hasta el primero de ellos
+    boundary = first_pending_kardex_id(db)
+
+    issues = []
+    issue_count = 0
+    movements = 0
+    last_id = max(from_id - LOOKBACK_IDS, 0)
+    executor = None
+    try:
+        while True:
+            query = db.query(
+                models.Kardex.id, models.Kardex.material_id, models.Kardex.product_id,
+                models.Kardex.movement_type, models.Kardex.quantity,
+                models.Kardex.stock_anterior, models.Kardex.stock_nuevo,
+            ).filter(models.Kardex.id > last_id)
+            if boundary is not None:
+                query = query.filter(models.Kardex.id < boundary)
+            rows = query.order_by(models.Kardex.id).limit(chunk_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            # Agrupar el bloque por ítem conservando el orden por id
+            grouped = {}
+            for r in rows:
+                key = _item_key(r.material_id, r.product_id)
+                if r.id <= known_ids.get(key, 0):
+                    # Ya verificado en una corrida anterior (o archivado)
+                    continue
+                movements += 1
+                if key is not None:
+                    grouped.setdefault(key, []).append(
+                        (r.id, r.movement_type, r.quantity, r.stock_anterior, r.stock_nuevo)
+                    )
+            segments = [(key, state.get(key), item_rows) for key, item_rows in grouped.items()]
+
+            if workers > 1 and len(rows) >= PARALLEL_THRESHOLD and len(segments) > 1:
+                if executor is None:
+                    executor = ProcessPoolExecutor(
+                        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                results = [r for part in executor.map(check_chains, _split(segments, workers)) for r in part]
+            else:
+                results = check_chains(segments)
+
+            for key, item_last_id, stock, item_issues in results:
+                state[key] = stock
+                last_ids[key] = item_last_id
+                for issue in item_issues:
+                    issue_count += 1
+                    if len(issues) < MAX_REPORTED_ISSUES:
+                        issues.append({"kind": key[0], "item_id": key[1], **issue})
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Ítems con movimientos posteriores al límite: su stock actual ya los incluye
+    unverified = set()
+    if boundary is not None:
+        for material_id, product_id in db.query(
+            models.Kardex.material_id, models.Kardex.product_id
+        ).filter(models.Kardex.id >= boundary).distinct():
+            unverified.add(_item_key(material_id, product_id))
+
+    # Comparar el último stock de cada cadena con el stock actual
+    for kind, model in (("material", models.Material), ("product", models.Product)):
+        for item_id, stock in db.query(model.id, model.stock).all():
+            expected = state.get((kind, item_id))
+            if (kind, item_id) in state and (kind, item_id) not in unverified and expected != stock:
+                issue_count += 1
+                if len(issues) < MAX_REPORTED_ISSUES:
+                    issues.append({
+                        "kind": kind,
+                        "item_id": item_id,
+                        "type": "stock_mismatch",
+                        "kardex_id": last_ids.get((kind, item_id)) or known_ids[(kind, item_id)],
+                        "expected": expected,
+                        "found": stock,
+                    })
+
+    # Guardar el avance para la próxima corrida incremental
+    for key, item_last_id in last_ids.items():
+        cursor = cursors.get(key)
+        if cursor is None:
+            cursor = models.ReconcileCursor(
+                material_id=key[1] if key[0] == "material" else None,
+                product_id=key[1] if key[0] == "product" else None,
+            )
+            db.add(cursor)
+        cursor.last_kardex_id = item_last_id
+        cursor.stock = state[key]
+
+    run = models.ReconcileRun(
+        started_at=started_at,
+        finished_at=datetime.utcnow(),
+        from_kardex_id=from_id,
+        to_kardex_id=max(last_id, from_id),
+        movements=movements,
+        items=len(state),
+        issues=issue_count,
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+
+    return {
+        "run_id": run.id,
+        "from_kardex_id": from_id,
+        "to_kardex_id": max(last_id, from_id),
+        "movements": movements,
+        "items": len(state),
+        "issue_count": issue_count,
+        "issues": issues,
+    }
+
+
+def main():
+    from app.database import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Concilia el stock con la cadena del kardex")
+    parser.add_argument("--full", action="store_true", help="Verificar todo el historial desde cero")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        result = reconcile(db, full=args.full, workers=args.workers, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+
+    print(f"Movimientos verificados: {result['movements']} (ids {result['from_kardex_id']}-{result['to_kardex_id']})")
+    print(f"Ítems: {result['items']}  Problemas: {result['issue_count']}")
+    for issue in result["issues"]:
+        print(f"  [{issue['type']}] {issue['kind']} {issue['item_id']} kardex #{issue['kardex_id']}: "
+              f"esperado {issue['expected']}, encontrado {issue['found']}")
+    return 1 if result["issue_count"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,212 @@
+import threading
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app import models
+from app.cache import TTLCache
+
+# Cortes de participación acumulada para la clasificación ABC
+ABC_THRESHOLDS = (0.80, 0.95)
+MAX_REPORT_MONTHS = 120
+
+ITEMS = {
+    "product": (models.Product, models.Kardex.product_id),
+    "material": (models.Material, models.Kardex.material_id),
+}
+
+
+def parse_month(value: str) -> date:
+    """Convierte 'YYYY-MM' al primer día del mes."""
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def parse_period(start: str = None, end: str = None, max_months: int = None):
+    """
+    Período de meses [inicio, fin] a partir de 'YYYY-MM' (por defecto, los últimos
+    doce meses hasta el actual). Lanza ValueError con el mensaje para el usuario.
+    """
+    today = date.today()
+    try:
+        end_month = parse_month(end) if end else today.replace(day=1)
+        start_month = parse_month(start) if start else date(end_month.year - 1, end_month.month, 1)
+    except ValueError:
+        raise ValueError("Formato de mes inválido, use YYYY-MM")
+    months = (end_month.year - start_month.year) * 12 + end_month.month - start_month.month + 1
+    if months < 1:
+        raise ValueError("El inicio debe ser anterior al fin")
+    if max_months is not None and months > max_months:
+        raise ValueError(f"El período no puede superar {max_months} meses")
+    return start_month, end_month
+
+
+def month_range(start: date, end: date):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield date(year, month, 1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + 1, 1, 1) if month.month == 12 else date(month.year, month.month + 1, 1)
+
+
+class MonthlyAggregates:
+    """
+    Agregados de kardex por ítem y mes (salidas, suma de stock resultante y
+    cantidad de movimientos) guardados como arreglos NumPy.
+    Los meses cerrados no cambian (el kardex solo crece), así que se calculan
+    una vez; el mes en curso se recalcula cuando cambia el último id del kardex.
+    """
+
+    def __init__(self):
+        self._months = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, kind: str, month: date, kardex_version: int, archived=frozenset()):
+        key = (kind, month)
+        current_month = date.today().replace(day=1)
+        with self._lock:
+            cached = self._months.get(key)
+        if cached is not None and (month < current_month or cached[0] == kardex_version):
+            return cached[1]
+
+        # Los meses archivados se leen de su tabla de archivo
+        if month in archived:
+            from app.archive import archive_table
+            table = archive_table(month)
+        else:
+            table = models.Kardex.__table__
+        item_column = table.c[ITEMS[kind][1].name]
+        rows = db.query(
+            item_column,
+            func.sum(case((table.c.movement_type == "salida", table.c.quantity), else_=0)),
+            func.sum(table.c.stock_nuevo),
+            func.count(table.c.id),
+        ).filter(
+            item_column.isnot(None),
+            table.c.date >= month,
+            table.c.date < next_month(month),
+        ).group_by(item_column).order_by(item_column).all()
+
+        if rows:
+            ids, out_qty, stock_sum, movements = zip(*rows)
+            data = (
+                np.asarray(ids, dtype=np.int64),
+                np.asarray([q or 0 for q in out_qty], dtype=np.float64),
+                np.asarray([s or 0 for s in stock_sum], dtype=np.float64),
+                np.asarray(movements, dtype=np.float64),
+            )
+        else:
+            data = (np.empty(0, dtype=np.int64),) + tuple(np.empty(0) for _ in range(3))
+
+        with self._lock:
+            self._months[key] = (kardex_version, data)
+        return data
+
+
+monthly = MonthlyAggregates()
+report_cache = TTLCache(ttl=3600, maxsize=256)
+
+
+def data_version(db: Session, kind: str):
+    """Último id de kardex más una firma del catálogo (precios y stock) del tipo pedido."""
+    model, _ = ITEMS[kind]
+    signature = func.sum(model.stock)
+    if kind == "product":
+        signature = signature + func.coalesce(func.sum(model.sale_price), 0)
+    kardex_version, catalog_signature, items = db.query(
+        db.query(func.max(models.Kardex.id)).scalar_subquery(),
+        db.query(signature).scalar_subquery(),
+        db.query(func.count(model.id)).scalar_subquery(),
+    ).one()
+    return kardex_version or 0, (catalog_signature, items)
+
+
+def abc_report(db: Session, kind: str, start: date, end: date):
+    """
+    Clasificación ABC y rotación para productos o materiales en el período [start, end] (meses).
+    Productos: valor = salidas * sale_price. Materiales: valor = unidades de salida.
+    Rotación = salidas / stock promedio (promedio del stock resultante de cada movimiento
+    del período, o stock actual si el ítem no tuvo movimientos).
+    """
+    kardex_version, catalog_version = data_version(db, kind)
+    cache_key = (kind, start, end, kardex_version, catalog_version)
+    cached = report_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    model, _ = ITEMS[kind]
+    columns = [model.id, model.name, model.stock]
+    if kind == "product":
+        columns.append(model.sale_price)
+    catalog = db.query(*columns).order_by(model.id).all()
+
+    result = {
+        "kind": kind,
+        "start": start.strftime("%Y-%m"),
+        "end": end.strftime("%Y-%m"),
+        "generated_at": datetime.utcnow(),
+        "total_value": 0.0,
+        "items": [],
+    }
+    if not catalog:
+        report_cache.set(cache_key, result)
+        return result
+
+    columns = list(zip(*catalog))
+    ids = np.asarray(columns[0], dtype=np.int64)
+    names = columns[1]
+    stock = np.asarray([s or 0 for s in columns[2]], dtype=np.float64)
+    price = np.asarray([p or 0 for p in columns[3]], dtype=np.float64) if kind == "product" else np.ones(len(ids))
+
+    # Sumar los agregados mensuales del período alineados con el catálogo
+    out_qty = np.zeros(len(ids))
+    stock_sum = np.zeros(len(ids))
+    movements = np.zeros(len(ids))
+    from app.archive import archived_months
+    archived = archived_months(db)
+    for month in month_range(start, end):
+        m_ids, m_out, m_stock, m_moves = monthly.get(db, kind, month, kardex_version, archived)
+        pos = np.searchsorted(ids, m_ids)
+        found = (pos < len(ids)) & (ids[np.minimum(pos, len(ids) - 1)] == m_ids)
+        out_qty[pos[found]] += m_out[found]
+        stock_sum[pos[found]] += m_stock[found]
+        movements[pos[found]] += m_moves[found]
+
+    value = out_qty * price
+    avg_stock = np.where(movements > 0, stock_sum / np.maximum(movements, 1), stock)
+    turnover = np.divide(out_qty, avg_stock, out=np.zeros(len(ids)), where=avg_stock > 0)
+
+    # Ranking por valor y participación acumulada
+    order = np.argsort(-value, kind="stable")
+    total = value.sum()
+    cumulative = np.cumsum(value[order]) / total if total > 0 else np.ones(len(ids))
+    classes = np.where(cumulative <= ABC_THRESHOLDS[0], "A", np.where(cumulative <= ABC_THRESHOLDS[1], "B", "C"))
+    # El ítem que cruza el 80 % sigue siendo A
+    if total > 0:
+        first_b = np.searchsorted(cumulative, ABC_THRESHOLDS[0], side="left")
+        if first_b < len(classes) and value[order][first_b] > 0:
+            classes[first_b] = "A"
+    classes[value[order] == 0] = "C"
+
+    result["total_value"] = round(float(total), 2)
+    result["items"] = [
+        {
+            "rank": rank + 1,
+            "id": int(ids[i]),
+            "name": names[i],
+            "quantity_out": int(out_qty[i]),
+            "value": round(float(value[i]), 2),
+            "share": round(float(value[i] / total), 6) if total > 0 else 0.0,
+            "cumulative_share": round(float(cumulative[rank]), 6),
+            "abc_class": str(classes[rank]),
+            "average_stock": round(float(avg_stock[i]), 2),
+            "turnover": round(float(turnover[i]), 4),
+        }
+        for rank, i in enumerate(order)
+    ]
+    report_cache.set(cache_key, result)
+    return result
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List
+
+from app import models, schemas
+from app.lowstock import low_stock
+from app.routers.auth import get_current_user
+
+router = APIRouter(
+    prefix="/inventory/alerts",
+    tags=["alerts"]
+)
+
+
+def _page(kind, skip, limit):
+    total, items = low_stock.page(kind=kind, skip=skip, limit=limit)
+    return {"total": total, "skip": skip, "limit": limit, "items": items}
+
+
+# 🔹 Materiales y productos bajo el mínimo, ordenados por severidad
+@router.get("/", response_model=schemas.LowStockPage)
+def get_alerts(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: models.User = Depends(get_current_user)
+):
+    return _page(None, skip, limit)
+
+
+@router.get("/materials/", response_model=schemas.LowStockPage)
+def get_material_alerts(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: models.User = Depends(get_current_user)
+):
+    return _page("material", skip, limit)
+
+
+@router.get("/products/", response_model=schemas.LowStockPage)
+def get_product_alerts(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: models.User = Depends(get_current_user)
+):
+    return _page("product", skip, limit)
+
+
+# 🔹 Últimos cruces de umbral (entrada o salida del conjunto de alertas)
+@router.get("/events", response_model=List[schemas.LowStockEvent])
+def get_alert_events(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: models.User = Depends(get_current_user)
+):
+    return list(reversed(low_stock.events))[:limit]
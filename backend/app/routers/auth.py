@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException
+import os
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
@@ -7,6 +8,8 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
 from app import models, schemas
 from app.database import get_db
+from app.logs import set_user
+from app.queries import user_by_username
 
 router = APIRouter(
     prefix="/auth",
@@ -21,6 +24,9 @@ SECRET_KEY = "super_secret_key_change_this"  # ⚠️ cambia esto en producción
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Usuarios con acceso a las operaciones de administración (perfiles, conciliación, archivo)
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
@@ -30,6 +36,23 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def is_admin(username) -> bool:
+    return username is not None and username in ADMIN_USERS
+
+def token_subject(authorization):
+    """Usuario (sub) de un header Authorization "Bearer <JWT>" válido, o None."""
+    if not authorization:
+        return None
+    if isinstance(authorization, bytes):
+        authorization = authorization.decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
@@ -41,7 +64,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 @router.post("/register", response_model=schemas.UserOut)
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+    db_user = user_by_username(db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="El usuario ya existe")
 
@@ -55,7 +78,7 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 @router.post("/login")
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == form_data.username).first()
+    db_user = user_by_username(db, form_data.username)
     if not db_user or not verify_password(form_data.password, db_user.password_hash):
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
@@ -81,7 +104,16 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.username == username).first()
+    # Sentencia precompilada: esta consulta corre en cada petición autenticada
+    user = user_by_username(db, username)
     if user is None:
         raise credentials_exception
+    set_user(user.username)
     return user
+
+
+# Dependencia para las rutas de administración
+def get_admin_user(current_user: models.User = Depends(get_current_user)):
+    if not is_admin(current_user.username):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo para administradores")
+    return current_user
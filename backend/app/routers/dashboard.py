@@ -0,0 +1,113 @@
+import os
+from fastapi import APIRouter, Depends
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.cache import TTLCache
+from app.database import get_db
+from app.lowstock import low_stock
+from app.routers.auth import get_current_user
+
+router = APIRouter(
+    prefix="/dashboard",
+    tags=["dashboard"]
+)
+
+# Segundos que se reutiliza el resumen de cada usuario
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+DASHBOARD_LIST_LIMIT = 10
+
+dashboard_cache = TTLCache(ttl=DASHBOARD_CACHE_TTL)
+
+
+def _count(db: Session, model, *criteria):
+    return db.query(func.count(model.id)).filter(*criteria).scalar_subquery()
+
+
+def _low_stock(kind: str, limit: int):
+    _, alerts = low_stock.page(kind=kind, limit=limit)
+    return [schemas.LowStockItem(**alert) for alert in alerts]
+
+
+def build_dashboard(db: Session, user: models.User, limit: int = DASHBOARD_LIST_LIMIT) -> schemas.DashboardOut:
+    # Todos los conteos en una sola consulta
+    counts = db.query(
+        _count(db, models.Material).label("materials"),
+        _count(db, models.Product).label("products"),
+        _count(db, models.Supplier).label("suppliers"),
+        _count(db, models.PurchaseOrder,
+               models.PurchaseOrder.user_id == user.id,
+               models.PurchaseOrder.status == "pendiente").label("pending_orders"),
+    ).one()
+
+    # Órdenes pendientes con nombres de proveedor y material (usa ix_purchase_orders_user_status)
+    pending_rows = db.query(
+        models.PurchaseOrder, models.Supplier.name, models.Material.name
+    ).outerjoin(
+        models.Supplier, models.Supplier.id == models.PurchaseOrder.supplier_id
+    ).outerjoin(
+        models.Material, models.Material.id == models.PurchaseOrder.material_id
+    ).filter(
+        models.PurchaseOrder.user_id == user.id,
+        models.PurchaseOrder.status == "pendiente"
+    ).order_by(models.PurchaseOrder.date.desc()).limit(limit).all()
+
+    pending_orders = [
+        schemas.PendingOrderSummary(
+            id=order.id,
+            date=order.date,
+            quantity=order.quantity,
+            supplier_id=order.supplier_id,
+            supplier_name=supplier_name or f"Proveedor ID: {order.supplier_id}",
+            material_id=order.material_id,
+            material_name=material_name,
+        )
+        for order, supplier_name, material_name in pending_rows
+    ]
+
+    # Últimos movimientos del usuario (usa ix_kardex_user_date)
+    kardex_rows = db.query(
+        models.Kardex, models.Material.name, models.Product.name
+    ).outerjoin(
+        models.Material, models.Material.id == models.Kardex.material_id
+    ).outerjoin(
+        models.Product, models.Product.id == models.Kardex.product_id
+    ).filter(
+        models.Kardex.user_id == user.id
+    ).order_by(models.Kardex.date.desc()).limit(limit).all()
+
+    recent_movements = []
+    for record, material_name, product_name in kardex_rows:
+        movement = {column.name: getattr(record, column.name) for column in models.Kardex.__table__.columns}
+        movement["username"] = user.username
+        if record.material_id:
+            movement["material_name"] = material_name or f"Material ID: {record.material_id}"
+        if record.product_id:
+            movement["product_name"] = product_name or f"Producto ID: {record.product_id}"
+        recent_movements.append(schemas.KardexOut(**movement))
+
+    return schemas.DashboardOut(
+        counts=schemas.DashboardCounts(
+            **counts._asdict(),
+            low_stock_materials=low_stock.count("material"),
+            low_stock_products=low_stock.count("product"),
+        ),
+        low_stock_materials=_low_stock("material", limit),
+        low_stock_products=_low_stock("product", limit),
+        pending_orders=pending_orders,
+        recent_movements=recent_movements,
+    )
+
+
+# 🔹 Resumen para la pantalla inicial (una sola petición)
+@router.get("/", response_model=schemas.DashboardOut)
+def get_dashboard(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    dashboard = dashboard_cache.get(current_user.id)
+    if dashboard is None:
+        dashboard = build_dashboard(db, current_user)
+        dashboard_cache.set(current_user.id, dashboard)
+    return dashboard
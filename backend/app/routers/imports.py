@@ -0,0 +1,37 @@
+import csv
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.database import get_db
+from app.importer import KINDS, ImportFormatError, import_rows, iter_rows
+from app.routers.auth import get_current_user
+
+router = APIRouter(
+    prefix="/import",
+    tags=["import"]
+)
+
+
+# 🔹 Importación masiva desde CSV o XLSX (materials, products o suppliers)
+@router.post("/{kind}", response_model=schemas.ImportOut)
+def import_file(
+    kind: str,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Columnas: las de la creación individual (name, type, color, stock, min_stock,
+    sale_price; en proveedores material_id o el nombre del material en "material").
+    Las filas inválidas se informan y no detienen la importación. Si el archivo deja
+    de poder leerse después de insertar filas, responde el resumen parcial con read_error.
+    """
+    if kind not in KINDS:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Tipo de importación no válido")
+    try:
+        return import_rows(db, kind, iter_rows(file.file, file.filename))
+    except ImportFormatError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    except (UnicodeDecodeError, ValueError, csv.Error) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"No se pudo leer el archivo: {exc}")
@@ -0,0 +1,105 @@
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from typing import List
+
+from app import models, schemas
+from app.database import get_db
+from app.jobs import DONE, REPORTS, TooManyJobs, artifact_path, job_runner
+from app.routers.auth import get_current_user
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"]
+)
+
+
+def _job_out(job: models.ReportJob, reused: bool = False):
+    params = json.loads(job.params)
+    params.pop("user_id", None)
+    return {
+        "id": job.id,
+        "report": job.report,
+        "params": params,
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "size": job.size,
+        "error": job.error,
+        "download_url": f"/jobs/{job.id}/download" if job.status == DONE else None,
+        "reused": reused,
+    }
+
+
+def _get_job(db: Session, job_id: int, user: models.User):
+    job = db.query(models.ReportJob).filter(models.ReportJob.id == job_id).first()
+    # Los reportes de un usuario no se muestran a otros (ni se revela que existen)
+    if not job or (REPORTS[job.report].per_user and job.user_id != user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo no encontrado")
+    return job
+
+
+# 🔹 Pedir un reporte: responde enseguida y se genera en segundo plano
+@router.post("/", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+def submit_job(
+    job: schemas.JobCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Reportes: kardex_export (material_id, product_id, start, end: YYYY-MM-DD),
+    abc y period_summary (kind: product|material, start, end: YYYY-MM).
+    Si ya hay un trabajo igual sobre los mismos datos se devuelve ese (reused=true).
+    """
+    try:
+        new_job, reused = job_runner.submit(db, job.report, job.params, current_user.id)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    except TooManyJobs:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Hay demasiados reportes en curso, espere a que terminen")
+    return _job_out(new_job, reused)
+
+
+# 🔹 Reportes pedidos por el usuario autenticado, más recientes primero
+@router.get("/", response_model=List[schemas.JobOut])
+def get_jobs(
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    jobs = db.query(models.ReportJob).filter(
+        models.ReportJob.user_id == current_user.id
+    ).order_by(models.ReportJob.id.desc()).limit(min(limit, 200)).all()
+    return [_job_out(job) for job in jobs]
+
+
+# 🔹 Estado de un reporte
+@router.get("/{job_id}", response_model=schemas.JobOut)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return _job_out(_get_job(db, job_id, current_user))
+
+
+# 🔹 Descargar el archivo de un reporte terminado
+@router.get("/{job_id}/download")
+def download_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    job = _get_job(db, job_id, current_user)
+    if job.status != DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El reporte no está listo (estado: {job.status})")
+    path = artifact_path(job)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="El archivo del reporte ya no está disponible, vuelva a pedirlo")
+    spec = REPORTS[job.report]
+    return FileResponse(path, media_type=spec.media_type, filename=f"{job.report}-{job.id}.{spec.extension}")
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from app import models, schemas
+from app.archive import HORIZON_DAYS, archive, query_archive
 from app.database import get_db
-from app.routers.auth import get_current_user
+from app.queries import get_by_id, kardex_listing
+from app.reconcile import reconcile
+from app.routers.auth import get_admin_user, get_current_user
 
 router = APIRouter(
     prefix="/kardex",
@@ -12,53 +16,57 @@ router = APIRouter(
 )
 
 
+def _with_archive(db: Session, records: list, user: models.User, limit: int, start, end,
+                  material_id=None, product_id=None, material_name=None, product_name=None):
+    """
+    Completa con movimientos archivados cuando la tabla caliente no alcanza el límite.
+    Todo lo archivado es más antiguo que lo caliente, así que basta con concatenar.
+    """
+    if len(records) >= limit:
+        return records
+    for row in query_archive(db, user.id, limit - len(records), start, end, material_id, product_id):
+        row["username"] = user.username
+        if row["material_id"]:
+            row["material_name"] = material_name or row["material_name"] or f"Material ID: {row['material_id']}"
+        if row["product_id"]:
+            row["product_name"] = product_name or row["product_name"] or f"Producto ID: {row['product_id']}"
+        records.append(row)
+    return records
+
+
 @router.get("/", response_model=List[schemas.KardexOut])
 def get_kardex(
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user),
         material_id: Optional[int] = None,
         product_id: Optional[int] = None,
-        limit: int = 100
+        limit: int = 100,
+        start: Optional[date] = None,
+        end: Optional[date] = None
 ):
     """
     Obtiene el historial de movimientos del kardex del usuario autenticado.
-    Opcionalmente puede filtrar por material_id o product_id.
+    Opcionalmente puede filtrar por material_id o product_id y por rango de fechas
+    (start/end inclusive); los movimientos archivados se incluyen cuando hacen falta.
     """
-    query = db.query(models.Kardex).filter(models.Kardex.user_id == current_user.id)
-
-    # Aplicar filtros opcionales
-    if material_id:
-        query = query.filter(models.Kardex.material_id == material_id)
-    if product_id:
-        query = query.filter(models.Kardex.product_id == product_id)
+    # Filtros opcionales, más recientes primero y con los nombres en el mismo join
+    rows = kardex_listing(db, current_user.id, limit, material_id, product_id, start, end, with_names=True)
 
-    # Ordenar por fecha descendente (más recientes primero) y limitar resultados
-    kardex_records = query.order_by(models.Kardex.date.desc()).limit(limit).all()
+    # Enriquecer cada registro con los nombres obtenidos en el mismo join
+    kardex_records = []
+    for record, material_name, product_name in rows:
+        # Todos los registros son del usuario autenticado
+        record.username = current_user.username
 
-    # Enriquecer cada registro con información adicional
-    for record in kardex_records:
-        # Agregar nombre del usuario
-        user = db.query(models.User).filter(models.User.id == record.user_id).first()
-        if user:
-            record.username = user.username
-
-        # Agregar nombre del material si existe
         if record.material_id:
-            material = db.query(models.Material).filter(models.Material.id == record.material_id).first()
-            if material and material.name:
-                record.material_name = material.name
-            else:
-                record.material_name = f"Material ID: {record.material_id}"
+            record.material_name = material_name or f"Material ID: {record.material_id}"
 
-        # Agregar nombre del producto si existe
         if record.product_id:
-            product = db.query(models.Product).filter(models.Product.id == record.product_id).first()
-            if product and product.name:
-                record.product_name = product.name
-            else:
-                record.product_name = f"Producto ID: {record.product_id}"
+            record.product_name = product_name or f"Producto ID: {record.product_id}"
+
+        kardex_records.append(record)
 
-    return kardex_records
+    return _with_archive(db, kardex_records, current_user, limit, start, end, material_id, product_id)
 
 
 @router.get("/material/{material_id}", response_model=List[schemas.KardexOut])
@@ -66,20 +74,19 @@ def get_material_kardex(
         material_id: int,
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user),
-        limit: int = 50
+        limit: int = 50,
+        start: Optional[date] = None,
+        end: Optional[date] = None
 ):
     """
     Obtiene el historial de movimientos de un material específico.
     """
     # Verificar que el material existe
-    material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    material = get_by_id(db, models.Material, material_id)
     if not material:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
 
-    kardex_records = db.query(models.Kardex).filter(
-        models.Kardex.material_id == material_id,
-        models.Kardex.user_id == current_user.id
-    ).order_by(models.Kardex.date.desc()).limit(limit).all()
+    kardex_records = kardex_listing(db, current_user.id, limit, material_id=material_id, start=start, end=end)
 
     # Enriquecer registros con información adicional
     for record in kardex_records:
@@ -88,11 +95,10 @@ def get_material_kardex(
         else:
             record.material_name = f"Material ID: {material_id}"
 
-        user = db.query(models.User).filter(models.User.id == record.user_id).first()
-        if user:
-            record.username = user.username
+        record.username = current_user.username
 
-    return kardex_records
+    return _with_archive(db, kardex_records, current_user, limit, start, end,
+                         material_id=material_id, material_name=material.name)
 
 
 @router.get("/product/{product_id}", response_model=List[schemas.KardexOut])
@@ -100,20 +106,19 @@ def get_product_kardex(
         product_id: int,
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user),
-        limit: int = 50
+        limit: int = 50,
+        start: Optional[date] = None,
+        end: Optional[date] = None
 ):
     """
     Obtiene el historial de movimientos de un producto específico.
     """
     # Verificar que el producto existe
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    product = get_by_id(db, models.Product, product_id)
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
 
-    kardex_records = db.query(models.Kardex).filter(
-        models.Kardex.product_id == product_id,
-        models.Kardex.user_id == current_user.id
-    ).order_by(models.Kardex.date.desc()).limit(limit).all()
+    kardex_records = kardex_listing(db, current_user.id, limit, product_id=product_id, start=start, end=end)
 
     # Enriquecer registros con información adicional
     for record in kardex_records:
@@ -122,11 +127,10 @@ def get_product_kardex(
         else:
             record.product_name = f"Producto ID: {product_id}"
 
-        user = db.query(models.User).filter(models.User.id == record.user_id).first()
-        if user:
-            record.username = user.username
+        record.username = current_user.username
 
-    return kardex_records
+    return _with_archive(db, kardex_records, current_user, limit, start, end,
+                         product_id=product_id, product_name=product.name)
 
 
 
@@ -155,12 +159,12 @@ def create_kardex_entry(
 
     # Verificar que el material o producto existe
     if kardex.material_id:
-        material = db.query(models.Material).filter(models.Material.id == kardex.material_id).first()
+        material = get_by_id(db, models.Material, kardex.material_id)
         if not material:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
 
     if kardex.product_id:
-        product = db.query(models.Product).filter(models.Product.id == kardex.product_id).first()
+        product = get_by_id(db, models.Product, kardex.product_id)
         if not product:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
 
@@ -171,6 +175,7 @@ def create_kardex_entry(
         stock_anterior=kardex.stock_anterior,
         stock_nuevo=kardex.stock_nuevo,
         observaciones=kardex.observaciones,
+        unit_cost=kardex.unit_cost,
         material_id=kardex.material_id,
         product_id=kardex.product_id,
         user_id=current_user.id
@@ -181,3 +186,31 @@ def create_kardex_entry(
     db.refresh(new_kardex)
 
     return new_kardex
+
+
+@router.post("/reconcile", response_model=schemas.ReconcileOut)
+def reconcile_kardex(
+        full: bool = False,
+        db: Session = Depends(get_db),
+        admin: models.User = Depends(get_admin_user)
+):
+    """
+    Concilia el stock actual con la cadena de movimientos del kardex (solo administradores).
+    Por defecto continúa desde el último movimiento verificado; full=true revisa todo el historial.
+    Desde la API corre en el proceso del worker, sin pool de procesos; las corridas
+    grandes en paralelo se hacen con python -m app.reconcile --workers N.
+    """
+    return reconcile(db, full=full, workers=1)
+
+
+@router.post("/archive", response_model=schemas.ArchiveOut)
+def archive_kardex(
+        horizon_days: int = Query(HORIZON_DAYS, ge=30),
+        db: Session = Depends(get_db),
+        admin: models.User = Depends(get_admin_user)
+):
+    """
+    Mueve a las tablas de archivo mensuales los meses completos más antiguos que horizon_days
+    (solo administradores).
+    """
+    return archive(db, horizon_days=horizon_days)
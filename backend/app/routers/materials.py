@@ -1,36 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+import logging
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.exc import StaleDataError
+from typing import List, Optional
 from app import models, schemas
+from app.batch import parse_ids, report_missing
+from app.concurrency import conflict_response, etag, parse_if_match, retry_on_conflict
+from app.costing import weighted_average
 from app.database import get_db
+from app.queries import get_by_id
+from app.kardex_writer import kardex_writer
+from app.lowstock import low_stock
+from app.search import catalog_search
+from app.supplier_materials import load_suppliers
+from app import shards
 from app.routers.auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/materials",
     tags=["materials"]
 )
 
 
-# Obtener todas las materias primas
+# Obtener todas las materias primas (o solo las de ?ids=1,2,3)
 @router.get("/", response_model=List[schemas.MaterialOut])
 def get_materials(
+        response: Response,
+        ids: Optional[str] = Query(None, description="ids separados por comas"),
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user)
 ):
-    materials = db.query(models.Material).all()
-    return materials
+    requested = parse_ids(ids)
+    query = db.query(models.Material).options(joinedload(models.Material.suppliers))
+    if requested is None:
+        return shards.overlay(db, "material", query.all())
+    materials = query.filter(models.Material.id.in_(requested)).all() if requested else []
+    return shards.overlay(db, "material", report_missing(response, requested, materials))
 
 
 # Obtener una materia prima por ID con sus proveedores
 @router.get("/{material_id}", response_model=schemas.MaterialOut)
 def get_material(
         material_id: int,
+        response: Response,
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user)
 ):
-    material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    material = get_by_id(db, models.Material, material_id)
     if not material:
         raise HTTPException(status_code=404, detail="Material no encontrado")
+    shards.overlay(db, "material", [material])
+    response.headers["ETag"] = etag(material.version_id)
     return material
 
 
@@ -45,6 +68,8 @@ def create_material(
     db.add(new_material)
     db.commit()
     db.refresh(new_material)
+    low_stock.update("material", new_material)
+    catalog_search.update("material", new_material)
     return new_material
 
 
@@ -53,52 +78,76 @@ def create_material(
 def update_material(
         material_id: int,
         update: schemas.MaterialUpdate,
+        response: Response,
+        if_match: Optional[str] = Header(None),
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user)
 ):
-    material = db.query(models.Material).filter(models.Material.id == material_id).first()
+    material = get_by_id(db, models.Material, material_id)
     if not material:
         raise HTTPException(status_code=404, detail="Material no encontrado")
 
+    # Obtener el diccionario de actualización y verificar la versión que leyó el cliente
+    update_dict = update.dict(exclude_unset=True)
+    expected_version = parse_if_match(if_match)
+    body_version = update_dict.pop("version_id", None)
+    if expected_version is None:
+        expected_version = body_version
+    shard_count = update_dict.pop("stock_shards", None)
+
+    # La precondición se verifica antes de cualquier escritura
+    if expected_version is not None and expected_version != material.version_id:
+        return conflict_response(
+            material, "El material fue modificado por otro usuario", status.HTTP_412_PRECONDITION_FAILED
+        )
+
+    # Ítem fraccionado: consolidar los contadores antes de fijar un stock absoluto
+    if material.stock_shards:
+        shards.compact_item(db, "material", material_id)
+    if shard_count is not None and shard_count != material.stock_shards:
+        shards.configure(db, "material", material, shard_count)
+
     # Guardar el stock antiguo ANTES de hacer cualquier cambio
     old_stock = material.stock
-
-    # Obtener el diccionario de actualización y verificar si el stock cambió
-    update_dict = update.dict(exclude_unset=True)
     stock_changed = "stock" in update_dict and update_dict["stock"] != old_stock
 
-    print(f"🔍 Actualizando material {material_id}")
-    print(f"   Stock anterior: {old_stock}")
-    if "stock" in update_dict:
-        print(f"   Stock nuevo: {update_dict['stock']}")
-        print(f"   ¿Cambió? {stock_changed}")
+    logger.debug("Actualizando material %s: stock %s -> %s", material_id, old_stock,
+                 update_dict.get("stock", old_stock), extra={"material_id": material_id, "stock_changed": stock_changed})
 
     # Aplicar todos los cambios
     for key, value in update_dict.items():
         setattr(material, key, value)
 
-    db.commit()
+    try:
+        # Registrar en Kardex SOLO si el stock realmente cambió, junto con el cambio
+        if stock_changed:
+            movement_type = "entrada" if material.stock > old_stock else "salida"
+            quantity_changed = abs(material.stock - old_stock)
+            kardex_writer.commit(
+                db,
+                movement_type=movement_type,
+                quantity=quantity_changed,
+                stock_anterior=old_stock,
+                stock_nuevo=material.stock,
+                unit_cost=material.avg_cost,
+                observaciones="Actualización manual de stock",
+                material_id=material.id,
+                user_id=current_user.id,
+            )
+            logger.info("Kardex registrado: %s de %s unidades (%s -> %s)", movement_type, quantity_changed,
+                        old_stock, material.stock, extra={"material_id": material_id})
+        else:
+            db.commit()
+    except StaleDataError:
+        # Otra petición guardó el material entre la lectura y el UPDATE
+        db.rollback()
+        return conflict_response(db.query(models.Material).get(material_id),
+                                 "El material fue modificado por otro usuario",
+                                 not_found="Material no encontrado")
     db.refresh(material)
-
-    # Registrar en Kardex SOLO si el stock realmente cambió
-    if stock_changed:
-        movement_type = "entrada" if material.stock > old_stock else "salida"
-        quantity_changed = abs(material.stock - old_stock)
-
-        kardex = models.Kardex(
-            movement_type=movement_type,
-            quantity=quantity_changed,
-            stock_anterior=old_stock,
-            stock_nuevo=material.stock,
-            observaciones="Actualización manual de stock",
-            material_id=material.id,
-            user_id=current_user.id,
-        )
-        db.add(kardex)
-        db.commit()
-
-        print(f"✅ Kardex registrado: {movement_type} de {quantity_changed} unidades")
-        print(f"   De {old_stock} a {material.stock}")
+    low_stock.update("material", material)
+    catalog_search.update("material", material)
+    response.headers["ETag"] = etag(material.version_id)
 
     return material
 
@@ -108,30 +157,52 @@ def update_material(
 def add_material(
         material_id: int,
         quantity: int,
+        response: Response,
+        unit_cost: Optional[float] = Query(None, ge=0),
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user)
 ):
     material = db.query(models.Material).get(material_id)
-    if not material:
-        raise HTTPException(status_code=404, detail="Material no encontrado")
+    if material and material.stock_shards:
+        # Ítem fraccionado: el delta va a un contador parcial sin bloquear la fila del material
+        material = shards.record_movement(db, "material", material, "entrada", quantity,
+                                          "Ingreso manual de stock", current_user.id, unit_cost=unit_cost)
+        low_stock.update("material", material)
+        response.headers["ETag"] = etag(material.version_id)
+        return material
+
+    def attempt():
+        material = db.query(models.Material).get(material_id)
+        if not material:
+            raise HTTPException(status_code=404, detail="Material no encontrado")
+        old_stock = material.stock
+        # Con costo conocido el ingreso actualiza el promedio; sin costo entra al promedio vigente
+        if unit_cost is not None:
+            material.avg_cost = weighted_average(old_stock, material.avg_cost, quantity, unit_cost)
+        material.stock += quantity
+
+        # Kardex entrada
+        kardex_writer.commit(
+            db,
+            movement_type="entrada",
+            quantity=quantity,
+            stock_anterior=old_stock,
+            stock_nuevo=material.stock,
+            unit_cost=unit_cost if unit_cost is not None else material.avg_cost,
+            observaciones="Ingreso manual de stock",
+            material_id=material.id,
+            user_id=current_user.id,
+        )
+        return material
 
-    old_stock = material.stock
-    material.stock += quantity
-    db.commit()
+    material = retry_on_conflict(db, attempt)
+    if material is None:
+        return conflict_response(db.query(models.Material).get(material_id),
+                                 "No se pudo actualizar el stock por modificaciones concurrentes",
+                                 not_found="Material no encontrado")
     db.refresh(material)
-
-    # Kardex entrada
-    kardex = models.Kardex(
-        movement_type="entrada",
-        quantity=quantity,
-        stock_anterior=old_stock,
-        stock_nuevo=material.stock,
-        observaciones="Ingreso manual de stock",
-        material_id=material.id,
-        user_id=current_user.id,
-    )
-    db.add(kardex)
-    db.commit()
+    low_stock.update("material", material)
+    response.headers["ETag"] = etag(material.version_id)
 
     return material
 
@@ -141,33 +212,49 @@ def add_material(
 def remove_material(
         material_id: int,
         quantity: int,
+        response: Response,
         db: Session = Depends(get_db),
         current_user: models.User = Depends(get_current_user)
 ):
     material = db.query(models.Material).get(material_id)
-    if not material:
-        raise HTTPException(status_code=404, detail="Material no encontrado")
-
-    if material.stock < quantity:
-        raise HTTPException(status_code=400, detail="Stock insuficiente")
+    if material and material.stock_shards:
+        material = shards.record_movement(db, "material", material, "salida", quantity,
+                                          "Salida manual de stock", current_user.id)
+        low_stock.update("material", material)
+        response.headers["ETag"] = etag(material.version_id)
+        return material
+
+    def attempt():
+        material = db.query(models.Material).get(material_id)
+        if not material:
+            raise HTTPException(status_code=404, detail="Material no encontrado")
+        if material.stock < quantity:
+            raise HTTPException(status_code=400, detail="Stock insuficiente")
+        old_stock = material.stock
+        material.stock -= quantity
+
+        # Kardex salida
+        kardex_writer.commit(
+            db,
+            movement_type="salida",
+            quantity=quantity,
+            stock_anterior=old_stock,
+            stock_nuevo=material.stock,
+            unit_cost=material.avg_cost,
+            observaciones="Salida manual de stock",
+            material_id=material.id,
+            user_id=current_user.id,
+        )
+        return material
 
-    old_stock = material.stock
-    material.stock -= quantity
-    db.commit()
+    material = retry_on_conflict(db, attempt)
+    if material is None:
+        return conflict_response(db.query(models.Material).get(material_id),
+                                 "No se pudo actualizar el stock por modificaciones concurrentes",
+                                 not_found="Material no encontrado")
     db.refresh(material)
-
-    # Kardex salida
-    kardex = models.Kardex(
-        movement_type="salida",
-        quantity=quantity,
-        stock_anterior=old_stock,
-        stock_nuevo=material.stock,
-        observaciones="Salida manual de stock",
-        material_id=material.id,
-        user_id=current_user.id,
-    )
-    db.add(kardex)
-    db.commit()
+    low_stock.update("material", material)
+    response.headers["ETag"] = etag(material.version_id)
 
     return material
 
@@ -180,19 +267,10 @@ def get_suppliers_for_material(
         current_user: models.User = Depends(get_current_user)
 ):
     """
-    Obtiene los proveedores disponibles para un material específico.
-    Si el material tiene un supplier_id específico, devuelve solo ese proveedor.
-    Si no, devuelve todos los proveedores disponibles.
+    Obtiene los proveedores que ofrecen un material específico (tabla
+    supplier_materials), con todos sus materiales en una consulta.
     """
-    material = db.query(models.Material).filter(models.Material.id == material_id).first()
-    if not material:
+    suppliers = load_suppliers(db, material_id=material_id)
+    if not suppliers and not get_by_id(db, models.Material, material_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
-
-    if material.supplier_id:
-        supplier = db.query(models.Supplier).filter(models.Supplier.id == material.supplier_id).first()
-        if supplier:
-            return [supplier]
-        else:
-            return db.query(models.Supplier).all()
-    else:
-        return db.query(models.Supplier).all()
\ No newline at end of file
+    return suppliers
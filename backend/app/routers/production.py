@@ -0,0 +1,113 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+from typing import List
+
+from app import models, schemas
+from app.database import get_db
+from app.kardex_writer import kardex_writer
+from app.lowstock import low_stock
+from app.stock import stage_movements
+from app.routers.auth import get_current_user
+
+router = APIRouter(
+    prefix="/production",
+    tags=["production"]
+)
+
+# Producto y consumo con el nombre de cada material, en la misma consulta que la orden
+ORDER_DETAILS = (
+    joinedload(models.ProductionOrder.product),
+    joinedload(models.ProductionOrder.lines).joinedload(models.ProductionOrderLine.material),
+)
+
+
+def _with_names(order, user_name):
+    order.product_name = order.product.name if order.product else None
+    order.user_name = user_name
+    for line in order.lines:
+        line.material_name = line.material.name if line.material else None
+    return order
+
+
+# 🔹 Órdenes de producción del usuario autenticado, más recientes primero
+@router.get("/orders", response_model=List[schemas.ProductionOrderOut])
+def get_production_orders(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    orders = db.query(models.ProductionOrder).options(*ORDER_DETAILS).filter(
+        models.ProductionOrder.user_id == current_user.id
+    ).order_by(models.ProductionOrder.date.desc(), models.ProductionOrder.id.desc()).all()
+    return [_with_names(order, current_user.username) for order in orders]
+
+
+# 🔹 Producir: descuenta los materiales de la lista y suma el producto en una transacción
+@router.post("/orders", response_model=schemas.ProductionOrderOut, status_code=status.HTTP_201_CREATED)
+def create_production_order(
+    order: schemas.ProductionOrderCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Producto, lista de materiales y stock de cada material en una sola consulta
+    rows = db.query(
+        models.Product.id, models.BomLine.material_id, models.BomLine.quantity,
+        models.Material.name, models.Material.stock, models.Material.stock_shards,
+    ).outerjoin(
+        models.BomLine, models.BomLine.product_id == models.Product.id
+    ).outerjoin(
+        models.Material, models.Material.id == models.BomLine.material_id
+    ).filter(models.Product.id == order.product_id).all()
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+    if rows[0].material_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="El producto no tiene lista de materiales")
+
+    required = {row.material_id: row.quantity * order.quantity for row in rows}
+    # Verificación previa sin bloquear; el UPDATE vuelve a verificar dentro de la
+    # transacción. Los materiales fraccionados se verifican al registrar el movimiento.
+    short = [
+        f"{row.name} (requiere {required[row.material_id]}, hay {row.stock or 0})"
+        for row in rows if not row.stock_shards and (row.stock or 0) < required[row.material_id]
+    ]
+    if short:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Stock insuficiente: {'; '.join(short)}")
+
+    new_order = models.ProductionOrder(product_id=order.product_id, quantity=order.quantity, user_id=current_user.id)
+    db.add(new_order)
+    db.flush()
+    order_id = new_order.id
+    # Consumo de la orden en un solo INSERT de varias filas
+    db.execute(insert(models.ProductionOrderLine), [
+        {"order_id": order_id, "material_id": material_id, "quantity": quantity}
+        for material_id, quantity in required.items()
+    ])
+
+    # Todas las salidas en un UPDATE, la entrada del producto (con su costo promedio)
+    # en otro y todo el kardex en un INSERT, confirmados juntos con la orden
+    observaciones = f"Orden de producción #{order_id}"
+    materials, material_rows = stage_movements(
+        db, "material", {material_id: -quantity for material_id, quantity in required.items()},
+        observaciones, current_user.id,
+    )
+    # El producto entra al costo de los materiales consumidos (a su costo promedio)
+    consumed = sum(required[material.id] * (material.avg_cost or 0.0) for material in materials)
+    products, product_rows = stage_movements(
+        db, "product", {order.product_id: order.quantity}, observaciones, current_user.id,
+        costs={order.product_id: consumed / order.quantity},
+    )
+    # Leído antes del commit, que expira al usuario
+    user_name = current_user.username
+    kardex_writer.commit_many(db, material_rows + product_rows)
+
+    for material in materials:
+        low_stock.update("material", material)
+    for product in products:
+        low_stock.update("product", product)
+
+    # Releer la orden con su detalle en una consulta (fecha asignada por la base)
+    new_order = db.query(models.ProductionOrder).options(*ORDER_DETAILS).filter(
+        models.ProductionOrder.id == order_id
+    ).one()
+    return _with_names(new_order, user_name)
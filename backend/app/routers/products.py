@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.orm.exc import StaleDataError
+from typing import List, Optional
 from app import models, schemas
+from app.batch import parse_ids, report_missing
+from app.concurrency import conflict_response, etag, parse_if_match, retry_on_conflict
+from app.costing import weighted_average
 from app.database import get_db
+from app.queries import get_by_id
+from app.kardex_writer import kardex_writer
+from app.lowstock import low_stock
+from app.search import catalog_search
+from app import shards
 from app.routers.auth import get_current_user
 
 router = APIRouter(
@@ -11,13 +20,19 @@ router = APIRouter(
 )
 
 
-# Obtener todos los productos
+# Obtener todos los productos (o solo los de ?ids=1,2,3)
 @router.get("/", response_model=List[schemas.ProductOut])
 def get_products(
+    response: Response,
+    ids: Optional[str] = Query(None, description="ids separados por comas"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    return db.query(models.Product).all()
+    requested = parse_ids(ids)
+    if requested is None:
+        return shards.overlay(db, "product", db.query(models.Product).all())
+    products = db.query(models.Product).filter(models.Product.id.in_(requested)).all() if requested else []
+    return shards.overlay(db, "product", report_missing(response, requested, products))
 
 
 # Crear producto
@@ -31,6 +46,8 @@ def create_product(
     db.add(new_product)
     db.commit()
     db.refresh(new_product)
+    low_stock.update("product", new_product)
+    catalog_search.update("product", new_product)
     return new_product
 
 
@@ -39,35 +56,66 @@ def create_product(
 def update_product(
     product_id: int,
     update: schemas.ProductUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    product = db.query(models.Product).filter(models.Product.id == product_id).first()
+    product = get_by_id(db, models.Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
+    # Verificar la versión que leyó el cliente (If-Match o version_id en el cuerpo)
+    update_dict = update.dict(exclude_unset=True)
+    expected_version = parse_if_match(if_match)
+    body_version = update_dict.pop("version_id", None)
+    if expected_version is None:
+        expected_version = body_version
+    shard_count = update_dict.pop("stock_shards", None)
+
+    # La precondición se verifica antes de cualquier escritura
+    if expected_version is not None and expected_version != product.version_id:
+        return conflict_response(
+            product, "El producto fue modificado por otro usuario", status.HTTP_412_PRECONDITION_FAILED
+        )
+
+    # Ítem fraccionado: consolidar los contadores antes de fijar un stock absoluto
+    if product.stock_shards:
+        shards.compact_item(db, "product", product_id)
+    if shard_count is not None and shard_count != product.stock_shards:
+        shards.configure(db, "product", product, shard_count)
+
     old_stock = product.stock
 
-    for key, value in update.dict(exclude_unset=True).items():
+    for key, value in update_dict.items():
         setattr(product, key, value)
 
-    db.commit()
+    try:
+        # Kardex si se modificó stock, en el mismo commit que el cambio
+        if "stock" in update_dict and product.stock != old_stock:
+            movement_type = "entrada" if product.stock > old_stock else "salida"
+            kardex_writer.commit(
+                db,
+                movement_type=movement_type,
+                quantity=abs(product.stock - old_stock),
+                stock_anterior=old_stock,
+                stock_nuevo=product.stock,
+                unit_cost=product.avg_cost,
+                observaciones="Actualización manual de stock (producto)",
+                product_id=product.id,
+                user_id=current_user.id,
+            )
+        else:
+            db.commit()
+    except StaleDataError:
+        db.rollback()
+        return conflict_response(db.query(models.Product).get(product_id),
+                                 "El producto fue modificado por otro usuario",
+                                 not_found="Producto no encontrado")
     db.refresh(product)
-
-    # Kardex si se modificó stock
-    if "stock" in update.dict(exclude_unset=True) and product.stock != old_stock:
-        movement_type = "entrada" if product.stock > old_stock else "salida"
-        kardex = models.Kardex(
-            movement_type=movement_type,
-            quantity=abs(product.stock - old_stock),
-            stock_anterior=old_stock,
-            stock_nuevo=product.stock,
-            observaciones="Actualización manual de stock (producto)",
-            product_id=product.id,
-            user_id=current_user.id,
-        )
-        db.add(kardex)
-        db.commit()
+    low_stock.update("product", product)
+    catalog_search.update("product", product)
+    response.headers["ETag"] = etag(product.version_id)
 
     return product
 
@@ -77,30 +125,52 @@ def update_product(
 def add_product(
     product_id: int,
     quantity: int,
+    response: Response,
+    unit_cost: Optional[float] = Query(None, ge=0),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     product = db.query(models.Product).get(product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    if product and product.stock_shards:
+        # Ítem fraccionado: el delta va a un contador parcial sin bloquear la fila del producto
+        product = shards.record_movement(db, "product", product, "entrada", quantity,
+                                         "Ingreso manual de stock (producto)", current_user.id, unit_cost=unit_cost)
+        low_stock.update("product", product)
+        response.headers["ETag"] = etag(product.version_id)
+        return product
 
-    old_stock = product.stock
-    product.stock += quantity
-    db.commit()
-    db.refresh(product)
+    def attempt():
+        product = db.query(models.Product).get(product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        old_stock = product.stock
+        # Con costo conocido el ingreso actualiza el promedio; sin costo entra al promedio vigente
+        if unit_cost is not None:
+            product.avg_cost = weighted_average(old_stock, product.avg_cost, quantity, unit_cost)
+        product.stock += quantity
 
-    # Kardex entrada
-    kardex = models.Kardex(
-        movement_type="entrada",
-        quantity=quantity,
-        stock_anterior=old_stock,
-        stock_nuevo=product.stock,
-        observaciones="Ingreso manual de stock (producto)",
-        product_id=product.id,
-        user_id=current_user.id,
-    )
-    db.add(kardex)
-    db.commit()
+        # Kardex entrada
+        kardex_writer.commit(
+            db,
+            movement_type="entrada",
+            quantity=quantity,
+            stock_anterior=old_stock,
+            stock_nuevo=product.stock,
+            unit_cost=unit_cost if unit_cost is not None else product.avg_cost,
+            observaciones="Ingreso manual de stock (producto)",
+            product_id=product.id,
+            user_id=current_user.id,
+        )
+        return product
+
+    product = retry_on_conflict(db, attempt)
+    if product is None:
+        return conflict_response(db.query(models.Product).get(product_id),
+                                 "No se pudo actualizar el stock por modificaciones concurrentes",
+                                 not_found="Producto no encontrado")
+    db.refresh(product)
+    low_stock.update("product", product)
+    response.headers["ETag"] = etag(product.version_id)
 
     return product
 
@@ -110,32 +180,108 @@ def add_product(
 def remove_product(
     product_id: int,
     quantity: int,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     product = db.query(models.Product).get(product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    if product and product.stock_shards:
+        product = shards.record_movement(db, "product", product, "salida", quantity,
+                                         "Salida manual de stock (producto)", current_user.id)
+        low_stock.update("product", product)
+        response.headers["ETag"] = etag(product.version_id)
+        return product
 
-    if product.stock < quantity:
-        raise HTTPException(status_code=400, detail="Stock insuficiente")
+    def attempt():
+        product = db.query(models.Product).get(product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        if product.stock < quantity:
+            raise HTTPException(status_code=400, detail="Stock insuficiente")
+        old_stock = product.stock
+        product.stock -= quantity
 
-    old_stock = product.stock
-    product.stock -= quantity
-    db.commit()
-    db.refresh(product)
+        # Kardex salida
+        kardex_writer.commit(
+            db,
+            movement_type="salida",
+            quantity=quantity,
+            stock_anterior=old_stock,
+            stock_nuevo=product.stock,
+            unit_cost=product.avg_cost,
+            observaciones="Salida manual de stock (producto)",
+            product_id=product.id,
+            user_id=current_user.id,
+        )
+        return product
 
-    # Kardex salida
-    kardex = models.Kardex(
-        movement_type="salida",
-        quantity=quantity,
-        stock_anterior=old_stock,
-        stock_nuevo=product.stock,
-        observaciones="Salida manual de stock (producto)",
-        product_id=product.id,
-        user_id=current_user.id,
-    )
-    db.add(kardex)
-    db.commit()
+    product = retry_on_conflict(db, attempt)
+    if product is None:
+        return conflict_response(db.query(models.Product).get(product_id),
+                                 "No se pudo actualizar el stock por modificaciones concurrentes",
+                                 not_found="Producto no encontrado")
+    db.refresh(product)
+    low_stock.update("product", product)
+    response.headers["ETag"] = etag(product.version_id)
 
     return product
+
+
+# 🔹 Lista de materiales del producto (cantidad de cada material por unidad)
+@router.get("/{product_id}/bom", response_model=List[schemas.BomLineOut])
+def get_bom(
+    product_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    rows = db.query(models.Product.id, models.BomLine, models.Material.name).outerjoin(
+        models.BomLine, models.BomLine.product_id == models.Product.id
+    ).outerjoin(
+        models.Material, models.Material.id == models.BomLine.material_id
+    ).filter(models.Product.id == product_id).order_by(models.BomLine.id).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    lines = []
+    for _, line, material_name in rows:
+        if line is not None:
+            line.material_name = material_name
+            lines.append(line)
+    return lines
+
+
+# 🔹 Reemplazar la lista de materiales del producto (lista vacía = sin materiales)
+@router.put("/{product_id}/bom", response_model=List[schemas.BomLineOut])
+def set_bom(
+    product_id: int,
+    lines: List[schemas.BomLineIn],
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    material_ids = [line.material_id for line in lines]
+    if len(set(material_ids)) != len(material_ids):
+        raise HTTPException(status_code=400, detail="Hay materiales repetidos en la lista")
+
+    # Producto y todos los materiales en una sola consulta
+    rows = db.query(models.Product.id, models.Material.id, models.Material.name).outerjoin(
+        models.Material, models.Material.id.in_(material_ids)
+    ).filter(models.Product.id == product_id).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    material_names = {material_id: name for _, material_id, name in rows if material_id is not None}
+    missing = [material_id for material_id in material_ids if material_id not in material_names]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Material no encontrado: {', '.join(map(str, missing))}")
+
+    db.query(models.BomLine).filter(models.BomLine.product_id == product_id).delete(synchronize_session=False)
+    new_lines = [
+        models.BomLine(product_id=product_id, material_id=line.material_id, quantity=line.quantity)
+        for line in lines
+    ]
+    db.add_all(new_lines)
+    db.flush()
+    for line in new_lines:
+        line.material_name = material_names[line.material_id]
+        # Ya tiene id y nombre: separarla de la sesión evita recargarla tras el commit
+        db.expunge(line)
+    db.commit()
+    return new_lines
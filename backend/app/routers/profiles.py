@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app import models
+from app.profiling import profiler
+from app.routers.auth import get_admin_user
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiles"]
+)
+
+
+def _get_profile(profile_id: int):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil no encontrado")
+    return profile
+
+
+# 🔹 Últimos perfiles capturados en este proceso, más recientes primero
+@router.get("/")
+def get_profiles(admin: models.User = Depends(get_admin_user)):
+    return {
+        "sample_every": profiler.sample_every,
+        "profiles": [profile.summary() for profile in reversed(profiler.profiles)],
+    }
+
+
+# 🔹 Muestrear 1 de cada N peticiones por ruta (0 = solo las marcadas con X-Profile)
+@router.put("/settings")
+def update_profile_settings(
+    sample_every: int = Query(..., ge=0),
+    admin: models.User = Depends(get_admin_user)
+):
+    profiler.sample_every = sample_every
+    return {"sample_every": profiler.sample_every}
+
+
+# 🔹 Detalle de un perfil: funciones y consultas más costosas
+@router.get("/{profile_id}")
+def get_profile(
+    profile_id: int,
+    top: int = Query(30, ge=1, le=500),
+    admin: models.User = Depends(get_admin_user)
+):
+    return _get_profile(profile_id).details(top)
+
+
+# 🔹 Pilas en formato collapsed para flamegraph.pl o speedscope
+@router.get("/{profile_id}/collapsed", response_class=PlainTextResponse)
+def get_profile_collapsed(profile_id: int, admin: models.User = Depends(get_admin_user)):
+    return _get_profile(profile_id).collapsed()
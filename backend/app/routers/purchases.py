@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app import models, schemas
+from app.batch import parse_ids, report_missing
 from app.database import get_db
+from app.lowstock import low_stock
+from app.orders import LINES, with_names
+from app.stock import apply_movements
+from app.suggestions import MAX_HISTORY_DAYS, compute_suggestions
+from app.supplier_stats import supplier_stats
 from app.routers.auth import get_current_user
 
 router = APIRouter(
@@ -15,60 +22,119 @@ router = APIRouter(
 # 🔹 Obtener todas las órdenes de compra del usuario autenticado
 @router.get("/orders", response_model=List[schemas.PurchaseOrderOut])
 def get_orders(
+    response: Response,
+    ids: Optional[str] = Query(None, description="ids separados por comas"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    orders = db.query(models.PurchaseOrder).filter(
+    requested = parse_ids(ids)
+    query = db.query(models.PurchaseOrder, models.Supplier.name).outerjoin(
+        models.Supplier, models.Supplier.id == models.PurchaseOrder.supplier_id
+    ).options(LINES).filter(
         models.PurchaseOrder.user_id == current_user.id
-    ).all()
+    )
+    if requested is not None:
+        # Las órdenes de otros usuarios se informan como inexistentes
+        query = query.filter(models.PurchaseOrder.id.in_(requested))
+    rows = query.all() if requested != [] else []
 
-    for order in orders:
-        supplier = db.query(models.Supplier).filter(models.Supplier.id == order.supplier_id).first()
-        order.supplier_name = supplier.name if supplier else f"Proveedor ID: {order.supplier_id}"
-        order.user_name = current_user.username
+    orders = [with_names(order, supplier_name, current_user) for order, supplier_name in rows]
 
+    if requested is not None:
+        return report_missing(response, requested, orders)
     return orders
 
 
-# 🔹 Crear una nueva orden de compra
+# 🔹 Sugerencias de compra a partir del consumo histórico (salidas del kardex)
+@router.get("/suggestions", response_model=schemas.ReorderSuggestionsOut)
+def get_purchase_suggestions(
+    history_days: int = Query(180, ge=7, le=MAX_HISTORY_DAYS),
+    lead_time_days: float = Query(7, gt=0, le=365),
+    service_level: float = Query(0.95, gt=0.5, lt=1),
+    cover_days: int = Query(30, ge=0, le=365),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return compute_suggestions(
+        db,
+        history_days=history_days,
+        lead_time_days=lead_time_days,
+        service_level=service_level,
+        cover_days=cover_days,
+    )
+
+
+# 🔹 Crear una nueva orden de compra (un ítem con material_id/quantity o varios en lines)
 @router.post("/orders", response_model=schemas.PurchaseOrderOut, status_code=status.HTTP_201_CREATED)
 def create_order(
     order: schemas.PurchaseOrderCreate,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    # Verifica que el material exista
-    material = db.query(models.Material).filter(models.Material.id == order.material_id).first()
-    if not material:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
-
-    # Verifica que el proveedor exista
-    supplier = db.query(models.Supplier).filter(models.Supplier.id == order.supplier_id).first()
-    if not supplier:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Proveedor no encontrado")
-
-    # 🔑 Validar que el proveedor pertenezca al material seleccionado
-    if supplier.material_id != order.material_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"El proveedor '{supplier.name}' no está asociado al material '{material.name}'"
+    lines = order.lines
+    if not lines:
+        if order.material_id is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Indique material_id y quantity o los ítems en lines")
+        if not order.quantity or order.quantity <= 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="La cantidad debe ser mayor a 0")
+        lines = [schemas.PurchaseOrderLineIn(material_id=order.material_id, quantity=order.quantity,
+                                             unit_cost=order.unit_cost)]
+
+    material_ids = [line.material_id for line in lines]
+    if len(set(material_ids)) != len(material_ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Hay materiales repetidos en la orden")
+
+    # Proveedor y todos los materiales de la orden en una sola consulta
+    # (con la relación proveedor-material de cada uno, si existe)
+    rows = db.query(
+        models.Supplier, models.Material.id, models.Material.name, models.SupplierMaterial.id
+    ).select_from(models.Supplier).outerjoin(
+        models.Material, models.Material.id.in_(material_ids)
+    ).outerjoin(
+        models.SupplierMaterial, and_(
+            models.SupplierMaterial.supplier_id == models.Supplier.id,
+            models.SupplierMaterial.material_id == models.Material.id,
         )
-
-    # Crear la orden
+    ).filter(models.Supplier.id == order.supplier_id).all()
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Proveedor no encontrado")
+    supplier = rows[0][0]
+    material_names = {material_id: name for _, material_id, name, _ in rows if material_id is not None}
+    linked = {material_id for _, material_id, _, link_id in rows if link_id is not None}
+
+    for material_id in material_ids:
+        if material_id not in material_names:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
+        # 🔑 Validar que el proveedor pertenezca al material seleccionado
+        if material_id not in linked:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"El proveedor '{supplier.name}' no está asociado al material '{material_names[material_id]}'"
+            )
+
+    # Crear la orden; con un solo ítem la cabecera conserva material_id/quantity/unit_cost
     new_order = models.PurchaseOrder(
         supplier_id=order.supplier_id,
-        material_id=order.material_id,
-        quantity=order.quantity,
-        user_id=current_user.id
+        material_id=lines[0].material_id if len(lines) == 1 else None,
+        quantity=sum(line.quantity for line in lines),
+        unit_cost=lines[0].unit_cost if len(lines) == 1 else None,
+        user_id=current_user.id,
+        lines=[
+            models.PurchaseOrderLine(material_id=line.material_id, quantity=line.quantity, unit_cost=line.unit_cost)
+            for line in lines
+        ],
     )
 
     db.add(new_order)
+    db.flush()
+    order_id, supplier_name = new_order.id, supplier.name
     db.commit()
-    db.refresh(new_order)
+    supplier_stats.mark(order.supplier_id)
 
-    new_order.supplier_name = supplier.name
-    new_order.user_name = current_user.username
-    return new_order
+    # Releer la orden con sus ítems en una consulta (fecha asignada por la base)
+    new_order = db.query(models.PurchaseOrder).options(LINES).filter(models.PurchaseOrder.id == order_id).one()
+    return with_names(new_order, supplier_name, current_user)
 
 
 # 🔹 Completar una orden de compra
@@ -78,51 +144,46 @@ def complete_order(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    order_query = db.query(models.PurchaseOrder).filter(
+    # Cambio de estado condicional: solo desde pendiente, así dos peticiones simultáneas
+    # no completan la orden dos veces ni se completa una orden cancelada
+    changed = db.query(models.PurchaseOrder).filter(
+        models.PurchaseOrder.id == order_id,
+        models.PurchaseOrder.user_id == current_user.id,
+        models.PurchaseOrder.status == "pendiente",
+    ).update({models.PurchaseOrder.status: "realizada", models.PurchaseOrder.completed_at: func.now()},
+             synchronize_session=False)
+
+    row = db.query(models.PurchaseOrder, models.Supplier.name).outerjoin(
+        models.Supplier, models.Supplier.id == models.PurchaseOrder.supplier_id
+    ).options(LINES).filter(
         models.PurchaseOrder.id == order_id,
         models.PurchaseOrder.user_id == current_user.id
-    )
-    order = order_query.first()
-
-    if not order:
+    ).first()
+    if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Orden no encontrada")
-
-    if order.status == "realizada":
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="La orden ya ha sido completada")
-
-    material = db.query(models.Material).filter(models.Material.id == order.material_id).first()
-    if not material:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material asociado no encontrado")
-
-    # Stock anterior
-    old_stock = material.stock
-
-    # Actualiza stock y estado
-    material.stock += order.quantity
-    order.status = "realizada"
-
-    db.commit()
-    db.refresh(order)
-    db.refresh(material)
-
-    # Registrar movimiento en Kardex
-    kardex_entry = models.Kardex(
-        movement_type="entrada",
-        quantity=order.quantity,
-        stock_anterior=old_stock,
-        stock_nuevo=material.stock,
-        observaciones=f"Orden de compra #{order.id} completada",
-        material_id=material.id,
-        user_id=current_user.id,
-    )
-    db.add(kardex_entry)
-    db.commit()
-    db.refresh(kardex_entry)
-
-    # Agregar nombre del proveedor
-    supplier = db.query(models.Supplier).filter(models.Supplier.id == order.supplier_id).first()
-    order.supplier_name = supplier.name if supplier else f"Proveedor ID: {order.supplier_id}"
-    order.user_name = current_user.username
+    if not changed:
+        order = row[0]
+        if order.status == "realizada":
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="La orden ya ha sido completada")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Solo se pueden completar órdenes pendientes")
+    order, supplier_name = row
+    with_names(order, supplier_name, current_user)
+    # La respuesta ya está completa: separarla de la sesión evita recargarla tras el commit
+    db.expunge(order)
+
+    # Todas las cantidades y costos promedio en un UPDATE y todos los movimientos en un INSERT
+    deltas, costs = {}, {}
+    for line in order.lines:
+        deltas[line.material_id] = deltas.get(line.material_id, 0) + line.quantity
+        costs[line.material_id] = line.unit_cost
+    if not deltas and order.material_id is not None:
+        deltas[order.material_id] = order.quantity or 0
+        costs[order.material_id] = order.unit_cost
+    materials = apply_movements(db, "material", deltas,
+                                f"Orden de compra #{order_id} completada", current_user.id, costs)
+    for material in materials:
+        low_stock.update("material", material)
+    supplier_stats.mark(order.supplier_id)
     return order
 
 # 🔹 Cancelar una orden de compra
@@ -148,13 +209,16 @@ def cancel_order(
         )
 
     # Cambiar estado a cancelada (NO afecta el stock)
-    order.status = "cancelada"
+    order_query.update({models.PurchaseOrder.status: "cancelada", models.PurchaseOrder.cancelled_at: func.now()},
+                       synchronize_session=False)
+    # Leído antes del commit, que expira la orden
+    supplier_id = order.supplier_id
 
     db.commit()
-    db.refresh(order)
+    supplier_stats.mark(supplier_id)
 
-    # Agregar nombre del proveedor para la respuesta
-    supplier = db.query(models.Supplier).filter(models.Supplier.id == order.supplier_id).first()
-    order.supplier_name = supplier.name if supplier else f"Proveedor ID: {order.supplier_id}"
-    order.user_name = current_user.username
-    return order
\ No newline at end of file
+    # Releer la orden con el nombre del proveedor y sus ítems en una consulta
+    order, supplier_name = order_query.add_columns(models.Supplier.name).outerjoin(
+        models.Supplier, models.Supplier.id == models.PurchaseOrder.supplier_id
+    ).options(LINES).populate_existing().one()
+    return with_names(order, supplier_name, current_user)
\ No newline at end of file
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app import models, schemas
+from app.costing import valuation
+from app.database import get_db
+from app.reports import MAX_REPORT_MONTHS, abc_report, parse_period
+from app.routers.auth import get_current_user
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["reports"]
+)
+
+
+# 🔹 Clasificación ABC y rotación de inventario por período (meses YYYY-MM)
+@router.get("/abc", response_model=schemas.AbcReportOut)
+def get_abc_report(
+    kind: str = Query("product", pattern="^(product|material)$"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    try:
+        start_month, end_month = parse_period(start, end, MAX_REPORT_MONTHS)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
+    return abc_report(db, kind, start_month, end_month)
+
+
+# 🔹 Valorización del inventario: stock por costo promedio ponderado de cada ítem
+@router.get("/valuation", response_model=schemas.ValuationOut)
+def get_valuation(
+    kind: Optional[str] = Query(None, pattern="^(product|material)$"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Valor actual del inventario (materiales, productos o ambos) en una consulta
+    sobre el catálogo, sin recorrer el kardex.
+    """
+    return valuation(db, kind)
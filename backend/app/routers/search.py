@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List, Optional
+
+from app import models, schemas
+from app.routers.auth import get_current_user
+from app.search import catalog_search
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"]
+)
+
+
+# 🔹 Búsqueda en el catálogo (nombre, tipo, color y datos de contacto) con tolerancia a errores
+@router.get("/", response_model=List[schemas.SearchResult])
+def search_catalog(
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: Optional[str] = Query(None, pattern="^(material|product|supplier)$"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Responde desde el índice en memoria: no consulta la base (salvo la autenticación).
+    Todas las palabras deben coincidir, exactas, como prefijo o con errores de tipeo.
+    """
+    return catalog_search.search(q, kind=kind, limit=limit)
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import literal, select, union_all
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app import models, schemas
+from app.batch import parse_ids, report_missing
 from app.database import get_db
+from app.queries import get_by_id
 from app.routers.auth import get_current_user
+from app.search import catalog_search
+from app.supplier_materials import load_suppliers, material_names, requested_materials, set_materials, with_materials
+from app.supplier_stats import supplier_stats
 
 router = APIRouter(
     prefix="/suppliers",
@@ -12,20 +18,60 @@ router = APIRouter(
 )
 
 
-# 🔹 Obtener todos los proveedores
+# 🔹 Obtener todos los proveedores (o solo los de ?ids=1,2,3)
 @router.get("/", response_model=List[schemas.SupplierOut])
 def get_suppliers(
+    response: Response,
+    ids: Optional[str] = Query(None, description="ids separados por comas"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    suppliers = db.query(models.Supplier).all()
-    for s in suppliers:
-        if s.material_id:
-            material = db.query(models.Material).filter(models.Material.id == s.material_id).first()
-            s.material_name = material.name if material else None
+    requested = parse_ids(ids)
+    if requested == []:
+        suppliers = []
+    elif requested is not None:
+        suppliers = load_suppliers(db, models.Supplier.id.in_(requested))
+    else:
+        suppliers = load_suppliers(db)
+    if requested is not None:
+        return report_missing(response, requested, suppliers)
     return suppliers
 
 
+# 🔹 Lead time, fill rate y cancelaciones por proveedor y material (o solo los de ?ids=1,2,3)
+@router.get("/analytics", response_model=List[schemas.SupplierStatsOut])
+def get_supplier_analytics(
+    ids: Optional[str] = Query(None, description="ids separados por comas"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    requested = parse_ids(ids)
+    stats = supplier_stats.get(db, requested)
+    if not stats:
+        return []
+
+    # Nombres al día (los indicadores en memoria solo guardan ids) en una consulta
+    material_ids = {m["material_id"] for s in stats.values() for m in s["materials"]}
+    names = db.execute(union_all(
+        select(literal("supplier").label("kind"), models.Supplier.id, models.Supplier.name)
+        .where(models.Supplier.id.in_(stats)),
+        select(literal("material"), models.Material.id, models.Material.name)
+        .where(models.Material.id.in_(material_ids)),
+    )).all()
+    supplier_names = {item_id: name for kind, item_id, name in names if kind == "supplier"}
+    material_names = {item_id: name for kind, item_id, name in names if kind == "material"}
+
+    # Los proveedores eliminados no se informan
+    return [
+        {
+            **s,
+            "supplier_name": supplier_names[supplier_id],
+            "materials": [{**m, "material_name": material_names.get(m["material_id"])} for m in s["materials"]],
+        }
+        for supplier_id, s in sorted(stats.items()) if supplier_id in supplier_names
+    ]
+
+
 # 🔹 Obtener un proveedor por ID
 @router.get("/{supplier_id}", response_model=schemas.SupplierOut)
 def get_supplier(
@@ -33,15 +79,17 @@ def get_supplier(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    supplier = db.query(models.Supplier).filter(models.Supplier.id == supplier_id).first()
-    if not supplier:
+    suppliers = load_suppliers(db, models.Supplier.id == supplier_id)
+    if not suppliers:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Proveedor no encontrado")
+    return suppliers[0]
 
-    if supplier.material_id:
-        material = db.query(models.Material).filter(models.Material.id == supplier.material_id).first()
-        supplier.material_name = material.name if material else None
 
-    return supplier
+def _suppliers_for_material(db: Session, material_id: int):
+    suppliers = load_suppliers(db, material_id=material_id)
+    if not suppliers:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No hay proveedores para este material")
+    return suppliers
 
 
 # 🔹 Obtener proveedores filtrados por material
@@ -55,15 +103,7 @@ def get_suppliers_by_material(
     Devuelve solo los proveedores que están asociados a un material específico.
     Ideal para usar en el paso de selección de proveedor al crear una orden de compra.
     """
-    suppliers = db.query(models.Supplier).filter(models.Supplier.material_id == material_id).all()
-    if not suppliers:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No hay proveedores para este material")
-
-    for s in suppliers:
-        material = db.query(models.Material).filter(models.Material.id == s.material_id).first()
-        s.material_name = material.name if material else None
-
-    return suppliers
+    return _suppliers_for_material(db, material_id)
 
 
 # 🔹 Alias para que el frontend pueda llamar a /materials/{id}/suppliers
@@ -76,18 +116,18 @@ def get_suppliers_for_material(
     """
     Alias de /by-material/{material_id}, necesario porque el frontend espera esta ruta.
     """
-    suppliers = db.query(models.Supplier).filter(models.Supplier.material_id == material_id).all()
-    if not suppliers:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No hay proveedores para este material")
+    return _suppliers_for_material(db, material_id)
 
-    for s in suppliers:
-        material = db.query(models.Material).filter(models.Material.id == s.material_id).first()
-        s.material_name = material.name if material else None
 
-    return suppliers
+def _validated_materials(db: Session, material_ids):
+    """{id: nombre} de los materiales pedidos; 404 si alguno no existe."""
+    names = material_names(db, material_ids)
+    if len(names) != len(material_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
+    return names
 
 
-# 🔹 Crear un nuevo proveedor
+# 🔹 Crear un nuevo proveedor (con material_id o con la lista material_ids)
 @router.post("/", response_model=schemas.SupplierOut, status_code=status.HTTP_201_CREATED)
 def create_supplier(
     supplier: schemas.SupplierCreate,
@@ -98,9 +138,8 @@ def create_supplier(
     if existing_supplier:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ya existe un proveedor con este nombre")
 
-    material = db.query(models.Material).filter(models.Material.id == supplier.material_id).first()
-    if not material:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
+    material_ids = requested_materials(supplier.dict()) or []
+    names = _validated_materials(db, material_ids)
 
     new_supplier = models.Supplier(
         name=supplier.name,
@@ -108,18 +147,20 @@ def create_supplier(
         phone=supplier.phone,
         email=supplier.email,
         address=supplier.address,
-        material_id=supplier.material_id
+        # El material principal es el indicado o el primero de la lista
+        material_id=supplier.material_id if supplier.material_id in names else (material_ids[0] if material_ids else None),
+        material_links=[models.SupplierMaterial(material_id=material_id) for material_id in material_ids],
     )
 
     db.add(new_supplier)
     db.commit()
     db.refresh(new_supplier)
+    catalog_search.update("supplier", new_supplier)
 
-    new_supplier.material_name = material.name
-    return new_supplier
+    return with_materials(new_supplier, [(material_id, names[material_id]) for material_id in sorted(material_ids)])
 
 
-# 🔹 Actualizar proveedor existente
+# 🔹 Actualizar proveedor existente (material_ids reemplaza la lista de materiales)
 @router.put("/{supplier_id}", response_model=schemas.SupplierOut)
 def update_supplier(
     supplier_id: int,
@@ -127,7 +168,7 @@ def update_supplier(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    db_supplier = db.query(models.Supplier).filter(models.Supplier.id == supplier_id).first()
+    db_supplier = get_by_id(db, models.Supplier, supplier_id)
     if not db_supplier:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Proveedor no encontrado")
 
@@ -139,24 +180,77 @@ def update_supplier(
         if existing_supplier:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ya existe otro proveedor con este nombre")
 
-    if supplier.material_id:
-        material = db.query(models.Material).filter(models.Material.id == supplier.material_id).first()
-        if not material:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Material no encontrado")
-        db_supplier.material_id = supplier.material_id
-
     update_data = supplier.dict(exclude_unset=True)
+    material_ids = update_data.pop("material_ids", None)
+    if material_ids is not None:
+        material_ids = requested_materials({"material_ids": material_ids})
+        names = _validated_materials(db, material_ids)
+        if update_data.get("material_id", db_supplier.material_id) not in names:
+            # Un material principal que ya no está en la lista se reemplaza por el primero
+            update_data["material_id"] = material_ids[0] if material_ids else None
+        set_materials(db, supplier_id, material_ids)
+    elif update_data.get("material_id"):
+        # Solo material_id (clientes anteriores): pasa a ser el principal y se agrega a la lista
+        _validated_materials(db, [update_data["material_id"]])
+        set_materials(db, supplier_id, None, add=[update_data["material_id"]])
+    else:
+        update_data.pop("material_id", None)
+
     for key, value in update_data.items():
         setattr(db_supplier, key, value)
 
     db.commit()
-    db.refresh(db_supplier)
+    catalog_search.update("supplier", db_supplier)
 
-    if db_supplier.material_id:
-        material = db.query(models.Material).filter(models.Material.id == db_supplier.material_id).first()
-        db_supplier.material_name = material.name
+    return load_suppliers(db, models.Supplier.id == supplier_id)[0]
 
-    return db_supplier
+
+# 🔹 Agregar un material a un proveedor
+@router.post("/{supplier_id}/materials/{material_id}", response_model=schemas.SupplierOut)
+def add_supplier_material(
+    supplier_id: int,
+    material_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    supplier = get_by_id(db, models.Supplier, supplier_id)
+    if not supplier:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Proveedor no encontrado")
+    _validated_materials(db, [material_id])
+
+    set_materials(db, supplier_id, None, add=[material_id])
+    if supplier.material_id is None:
+        supplier.material_id = material_id
+    db.commit()
+    return load_suppliers(db, models.Supplier.id == supplier_id)[0]
+
+
+# 🔹 Quitar un material de un proveedor
+@router.delete("/{supplier_id}/materials/{material_id}", response_model=schemas.SupplierOut)
+def remove_supplier_material(
+    supplier_id: int,
+    material_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    supplier = get_by_id(db, models.Supplier, supplier_id)
+    if not supplier:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Proveedor no encontrado")
+
+    removed = db.query(models.SupplierMaterial).filter(
+        models.SupplierMaterial.supplier_id == supplier_id,
+        models.SupplierMaterial.material_id == material_id,
+    ).delete(synchronize_session=False)
+    if not removed:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="El proveedor no tiene este material")
+    if supplier.material_id == material_id:
+        # El nuevo material principal es el de menor id que quede, si hay
+        remaining = db.query(models.SupplierMaterial.material_id).filter(
+            models.SupplierMaterial.supplier_id == supplier_id
+        ).order_by(models.SupplierMaterial.material_id).first()
+        supplier.material_id = remaining[0] if remaining else None
+    db.commit()
+    return load_suppliers(db, models.Supplier.id == supplier_id)[0]
 
 
 # 🔹 Eliminar un proveedor
@@ -166,10 +260,12 @@ def delete_supplier(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    db_supplier = db.query(models.Supplier).filter(models.Supplier.id == supplier_id).first()
+    db_supplier = get_by_id(db, models.Supplier, supplier_id)
     if not db_supplier:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Proveedor no encontrado")
 
     db.delete(db_supplier)
     db.commit()
+    catalog_search.remove("supplier", supplier_id)
+    supplier_stats.mark(supplier_id)
     return {"message": "Proveedor eliminado correctamente"}
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional, List
+from datetime import date, datetime
+from typing import Any, Dict, Optional, List
 
 # -------- USERS --------
 class UserBase(BaseModel):
@@ -26,17 +26,59 @@ class SupplierBase(BaseModel):
 
 class SupplierCreate(SupplierBase):
     material_id: Optional[int] = None  # Ahora puede ser NULL
+    # Materiales que ofrece; sin material_ids se usa material_id
+    material_ids: Optional[List[int]] = None
 
 class SupplierUpdate(SupplierBase):
     material_id: Optional[int] = None
+    # Reemplaza la lista completa de materiales del proveedor
+    material_ids: Optional[List[int]] = None
 
-class SupplierOut(SupplierBase):
+class SupplierMaterialOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+
+class SupplierSummary(SupplierBase):
     id: int
     material_id: Optional[int] = None  # Puede ser NULL
 
     class Config:
         orm_mode = True
 
+class SupplierOut(SupplierSummary):
+    material_name: Optional[str] = None
+    material_ids: List[int] = Field(default_factory=list)
+    materials: List[SupplierMaterialOut] = Field(default_factory=list)
+
+
+class LeadTimeStats(BaseModel):
+    samples: int = 0
+    mean: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p95: Optional[float] = None
+
+class FulfillmentStats(BaseModel):
+    orders: int = 0
+    pending: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    quantity_ordered: int = 0
+    quantity_received: int = 0
+    fill_rate: Optional[float] = None
+    cancellation_ratio: Optional[float] = None
+    lead_time_days: LeadTimeStats = Field(default_factory=LeadTimeStats)
+
+class SupplierMaterialStats(FulfillmentStats):
+    material_id: int
+    material_name: Optional[str] = None
+
+class SupplierStatsOut(FulfillmentStats):
+    supplier_id: int
+    supplier_name: Optional[str] = None
+    computed_at: datetime
+    materials: List[SupplierMaterialStats] = Field(default_factory=list)
+
 
 # -------- MATERIALS --------
 class MaterialBase(BaseModel):
@@ -45,6 +87,8 @@ class MaterialBase(BaseModel):
     color: Optional[str] = None
     stock: Optional[int] = 0
     min_stock: Optional[int] = 0
+    # Costo promedio por unidad; al crear, el costo del stock inicial
+    avg_cost: float = Field(0.0, ge=0)
 
 class MaterialCreate(MaterialBase):
     pass
@@ -55,10 +99,15 @@ class MaterialUpdate(BaseModel):
     color: Optional[str] = None
     stock: Optional[int] = None
     min_stock: Optional[int] = None
+    avg_cost: Optional[float] = Field(None, ge=0)  # Revalorización manual del costo promedio
+    version_id: Optional[int] = None  # Versión leída por el cliente (alternativa a If-Match)
+    stock_shards: Optional[int] = None  # Contadores parciales para ítems muy movidos (0 desactiva)
 
 class MaterialOut(MaterialBase):
     id: int
-    suppliers: List[SupplierOut] = Field(default_factory=list)
+    version_id: Optional[int] = None
+    stock_shards: Optional[int] = 0
+    suppliers: List[SupplierSummary] = Field(default_factory=list)
 
     class Config:
         orm_mode = True
@@ -72,6 +121,7 @@ class ProductBase(BaseModel):
     stock: Optional[int] = 0
     min_stock: Optional[int] = 0
     sale_price: Optional[float] = None
+    avg_cost: float = Field(0.0, ge=0)
 
 class ProductCreate(ProductBase):
     pass
@@ -83,9 +133,14 @@ class ProductUpdate(BaseModel):
     stock: Optional[int] = None
     min_stock: Optional[int] = None
     sale_price: Optional[float] = None
+    avg_cost: Optional[float] = Field(None, ge=0)
+    version_id: Optional[int] = None  # Versión leída por el cliente (alternativa a If-Match)
+    stock_shards: Optional[int] = None
 
 class ProductOut(ProductBase):
     id: int
+    version_id: Optional[int] = None
+    stock_shards: Optional[int] = 0
 
     class Config:
         orm_mode = True
@@ -96,9 +151,24 @@ class PurchaseOrderBase(BaseModel):
     supplier_id: Optional[int] = None
     material_id: Optional[int] = None
     quantity: Optional[int] = None
+    unit_cost: Optional[float] = Field(None, ge=0)
+
+class PurchaseOrderLineIn(BaseModel):
+    material_id: int
+    quantity: int = Field(..., gt=0)
+    # Sin costo, la recepción entra al costo promedio vigente
+    unit_cost: Optional[float] = Field(None, ge=0)
+
+class PurchaseOrderLineOut(PurchaseOrderLineIn):
+    id: int
+    material_name: Optional[str] = None
+
+    class Config:
+        orm_mode = True
 
 class PurchaseOrderCreate(PurchaseOrderBase):
-    pass
+    # Orden de varios ítems; sin lines se usa material_id/quantity (un solo ítem)
+    lines: Optional[List[PurchaseOrderLineIn]] = None
 
 class PurchaseOrderUpdate(PurchaseOrderBase):
     status: Optional[str] = None
@@ -107,14 +177,79 @@ class PurchaseOrderOut(PurchaseOrderBase):
     id: int
     date: Optional[datetime] = None
     status: Optional[str] = None
+    completed_at: Optional[datetime] = None
+    cancelled_at: Optional[datetime] = None
     supplier_name: Optional[str] = None
     user_name: Optional[str] = None
     user_id: int
+    lines: List[PurchaseOrderLineOut] = Field(default_factory=list)
 
     class Config:
         orm_mode = True
 
 
+# -------- LISTA DE MATERIALES Y PRODUCCIÓN --------
+class BomLineIn(BaseModel):
+    material_id: int
+    # Cantidad de material por unidad de producto
+    quantity: int = Field(..., gt=0)
+
+class BomLineOut(BomLineIn):
+    id: int
+    material_name: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+class ProductionOrderCreate(BaseModel):
+    product_id: int
+    quantity: int = Field(..., gt=0)
+
+class ProductionOrderLineOut(BaseModel):
+    id: int
+    material_id: int
+    material_name: Optional[str] = None
+    quantity: int
+
+    class Config:
+        orm_mode = True
+
+class ProductionOrderOut(BaseModel):
+    id: int
+    date: Optional[datetime] = None
+    product_id: int
+    product_name: Optional[str] = None
+    quantity: int
+    user_id: int
+    user_name: Optional[str] = None
+    lines: List[ProductionOrderLineOut] = Field(default_factory=list)
+
+    class Config:
+        orm_mode = True
+
+
+class ReorderSuggestionItem(BaseModel):
+    material_id: int
+    material_name: Optional[str] = None
+    stock: int = 0
+    min_stock: int = 0
+    pending_quantity: int = 0
+    daily_consumption: float = 0.0
+    daily_std: float = 0.0
+    reorder_point: float = 0.0
+    suggested_quantity: int = 0
+
+class SupplierSuggestions(BaseModel):
+    supplier_id: int
+    supplier_name: Optional[str] = None
+    items: List[ReorderSuggestionItem] = Field(default_factory=list)
+
+class ReorderSuggestionsOut(BaseModel):
+    generated_at: datetime
+    suppliers: List[SupplierSuggestions] = Field(default_factory=list)
+    without_supplier: List[ReorderSuggestionItem] = Field(default_factory=list)
+
+
 # -------- KARDEX --------
 class KardexBase(BaseModel):
     movement_type: Optional[str] = None
@@ -122,6 +257,7 @@ class KardexBase(BaseModel):
     stock_anterior: Optional[int] = None
     stock_nuevo: Optional[int] = None
     observaciones: Optional[str] = None
+    unit_cost: Optional[float] = None
     material_id: Optional[int] = None
     product_id: Optional[int] = None
     user_id: Optional[int] = None
@@ -139,3 +275,164 @@ class KardexOut(KardexBase):
     class Config:
         orm_mode = True
 
+
+
+class ReconcileIssue(BaseModel):
+    kind: str
+    item_id: int
+    type: str
+    kardex_id: Optional[int] = None
+    expected: Optional[int] = None
+    found: Optional[int] = None
+
+class ReconcileOut(BaseModel):
+    run_id: int
+    from_kardex_id: int
+    to_kardex_id: int
+    movements: int
+    items: int
+    issue_count: int
+    issues: List[ReconcileIssue] = Field(default_factory=list)
+
+
+class ArchiveMonthOut(BaseModel):
+    month: str  # YYYY-MM
+    rows: int
+
+class ArchiveOut(BaseModel):
+    cutoff: date
+    months: List[ArchiveMonthOut] = Field(default_factory=list)
+    moved: int
+
+
+# -------- IMPORTACIÓN --------
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str] = Field(default_factory=list)
+
+class ImportOut(BaseModel):
+    kind: str
+    rows: int
+    inserted: int
+    error_count: int
+    errors: List[ImportRowError] = Field(default_factory=list)
+    errors_truncated: bool = False
+    # Lectura interrumpida tras insertar bloques: lo informado en inserted quedó guardado
+    read_error: Optional[str] = None
+
+# -------- BÚSQUEDA --------
+class SearchResult(BaseModel):
+    kind: str
+    id: int
+    name: Optional[str] = None
+    type: Optional[str] = None
+    color: Optional[str] = None
+    contact_person: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    score: float = 0.0
+
+
+# -------- DASHBOARD --------
+class DashboardCounts(BaseModel):
+    materials: int = 0
+    products: int = 0
+    suppliers: int = 0
+    pending_orders: int = 0
+    low_stock_materials: int = 0
+    low_stock_products: int = 0
+
+class LowStockItem(BaseModel):
+    id: int
+    name: Optional[str] = None
+    stock: Optional[int] = None
+    min_stock: Optional[int] = None
+
+class PendingOrderSummary(BaseModel):
+    id: int
+    date: Optional[datetime] = None
+    quantity: Optional[int] = None
+    supplier_id: Optional[int] = None
+    supplier_name: Optional[str] = None
+    material_id: Optional[int] = None
+    material_name: Optional[str] = None
+
+class DashboardOut(BaseModel):
+    counts: DashboardCounts
+    low_stock_materials: List[LowStockItem] = Field(default_factory=list)
+    low_stock_products: List[LowStockItem] = Field(default_factory=list)
+    pending_orders: List[PendingOrderSummary] = Field(default_factory=list)
+    recent_movements: List[KardexOut] = Field(default_factory=list)
+
+
+# -------- ALERTAS DE STOCK BAJO --------
+class LowStockAlert(LowStockItem):
+    kind: str
+
+class LowStockPage(BaseModel):
+    total: int
+    skip: int
+    limit: int
+    items: List[LowStockAlert] = Field(default_factory=list)
+
+class LowStockEvent(LowStockAlert):
+    event: str
+    date: datetime
+
+
+# -------- REPORTES --------
+class AbcReportItem(BaseModel):
+    rank: int
+    id: int
+    name: Optional[str] = None
+    quantity_out: int = 0
+    value: float = 0.0
+    share: float = 0.0
+    cumulative_share: float = 0.0
+    abc_class: str
+    average_stock: float = 0.0
+    turnover: float = 0.0
+
+class AbcReportOut(BaseModel):
+    kind: str
+    start: str
+    end: str
+    generated_at: datetime
+    total_value: float = 0.0
+    items: List[AbcReportItem] = Field(default_factory=list)
+
+class ValuationItem(BaseModel):
+    kind: str
+    id: int
+    name: Optional[str] = None
+    stock: int = 0
+    avg_cost: float = 0.0
+    value: float = 0.0
+
+class ValuationOut(BaseModel):
+    kind: Optional[str] = None
+    generated_at: datetime
+    total_units: int = 0
+    total_value: float = 0.0
+    items: List[ValuationItem] = Field(default_factory=list)
+
+
+# -------- REPORTES EN SEGUNDO PLANO --------
+class JobCreate(BaseModel):
+    report: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+class JobOut(BaseModel):
+    id: int
+    report: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+    status: str
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    size: Optional[int] = None
+    error: Optional[str] = None
+    download_url: Optional[str] = None
+    # True si se devolvió un trabajo existente con los mismos parámetros y datos
+    reused: bool = False
@@ -0,0 +1,298 @@
+import bisect
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter
+from heapq import heappush, heapreplace, nlargest
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.coordination import change_events, item_keys
+
+logger = logging.getLogger(__name__)
+
+# Campos indexados por tipo y su peso en el ranking
+FIELDS = {
+    "material": {"name": 1.0, "type": 0.6, "color": 0.6},
+    "product": {"name": 1.0, "type": 0.6, "color": 0.6},
+    "supplier": {"name": 1.0, "contact_person": 0.5, "email": 0.4, "phone": 0.4, "address": 0.3},
+}
+MODELS = {
+    "material": models.Material,
+    "product": models.Product,
+    "supplier": models.Supplier,
+}
+EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.6
+MIN_SIMILARITY = 0.35
+MAX_PREFIX_TOKENS = 500
+# Hasta esta cantidad de candidatos se puntúan todos; con más se recorre el ranking
+DIRECT_SCORING = 2000
+# Palabras con más ítems que esto dejan su ranking armado al cargar
+PREBUILT_RANKING = 1000
+CHANNEL = "search"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text) -> str:
+    """Minúsculas y sin tildes, para que "Cristal Ámbar" coincida con "cristal ambar"."""
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode()
+    return text.lower()
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+
+def trigrams(token: str):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    Índice en memoria del catálogo (materiales, productos y proveedores).
+
+    Cada palabra de los campos indexados apunta a los ítems que la contienen con
+    el peso del campo. Las búsquedas resuelven cada palabra de la consulta contra
+    el vocabulario: coincidencia exacta, prefijo (búsqueda binaria sobre el
+    vocabulario ordenado) y similitud por trigramas para tolerar errores de
+    tipeo. Ningún paso recorre el catálogo completo ni consulta la base.
+
+    Con varios workers, cada cambio se publica para que los demás reindexen el ítem.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._docs = {}        # (kind, id) -> documento devuelto
+        self._doc_tokens = {}  # (kind, id) -> {palabra: peso}
+        self._postings = {}    # palabra -> {(kind, id): peso}
+        self._vocabulary = []  # palabras ordenadas, para prefijos
+        self._trigrams = {}    # trigrama -> {palabras}
+        self._ranked = {}      # palabra -> ítems ordenados por _rank (se arma en la primera búsqueda)
+
+    def load(self, db: Session):
+        with self._lock:
+            self._clear()
+            for kind, model in MODELS.items():
+                columns = [model.id] + [getattr(model, f) for f in FIELDS[kind]]
+                for row in db.query(*columns).yield_per(5000):
+                    self._add(kind, row.id, row._mapping)
+            for token, postings in self._postings.items():
+                if len(postings) >= PREBUILT_RANKING:
+                    self._ranking(token)
+        logger.info("Índice de búsqueda cargado: %d ítems, %d palabras", len(self._docs), len(self._postings))
+
+    def load_new(self, db: Session, kind: str, after_id: int):
+        """Indexa los ítems con id mayor a after_id (p. ej. después de una importación masiva)."""
+        self._load_rows(db, kind, MODELS[kind].id > after_id)
+        change_events.publish(CHANNEL, f"{kind}>{after_id}")
+
+    def update(self, kind: str, item):
+        """Reindexa un ítem después de crearlo o modificarlo."""
+        with self._lock:
+            self._remove((kind, item.id))
+            self._add(kind, item.id, {f: getattr(item, f, None) for f in FIELDS[kind]})
+        change_events.publish(CHANNEL, f"{kind}:{item.id}")
+
+    def remove(self, kind: str, item_id: int):
+        with self._lock:
+            self._remove((kind, item_id))
+        change_events.publish(CHANNEL, f"{kind}:{item_id}")
+
+    def refresh(self, db: Session, keys):
+        """Reindexa desde la base lo que cambió en otro worker (sin volver a publicarlo)."""
+        for key in keys:
+            kind, sep, after_id = key.partition(">")
+            if sep:
+                self._load_rows(db, kind, MODELS[kind].id > int(after_id))
+        for kind, ids in item_keys(keys).items():
+            found = self._load_rows(db, kind, MODELS[kind].id.in_(ids))
+            with self._lock:
+                for item_id in ids - found:
+                    self._remove((kind, item_id))
+        db.rollback()
+
+    def _load_rows(self, db: Session, kind: str, condition):
+        """Reindexa los ítems que cumplen la condición; devuelve sus ids."""
+        model = MODELS[kind]
+        columns = [model.id] + [getattr(model, f) for f in FIELDS[kind]]
+        found = set()
+        with self._lock:
+            for row in db.query(*columns).filter(condition).yield_per(5000):
+                self._remove((kind, row.id))
+                self._add(kind, row.id, row._mapping)
+                found.add(row.id)
+        return found
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _add(self, kind, item_id, values):
+        key = (kind, item_id)
+        weights = {}
+        for field, weight in FIELDS[kind].items():
+            for token in tokenize(values.get(field)):
+                if weight > weights.get(token, 0):
+                    weights[token] = weight
+        fields = {f: values.get(f) for f in FIELDS[kind]}
+        self._docs[key] = {"kind": kind, "id": item_id, **fields}
+        self._doc_tokens[key] = weights
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+                for gram in trigrams(token):
+                    self._trigrams.setdefault(gram, set()).add(token)
+            postings[key] = weight
+            ranked = self._ranked.get(token)
+            if ranked is not None:
+                bisect.insort(ranked, key, key=lambda k: self._rank(k, postings[k]))
+
+    def _remove(self, key):
+        for token, weight in self._doc_tokens.pop(key, {}).items():
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            ranked = self._ranked.get(token)
+            if ranked is not None:
+                i = bisect.bisect_left(ranked, self._rank(key, weight), key=lambda k: self._rank(k, postings[k]))
+                if i < len(ranked) and ranked[i] == key:
+                    del ranked[i]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[token]
+                self._ranked.pop(token, None)
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+                for gram in trigrams(token):
+                    tokens = self._trigrams.get(gram)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._trigrams[gram]
+        self._docs.pop(key, None)
+
+    def _matches(self, term: str):
+        """Palabras del vocabulario que coinciden con el término: {palabra: puntaje}."""
+        matches = {}
+        if term in self._postings:
+            matches[term] = EXACT
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:start + MAX_PREFIX_TOKENS]:
+            if not token.startswith(term):
+                break
+            matches.setdefault(token, PREFIX)
+        # Tolerancia a errores de tipeo solo si no hubo coincidencia exacta ni de prefijo
+        if not matches and len(term) >= 3 and not term.isdigit():
+            grams = trigrams(term)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._trigrams.get(gram, ()))
+            for token, count in shared.items():
+                similarity = count / (len(grams) + len(trigrams(token)) - count)
+                if similarity >= MIN_SIMILARITY:
+                    matches[token] = FUZZY * similarity
+        return matches
+
+    def _rank(self, key, weight):
+        return -weight, len(self._docs[key]["name"] or ""), key
+
+    def _ranking(self, token: str):
+        """Ítems de la palabra ordenados por peso, nombre más corto e id; se mantiene al reindexar."""
+        ranked = self._ranked.get(token)
+        if ranked is None:
+            postings = self._postings[token]
+            ranked = sorted(postings, key=lambda k: self._rank(k, postings[k]))
+            self._ranked[token] = ranked
+        return ranked
+
+    def _term_scores(self, term_matches, candidates):
+        """Mejor puntaje de un término para cada candidato, por el camino más barato."""
+        scores = {}
+        if sum(len(self._postings[t]) for t in term_matches) <= len(candidates) * len(term_matches):
+            for token, match in term_matches.items():
+                for key, weight in self._postings[token].items():
+                    if key in candidates and match * weight > scores.get(key, 0):
+                        scores[key] = match * weight
+        else:
+            for key in candidates:
+                scores[key] = max(m * self._postings[t].get(key, 0) for t, m in term_matches.items())
+        return scores
+
+    def search(self, q: str, kind: str = None, limit: int = 20):
+        """Ítems que coinciden con todas las palabras de la consulta, mejor puntaje primero."""
+        terms = list(dict.fromkeys(tokenize(q)))
+        if not terms:
+            return []
+        with self._lock:
+            matches = [self._matches(term) for term in terms]
+            if not all(matches):
+                return []
+            matches.sort(key=lambda m: sum(len(self._postings[t]) for t in m))
+            driver, others = matches[0], matches[1:]
+
+            # Ítems que contienen todas las palabras: se parte de la más selectiva
+            candidates = None
+            if others or sum(len(self._postings[t]) for t in driver) <= DIRECT_SCORING:
+                candidates = set().union(*(self._postings[t].keys() for t in driver))
+                for m in others:
+                    if len(m) == 1:
+                        # La vista de claves intersecta recorriendo el lado más chico
+                        candidates = self._postings[next(iter(m))].keys() & candidates
+                    else:
+                        candidates = {k for k in candidates if any(k in self._postings[t] for t in m)}
+                    if not candidates:
+                        return []
+                if kind is not None:
+                    candidates = {key for key in candidates if key[0] == kind}
+
+            if candidates is not None and len(candidates) <= DIRECT_SCORING:
+                totals = dict.fromkeys(candidates, 0)
+                for m in matches:
+                    for key, value in self._term_scores(m, candidates).items():
+                        totals[key] += value
+            else:
+                # Muchos candidatos: recorrer la palabra más selectiva en orden de ranking
+                # y cortar cuando los siguientes ya no pueden entrar entre los mejores
+                others_max = sum(max(m.values()) for m in others)
+                # Términos con pocas palabras se puntúan al vuelo; los demás, de una vez
+                other_scores = [self._term_scores(m, candidates) if len(m) > 4 else m for m in others]
+                totals = {}
+                for token, match in sorted(driver.items(), key=lambda kv: -kv[1]):
+                    postings = self._postings[token]
+                    best = []  # los `limit` mejores totales de esta palabra (heap mínimo)
+                    for key in self._ranking(token):
+                        partial = match * postings[key]
+                        if len(best) >= limit and partial + others_max <= best[0]:
+                            break
+                        if candidates is None:
+                            if kind is not None and key[0] != kind:
+                                continue
+                        elif key not in candidates:
+                            continue
+                        total = partial
+                        for scores, m in zip(other_scores, others):
+                            total += scores[key] if scores is not m else \
+                                max(match * self._postings[t].get(key, 0) for t, match in m.items())
+                        if total > totals.get(key, 0):
+                            totals[key] = total
+                        if len(best) < limit:
+                            heappush(best, total)
+                        elif total > best[0]:
+                            heapreplace(best, total)
+
+            ranked = nlargest(
+                limit, totals.items(),
+                key=lambda kv: (kv[1], -len(self._docs[kv[0]]["name"] or ""), -kv[0][1]),
+            )
+            return [{**self._docs[key], "score": round(score / len(terms), 4)} for key, score in ranked]
+
+
+catalog_search = SearchIndex()
+change_events.subscribe(CHANNEL, catalog_search.refresh)
@@ -0,0 +1,255 @@
+"""
+Contadores de stock fraccionados para materiales y productos muy movidos.
+
+Con stock_shards = N > 0 los ingresos y salidas no actualizan la fila del ítem
+(que todos los escritores tendrían que bloquear) sino uno de N contadores
+parciales elegido al azar, y el movimiento se registra en el kardex sin
+stock_anterior/stock_nuevo. El stock efectivo es stock + suma de los deltas.
+
+Un compactador en segundo plano bloquea el ítem y sus contadores, completa la
+cadena del kardex en orden de id (stock y costo promedio), suma los deltas al
+stock y los deja en cero.
+"""
+import logging
+import os
+import random
+import threading
+
+from fastapi import HTTPException
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import models
+from app.cache import TTLCache
+from app.costing import weighted_average
+
+logger = logging.getLogger(__name__)
+
+MODELS = {
+    "material": models.Material,
+    "product": models.Product,
+}
+SHARD_COLUMNS = {
+    "material": models.StockShard.material_id,
+    "product": models.StockShard.product_id,
+}
+KARDEX_COLUMNS = {
+    "material": models.Kardex.material_id,
+    "product": models.Kardex.product_id,
+}
+SIGNS = {"entrada": 1, "salida": -1}
+
+MAX_SHARDS = 64
+COMPACT_INTERVAL = float(os.getenv("STOCK_COMPACT_INTERVAL", "5"))
+# Suma de deltas por ítem; las lecturas toleran un segundo de atraso
+pending_cache = TTLCache(ttl=float(os.getenv("STOCK_SHARD_CACHE_TTL", "1")), maxsize=10000)
+
+
+def configure(db: Session, kind: str, item, count: int):
+    """Cambia la cantidad de contadores de un ítem (0 desactiva). No hace commit."""
+    if count < 0 or count > MAX_SHARDS:
+        raise HTTPException(status_code=400, detail=f"stock_shards debe estar entre 0 y {MAX_SHARDS}")
+    if item.stock_shards:
+        compact_item(db, kind, item.id)
+    column = SHARD_COLUMNS[kind]
+    db.query(models.StockShard).filter(column == item.id).delete(synchronize_session=False)
+    for shard in range(count):
+        db.add(models.StockShard(**{column.key: item.id}, shard=shard, delta=0, movements=0))
+    item.stock_shards = count
+    pending_cache.invalidate((kind, item.id))
+
+
+def _pending(db: Session, kind: str, ids):
+    column = SHARD_COLUMNS[kind]
+    rows = db.query(column, func.sum(models.StockShard.delta)).filter(column.in_(ids)).group_by(column).all()
+    return {item_id: delta or 0 for item_id, delta in rows}
+
+
+def overlay(db: Session, kind: str, items, fresh: bool = False):
+    """
+    Reemplaza item.stock por el stock efectivo en los ítems fraccionados sin
+    marcarlos como modificados. Una sola consulta para los que no estén en caché.
+    """
+    sharded = [item for item in items if item.stock_shards]
+    if not sharded:
+        return items
+    deltas = {}
+    missing = []
+    for item in sharded:
+        cached = None if fresh else pending_cache.get((kind, item.id))
+        if cached is None:
+            missing.append(item.id)
+        else:
+            deltas[item.id] = cached
+    if missing:
+        fetched = _pending(db, kind, missing)
+        for item_id in missing:
+            deltas[item_id] = fetched.get(item_id, 0)
+            pending_cache.set((kind, item_id), deltas[item_id])
+    for item in sharded:
+        set_committed_value(item, "stock", (item.stock or 0) + deltas[item.id])
+    return items
+
+
+def record_movement(db: Session, kind: str, item, movement_type: str, quantity: int,
+                    observaciones: str, user_id: int, commit: bool = True, unit_cost: float = None):
+    """
+    Aplica el movimiento en un contador parcial y lo registra en el kardex en la
+    misma transacción. El costo promedio no se toca (lo actualiza la compactación
+    con el unit_cost de las entradas). Devuelve el ítem con el stock efectivo.
+    """
+    delta = SIGNS[movement_type] * quantity
+    if movement_type == "salida":
+        # Con contadores repartidos la verificación no bloquea a los demás escritores:
+        # dos salidas simultáneas pueden dejar el stock levemente negativo
+        overlay(db, kind, [item], fresh=True)
+        if item.stock < quantity:
+            raise HTTPException(status_code=400, detail="Stock insuficiente")
+
+    updated = db.query(models.StockShard).filter(
+        SHARD_COLUMNS[kind] == item.id,
+        models.StockShard.shard == random.randrange(item.stock_shards),
+    ).update({
+        models.StockShard.delta: models.StockShard.delta + delta,
+        models.StockShard.movements: models.StockShard.movements + 1,
+    }, synchronize_session=False)
+    if not updated:
+        raise HTTPException(status_code=409, detail="Contadores de stock no inicializados")
+
+    db.add(models.Kardex(
+        movement_type=movement_type,
+        quantity=quantity,
+        observaciones=observaciones,
+        unit_cost=unit_cost if movement_type == "entrada" else None,
+        user_id=user_id,
+        **{KARDEX_COLUMNS[kind].key: item.id},
+    ))
+    if commit:
+        db.commit()
+    pending_cache.invalidate((kind, item.id))
+    db.refresh(item)
+    return overlay(db, kind, [item], fresh=True)[0]
+
+
+def compact_item(db: Session, kind: str, item_id: int):
+    """
+    Suma los contadores al stock del ítem, completa stock_anterior/stock_nuevo y el
+    costo de sus movimientos pendientes y actualiza el costo promedio. Bloquea el ítem y todos sus contadores, así que
+    ningún escritor queda a mitad de camino. No hace commit.
+    """
+    model = MODELS[kind]
+    item = db.query(model).filter(model.id == item_id).with_for_update().populate_existing().first()
+    if item is None:
+        return None
+    # Escribir primero sobre los contadores: en MySQL bloquea sus filas y en SQLite
+    # (que ignora FOR UPDATE) toma el lock de escritura, así ningún movimiento se
+    # confirma entre la lectura de los contadores y la del kardex
+    db.query(models.StockShard).filter(SHARD_COLUMNS[kind] == item_id).update(
+        {models.StockShard.movements: models.StockShard.movements}, synchronize_session=False
+    )
+    shards = db.query(models.StockShard).filter(
+        SHARD_COLUMNS[kind] == item_id
+    ).order_by(models.StockShard.shard).with_for_update().populate_existing().all()
+    if not any(s.movements for s in shards):
+        return item
+
+    pending = db.query(models.Kardex).filter(
+        KARDEX_COLUMNS[kind] == item_id,
+        models.Kardex.stock_nuevo.is_(None),
+    ).order_by(models.Kardex.id).with_for_update().all()
+    stock = item.stock or 0
+    avg_cost = item.avg_cost or 0.0
+    for movement in pending:
+        movement.stock_anterior = stock
+        # Entradas con costo actualizan el promedio; el resto se registra al promedio vigente
+        if movement.movement_type == "entrada" and movement.unit_cost is not None:
+            avg_cost = weighted_average(stock, avg_cost, movement.quantity or 0, movement.unit_cost)
+        else:
+            movement.unit_cost = avg_cost
+        stock += SIGNS.get(movement.movement_type, 0) * (movement.quantity or 0)
+        movement.stock_nuevo = stock
+
+    new_stock = (item.stock or 0) + sum(s.delta for s in shards)
+    if stock != new_stock:
+        logger.warning("Contadores de %s %s no coinciden con el kardex: %s vs %s",
+                       kind, item_id, new_stock, stock)
+    # El stock efectivo no cambia, así que no se incrementa version_id: compactar
+    # no debe invalidar la versión que un cliente leyó
+    db.query(model).filter(model.id == item_id).update(
+        {model.stock: new_stock, model.avg_cost: avg_cost}, synchronize_session=False
+    )
+    set_committed_value(item, "stock", new_stock)
+    set_committed_value(item, "avg_cost", avg_cost)
+    for s in shards:
+        s.delta = 0
+        s.movements = 0
+    pending_cache.invalidate((kind, item_id))
+    return item
+
+
+def pending_items(db: Session):
+    """Ítems con movimientos sin compactar: [(kind, id), ...]."""
+    result = []
+    for kind, column in SHARD_COLUMNS.items():
+        rows = db.query(column).filter(
+            column.isnot(None), models.StockShard.movements > 0
+        ).distinct().all()
+        result.extend((kind, r[0]) for r in rows)
+    return result
+
+
+def first_pending_kardex_id(db: Session):
+    """Menor id de kardex todavía sin cadena completa, o None."""
+    items = pending_items(db)
+    if not items:
+        return None
+    conditions = []
+    for kind in MODELS:
+        ids = [item_id for k, item_id in items if k == kind]
+        if ids:
+            conditions.append(KARDEX_COLUMNS[kind].in_(ids))
+    return db.query(func.min(models.Kardex.id)).filter(
+        models.Kardex.stock_nuevo.is_(None), or_(*conditions)
+    ).scalar()
+
+
+def compact_pending(db: Session):
+    """Compacta todos los ítems pendientes, un commit por ítem. Devuelve cuántos compactó."""
+    items = pending_items(db)
+    for kind, item_id in items:
+        compact_item(db, kind, item_id)
+        db.commit()
+    return len(items)
+
+
+class Compactor:
+    """Hilo que compacta los contadores cada COMPACT_INTERVAL segundos."""
+
+    def __init__(self, session_factory, interval: float = COMPACT_INTERVAL):
+        self._session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="stock-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = self._session_factory()
+            try:
+                compact_pending(db)
+            except Exception:
+                db.rollback()
+                logger.exception("Error compactando contadores de stock")
+            finally:
+                db.close()
@@ -0,0 +1,117 @@
+"""
+Movimientos de stock por lotes.
+
+apply_movements aplica los deltas de varios materiales o productos con un único
+UPDATE (CASE por id) que también incrementa version_id, lee el stock resultante
+con una consulta y registra todos los movimientos en el kardex con un INSERT de
+varias filas, en la misma transacción. Con costs, el mismo UPDATE actualiza el
+costo promedio de las entradas con costo conocido (ver app/costing.py). Los ítems
+con contadores fraccionados pasan por shards.record_movement.
+
+stage_movements hace lo mismo sin confirmar, para combinar movimientos de
+materiales y productos en una sola transacción (órdenes de producción).
+"""
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+from app import shards
+from app.costing import average_cost_update
+from app.kardex_writer import kardex_writer
+
+LABELS = {"material": "Material", "product": "Producto"}
+
+
+def apply_movements(db: Session, kind: str, deltas: Dict[int, int], observaciones: str, user_id: int,
+                    costs: Optional[Dict[int, float]] = None):
+    """
+    Aplica {id: cantidad con signo} y confirma la transacción de la sesión (junto con
+    lo que el llamador ya haya modificado en ella). costs es {id: costo unitario} de
+    las entradas con costo conocido. Lanza 404 si falta algún ítem y 400 si una
+    salida deja stock negativo. Devuelve los ítems con su stock nuevo (id, name,
+    stock, min_stock, avg_cost) para actualizar el índice de stock bajo.
+    """
+    items, kardex_rows = stage_movements(db, kind, deltas, observaciones, user_id, costs)
+    kardex_writer.commit_many(db, kardex_rows)
+    return items
+
+
+def stage_movements(db: Session, kind: str, deltas: Dict[int, int], observaciones: str, user_id: int,
+                    costs: Optional[Dict[int, float]] = None):
+    """
+    Como apply_movements pero sin confirmar: devuelve (ítems, filas de kardex) para
+    que el llamador las registre con kardex_writer.commit_many. Ante un error
+    deshace la transacción y lanza la HTTPException.
+    """
+    model = shards.MODELS[kind]
+    deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+    if not deltas:
+        return [], []
+
+    # UPDATE primero: toma el lock de las filas (en SQLite, el de escritura) antes de
+    # leer el stock resultante, así stock_anterior = stock_nuevo - delta es exacto
+    ids = sorted(deltas)
+    # Solo las entradas con costo cambian el promedio
+    costs = {item_id: cost for item_id, cost in (costs or {}).items()
+             if cost is not None and deltas.get(item_id, 0) > 0}
+    values = []
+    if costs:
+        # Antes que stock: el promedio se calcula con el stock previo
+        received = {item_id: deltas[item_id] for item_id in costs}
+        values.append((model.avg_cost, average_cost_update(model, received, costs)))
+    values += [
+        (model.stock, func.coalesce(model.stock, 0) + case(deltas, value=model.id, else_=0)),
+        (model.version_id, model.version_id + 1),
+    ]
+    db.execute(
+        update(model)
+        .where(model.id.in_(ids), model.stock_shards == 0)
+        .ordered_values(*values)
+        .execution_options(synchronize_session=False)
+    )
+    rows = db.query(model.id, model.name, model.stock, model.min_stock, model.stock_shards, model.avg_cost).filter(
+        model.id.in_(ids)
+    ).all()
+
+    missing = set(ids) - {row.id for row in rows}
+    if missing:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"{LABELS[kind]} no encontrado: {', '.join(map(str, sorted(missing)))}")
+    short = [row.name for row in rows if not row.stock_shards and deltas[row.id] < 0 and row.stock < 0]
+    if short:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Stock insuficiente: {', '.join(short)}")
+
+    items = []
+    kardex_rows = []
+    for row in rows:
+        delta = deltas[row.id]
+        if row.stock_shards:
+            item = db.query(model).filter(model.id == row.id).first()
+            try:
+                items.append(shards.record_movement(
+                    db, kind, item, "entrada" if delta > 0 else "salida", abs(delta),
+                    observaciones, user_id, commit=False, unit_cost=costs.get(row.id),
+                ))
+            except HTTPException:
+                db.rollback()
+                raise
+            continue
+        items.append(row)
+        kardex_rows.append({
+            "movement_type": "entrada" if delta > 0 else "salida",
+            "quantity": abs(delta),
+            "stock_anterior": row.stock - delta,
+            "stock_nuevo": row.stock,
+            "observaciones": observaciones,
+            # Entradas al costo de compra; salidas y entradas sin costo, al promedio
+            "unit_cost": costs.get(row.id, row.avg_cost),
+            "material_id": row.id if kind == "material" else None,
+            "product_id": row.id if kind == "product" else None,
+            "user_id": user_id,
+        })
+
+    return items, kardex_rows
@@ -0,0 +1,262 @@
+import math
+import os
+import threading
+from datetime import date, datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+
+from app import models
+from app.archive import archive_table
+from app.cache import TTLCache
+
+# Los consumos se agregan por semanas para calcular media y variabilidad
+BUCKET_DAYS = 7
+# material_id y semana se combinan en una sola clave entera: material_id << KEY_SHIFT | semana
+KEY_SHIFT = 20
+# Ventana de historial máxima que se puede pedir (incluye los meses archivados)
+MAX_HISTORY_DAYS = 3650
+# Últimos ids del kardex que se vuelven a agregar en cada actualización
+LOOKBACK_IDS = int(os.getenv("KARDEX_LOOKBACK_IDS", "1000"))
+EPOCH = np.datetime64("0001-01-01")
+KARDEX = models.Kardex.__table__
+
+
+class ConsumptionHistory:
+    """
+    Salidas de kardex agregadas por (material, semana) en arreglos NumPy.
+
+    La base agrega en SQL (por material y día) y NumPy convierte los días a
+    semanas y fusiona. La primera carga suma también los meses archivados dentro
+    de MAX_HISTORY_DAYS; los que se archiven después ya se contaron desde la
+    tabla caliente.
+
+    last_id es la única marca: lo acumulado cubre los ids hasta el máximo menos
+    LOOKBACK_IDS, y los últimos LOOKBACK_IDS se vuelven a agregar en cada
+    actualización (tail). Con escritores concurrentes un id menor puede
+    confirmarse después de uno mayor; mientras caiga en esa ventana se cuenta.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.keys = np.empty(0, dtype=np.int64)
+        self.totals = np.empty(0, dtype=np.float64)
+        self._view = (self.keys, self.totals)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def refresh(self, db: Session, max_id: int = None):
+        if max_id is None:
+            max_id = db.query(func.max(models.Kardex.id)).scalar()
+        with self._lock:
+            parts = [(self.keys, self.totals)]
+            if not self._loaded:
+                parts.append(_bucket(_archived_consumption(db)))
+            stable_id = max(self.last_id, (max_id or 0) - LOOKBACK_IDS)
+            # Una consulta para lo nuevo: separa lo que pasa a ser estable de la ventana
+            in_tail = (KARDEX.c.id > stable_id).label("in_tail")
+            rows = db.execute(
+                _consumption(KARDEX, KARDEX.c.id > self.last_id).add_columns(in_tail).group_by(in_tail)
+            ).all()
+            parts.append(_bucket([row[:3] for row in rows if not row[3]]))
+            self.keys, self.totals = _merge(parts)
+            self.last_id = stable_id
+            self._loaded = True
+
+            tail = _bucket([row[:3] for row in rows if row[3]])
+            self._view = _merge([(self.keys, self.totals), tail])
+
+    def weekly_stats(self, weeks: int, today: date = None):
+        """Media y desviación estándar de consumo semanal por material en las últimas `weeks` semanas."""
+        current = (today or date.today()).toordinal() // BUCKET_DAYS
+        with self._lock:
+            keys, totals = self._view
+        bucket = keys & ((1 << KEY_SHIFT) - 1)
+        in_window = (bucket > current - weeks) & (bucket <= current)
+        material_ids, inverse = np.unique(keys[in_window] >> KEY_SHIFT, return_inverse=True)
+        window_totals = totals[in_window]
+        s1 = np.bincount(inverse, weights=window_totals, minlength=len(material_ids))
+        s2 = np.bincount(inverse, weights=window_totals ** 2, minlength=len(material_ids))
+        # Las semanas sin salidas cuentan como consumo cero
+        mean = s1 / weeks
+        std = np.sqrt(np.maximum(s2 / weeks - mean ** 2, 0.0))
+        return material_ids, mean, std
+
+
+def _consumption(table, *conditions):
+    """Salidas por (material, día) de una tabla con las columnas del kardex."""
+    day = func.date(table.c.date)
+    return select(table.c.material_id, day, func.sum(table.c.quantity)).where(
+        table.c.movement_type == "salida",
+        table.c.material_id.isnot(None),
+        table.c.quantity.isnot(None),
+        *conditions,
+    ).group_by(table.c.material_id, day)
+
+
+def _bucket(rows):
+    """Filas (material, día, cantidad) -> claves material << KEY_SHIFT | semana y totales."""
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    material_ids, days, quantities = zip(*rows)
+    # date(...) llega como fecha (MySQL) o texto ISO (SQLite); sin fecha cuenta como hoy
+    days = np.array([d if d is not None else date.today() for d in days], dtype="datetime64[D]")
+    ordinals = (days - EPOCH).astype(np.int64) + 1
+    keys = (np.asarray(material_ids, dtype=np.int64) << KEY_SHIFT) | (ordinals // BUCKET_DAYS)
+    return keys, np.asarray(quantities, dtype=np.float64)
+
+
+def _merge(parts):
+    """Suma por clave de varios pares (claves, totales): una sola reducción vectorizada."""
+    keys, inverse = np.unique(np.concatenate([k for k, _ in parts]), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate([t for _, t in parts]), minlength=len(keys))
+    return keys, totals
+
+
+def _archived_consumption(db: Session):
+    """Salidas por (material, día) de los meses archivados dentro de MAX_HISTORY_DAYS."""
+    oldest = (date.today() - timedelta(days=MAX_HISTORY_DAYS)).replace(day=1)
+    months = [month for (month,) in db.query(models.KardexArchiveMonth.month).filter(
+        models.KardexArchiveMonth.month >= oldest
+    ).all()]
+    selects = [_consumption(archive_table(month)) for month in months]
+    if not selects:
+        return []
+    return db.execute(union_all(*selects) if len(selects) > 1 else selects[0]).all()
+
+
+def _align(ids, other_ids):
+    """Posición de cada id de `other_ids` dentro de `ids` (ordenado) y máscara de encontrados."""
+    pos = np.searchsorted(ids, other_ids)
+    found = (pos < len(ids)) & (ids[np.minimum(pos, len(ids) - 1)] == other_ids)
+    return pos, found
+
+
+history = ConsumptionHistory()
+suggestions_cache = TTLCache(ttl=60, maxsize=64)
+
+
+def compute_suggestions(
+    db: Session,
+    history_days: int = 180,
+    lead_time_days: float = 7,
+    service_level: float = 0.95,
+    cover_days: int = 30,
+):
+    """
+    Punto de reorden por material = consumo diario * plazo + z * desviación * sqrt(plazo).
+    Se sugiere comprar hasta cubrir el punto de reorden más `cover_days` de consumo,
+    descontando el stock actual y las órdenes pendientes.
+    """
+    # Las órdenes solo salen de "pendiente" (se completan o cancelan): con el último id,
+    # la cantidad de pendientes identifica el conjunto de órdenes pendientes
+    max_kardex_id, max_order_id, pending_orders = db.query(
+        db.query(func.max(models.Kardex.id)).scalar_subquery(),
+        db.query(func.max(models.PurchaseOrder.id)).scalar_subquery(),
+        db.query(func.count(models.PurchaseOrder.id)).filter(
+            models.PurchaseOrder.status == "pendiente"
+        ).scalar_subquery(),
+    ).one()
+    cache_key = (history_days, lead_time_days, service_level, cover_days,
+                 max_kardex_id, max_order_id, pending_orders)
+    cached = suggestions_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    history.refresh(db, max_kardex_id)
+    weeks = max(1, math.ceil(history_days / BUCKET_DAYS))
+    consumed_ids, weekly_mean, weekly_std = history.weekly_stats(weeks)
+
+    materials = db.query(
+        models.Material.id, models.Material.name, models.Material.stock, models.Material.min_stock
+    ).order_by(models.Material.id).all()
+    if not materials:
+        result = {"generated_at": datetime.utcnow(), "suppliers": [], "without_supplier": []}
+        suggestions_cache.set(cache_key, result)
+        return result
+
+    ids, names, stocks, min_stocks = zip(*materials)
+    ids = np.asarray(ids, dtype=np.int64)
+    stock = np.asarray([s or 0 for s in stocks], dtype=np.float64)
+    min_stock = np.asarray([s or 0 for s in min_stocks], dtype=np.float64)
+
+    # Consumo semanal -> diario, alineado con el catálogo
+    daily_mean = np.zeros(len(ids))
+    daily_std = np.zeros(len(ids))
+    pos, found = _align(ids, consumed_ids)
+    daily_mean[pos[found]] = weekly_mean[found] / BUCKET_DAYS
+    daily_std[pos[found]] = weekly_std[found] / math.sqrt(BUCKET_DAYS)
+
+    # Cantidades ya pedidas y aún no recibidas
+    pending = np.zeros(len(ids))
+    pending_rows = db.query(
+        models.PurchaseOrderLine.material_id, func.sum(models.PurchaseOrderLine.quantity)
+    ).join(
+        models.PurchaseOrder, models.PurchaseOrder.id == models.PurchaseOrderLine.order_id
+    ).filter(
+        models.PurchaseOrder.status == "pendiente"
+    ).group_by(models.PurchaseOrderLine.material_id).all()
+    if pending_rows:
+        p_ids, p_qty = zip(*pending_rows)
+        p_pos, p_found = _align(ids, np.asarray(p_ids, dtype=np.int64))
+        pending[p_pos[p_found]] = np.asarray(p_qty, dtype=np.float64)[p_found]
+
+    z = NormalDist().inv_cdf(service_level)
+    reorder_point = np.maximum(
+        daily_mean * lead_time_days + z * daily_std * math.sqrt(lead_time_days),
+        min_stock,
+    )
+    position = stock + pending
+    target = reorder_point + daily_mean * cover_days
+    suggested = np.where(position <= reorder_point, np.ceil(np.maximum(target - position, 0)), 0)
+
+    selected = np.nonzero(suggested > 0)[0]
+    selected_ids = ids[selected].tolist()
+
+    # Proveedores vinculados a los materiales sugeridos (índice material_id, supplier_id)
+    suppliers_by_material = {}
+    if selected_ids:
+        for supplier_id, supplier_name, material_id in db.query(
+            models.Supplier.id, models.Supplier.name, models.SupplierMaterial.material_id
+        ).join(
+            models.SupplierMaterial, models.SupplierMaterial.supplier_id == models.Supplier.id
+        ).filter(models.SupplierMaterial.material_id.in_(selected_ids)).all():
+            suppliers_by_material.setdefault(material_id, []).append((supplier_id, supplier_name))
+
+    groups = {}
+    without_supplier = []
+    for i in selected:
+        material_id = int(ids[i])
+        item = {
+            "material_id": material_id,
+            "material_name": names[i],
+            "stock": int(stock[i]),
+            "min_stock": int(min_stock[i]),
+            "pending_quantity": int(pending[i]),
+            "daily_consumption": round(float(daily_mean[i]), 4),
+            "daily_std": round(float(daily_std[i]), 4),
+            "reorder_point": round(float(reorder_point[i]), 2),
+            "suggested_quantity": int(suggested[i]),
+        }
+        linked = suppliers_by_material.get(material_id)
+        if not linked:
+            without_supplier.append(item)
+            continue
+        # Si hay varios proveedores se propone el primero registrado
+        supplier_id, supplier_name = min(linked)
+        group = groups.setdefault(supplier_id, {
+            "supplier_id": supplier_id,
+            "supplier_name": supplier_name,
+            "items": [],
+        })
+        group["items"].append(item)
+
+    result = {
+        "generated_at": datetime.utcnow(),
+        "suppliers": sorted(groups.values(), key=lambda g: g["supplier_id"]),
+        "without_supplier": without_supplier,
+    }
+    suggestions_cache.set(cache_key, result)
+    return result
@@ -0,0 +1,99 @@
+"""
+Relación muchos a muchos entre proveedores y materiales (tabla supplier_materials).
+
+Supplier.material_id se conserva como material principal para los clientes que
+solo conocen un material por proveedor; la lista completa está en la tabla de
+relación, indexada en ambos sentidos.
+"""
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+LINKS = models.SupplierMaterial
+
+
+def backfill_supplier_materials(db: Session) -> int:
+    """
+    Crea la relación de los proveedores que solo tienen material_id (anteriores a
+    la tabla o importados en bloque). Idempotente; devuelve cuántas creó.
+    """
+    suppliers = models.Supplier.__table__
+    links = LINKS.__table__
+    result = db.execute(insert(links).from_select(
+        ["supplier_id", "material_id"],
+        select(suppliers.c.id, suppliers.c.material_id).where(
+            suppliers.c.material_id.isnot(None),
+            ~exists().where(links.c.supplier_id == suppliers.c.id, links.c.material_id == suppliers.c.material_id),
+        ),
+    ))
+    db.commit()
+    return result.rowcount or 0
+
+
+def requested_materials(data: dict):
+    """Ids de materiales pedidos en la creación o actualización, o None si no se indicaron."""
+    if data.get("material_ids") is not None:
+        return list(dict.fromkeys(data["material_ids"]))
+    if data.get("material_id") is not None:
+        return [data["material_id"]]
+    return None
+
+
+def material_names(db: Session, material_ids):
+    """{id: nombre} de los materiales existentes entre los pedidos, en una consulta."""
+    if not material_ids:
+        return {}
+    return dict(db.query(models.Material.id, models.Material.name).filter(models.Material.id.in_(material_ids)).all())
+
+
+def set_materials(db: Session, supplier_id: int, material_ids, add=()):
+    """
+    Reemplaza los materiales del proveedor por material_ids, o con material_ids=None
+    solo agrega los de add (sin confirmar la transacción).
+    """
+    if material_ids is not None:
+        db.execute(delete(LINKS).where(LINKS.supplier_id == supplier_id, LINKS.material_id.notin_(material_ids)))
+    wanted = list(material_ids) if material_ids is not None else list(add)
+    current = {m for (m,) in db.query(LINKS.material_id).filter(
+        LINKS.supplier_id == supplier_id, LINKS.material_id.in_(wanted)
+    ).all()} if wanted else set()
+    missing = [m for m in wanted if m not in current]
+    if missing:
+        db.execute(insert(LINKS), [{"supplier_id": supplier_id, "material_id": m} for m in missing])
+
+
+def with_materials(supplier, materials):
+    """Agrega a un proveedor la lista [(id, nombre)] de sus materiales, como la muestra SupplierOut."""
+    supplier.materials = [{"id": material_id, "name": name} for material_id, name in materials]
+    supplier.material_ids = [material_id for material_id, _ in materials]
+    names = dict(materials)
+    supplier.material_name = names.get(supplier.material_id) if supplier.material_id in names else (
+        materials[0][1] if materials else None
+    )
+    return supplier
+
+
+def load_suppliers(db: Session, *conditions, material_id: int = None):
+    """
+    Proveedores con todos sus materiales en una sola consulta (un join por la
+    tabla de relación). Con material_id, solo los que ofrecen ese material.
+    """
+    query = db.query(models.Supplier, models.Material.id, models.Material.name).outerjoin(
+        LINKS, LINKS.supplier_id == models.Supplier.id
+    ).outerjoin(
+        models.Material, models.Material.id == LINKS.material_id
+    ).filter(*conditions)
+    if material_id is not None:
+        # Usa el índice (material_id, supplier_id)
+        query = query.filter(models.Supplier.id.in_(select(LINKS.supplier_id).where(LINKS.material_id == material_id)))
+    rows = query.order_by(models.Supplier.id, models.Material.id).all()
+
+    suppliers, materials = {}, {}
+    for supplier, linked_id, name in rows:
+        if supplier.id not in suppliers:
+            suppliers[supplier.id] = supplier
+            materials[supplier.id] = []
+        if linked_id is not None:
+            materials[supplier.id].append((linked_id, name))
+    return [with_materials(supplier, materials[supplier_id]) for supplier_id, supplier in suppliers.items()]
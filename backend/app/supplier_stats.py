@@ -0,0 +1,196 @@
+"""
+Indicadores de cumplimiento por proveedor y por proveedor y material.
+
+    lead time          días entre la creación de la orden y su recepción (completed_at),
+                       percentiles 50/90/95 de las órdenes realizadas
+    fill rate          cantidad recibida / cantidad pedida en las órdenes cerradas
+                       (realizadas o canceladas)
+    cancellation ratio órdenes canceladas / órdenes cerradas
+
+Los conteos y cantidades salen de agregados SQL (GROUP BY proveedor, material y
+estado). El resultado se guarda en memoria por proveedor: cuando una orden se
+crea, se completa o se cancela, solo su proveedor queda marcado y la próxima
+consulta recalcula los agregados de los proveedores marcados, sin recorrer todas
+las órdenes. Con varios workers la marca se publica (app/coordination.py).
+
+Las órdenes realizadas antes de existir completed_at no tienen lead time: cuentan
+para fill rate y cancelaciones pero no para los percentiles.
+"""
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import distinct, func
+from sqlalchemy.orm import Session
+
+from app import models
+from app.coordination import change_events, item_keys
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "supplier_stats"
+PERCENTILES = (50, 90, 95)
+COMPLETED, CANCELLED = "realizada", "cancelada"
+
+
+def _empty():
+    return {"orders": 0, "completed": 0, "cancelled": 0, "ordered": 0, "received": 0, "lead_times": []}
+
+
+def _indicators(group):
+    """Convierte los contadores de un grupo en los indicadores de SupplierStatsOut."""
+    closed = group["completed"] + group["cancelled"]
+    lead_times = group["lead_times"]
+    lead_time = {"samples": len(lead_times), "mean": None, **{f"p{p}": None for p in PERCENTILES}}
+    if lead_times:
+        values = np.asarray(lead_times, dtype=np.float64)
+        lead_time["mean"] = round(float(values.mean()), 2)
+        for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            lead_time[f"p{p}"] = round(float(value), 2)
+    return {
+        "orders": group["orders"],
+        "pending": group["orders"] - closed,
+        "completed": group["completed"],
+        "cancelled": group["cancelled"],
+        "quantity_ordered": group["ordered"],
+        "quantity_received": group["received"],
+        "fill_rate": round(group["received"] / group["ordered"], 4) if group["ordered"] else None,
+        "cancellation_ratio": round(group["cancelled"] / closed, 4) if closed else None,
+        "lead_time_days": lead_time,
+    }
+
+
+class SupplierStats:
+    """Indicadores por proveedor en memoria, recalculados solo para los proveedores con cambios."""
+
+    def __init__(self):
+        self._suppliers = {}
+        self._dirty = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Un solo recálculo a la vez; los pedidos simultáneos esperan y reutilizan su resultado
+        self._compute_lock = threading.Lock()
+
+    def mark(self, supplier_id):
+        """Llamar después del commit que cambió una orden del proveedor."""
+        if supplier_id is None:
+            return
+        with self._lock:
+            self._dirty.add(supplier_id)
+        change_events.publish(CHANNEL, f"supplier:{supplier_id}")
+
+    def refresh(self, db: Session, keys):
+        """Marca los proveedores que cambiaron en otro worker; se recalculan en la próxima consulta."""
+        ids = item_keys(keys).get("supplier", set())
+        with self._lock:
+            self._dirty |= ids
+
+    def get(self, db: Session, supplier_ids=None):
+        """Indicadores por proveedor {supplier_id: {...}}, opcionalmente solo de algunos."""
+        with self._compute_lock:
+            with self._lock:
+                loaded, dirty = self._loaded, self._dirty
+                self._dirty = set()
+            # Las marcas que lleguen durante el cálculo quedan para la próxima consulta
+            try:
+                if not loaded:
+                    self._store(self._compute(db), None)
+                elif dirty:
+                    self._store(self._compute(db, dirty), dirty)
+            except Exception:
+                with self._lock:
+                    self._dirty |= dirty
+                raise
+        with self._lock:
+            suppliers = self._suppliers
+            if supplier_ids is None:
+                return dict(suppliers)
+            return {i: suppliers[i] for i in supplier_ids if i in suppliers}
+
+    def _store(self, computed, replaced):
+        with self._lock:
+            if replaced is None:
+                self._suppliers, self._loaded = computed, True
+                logger.info("Indicadores de proveedores cargados: %d proveedores", len(computed))
+                return
+            suppliers = dict(self._suppliers)
+            for supplier_id in replaced:
+                suppliers.pop(supplier_id, None)
+            suppliers.update(computed)
+            self._suppliers = suppliers
+
+    def _compute(self, db: Session, supplier_ids=None):
+        orders = models.PurchaseOrder
+        lines = models.PurchaseOrderLine
+
+        def scoped(query):
+            query = query.filter(orders.supplier_id.isnot(None))
+            if supplier_ids is not None:
+                query = query.filter(orders.supplier_id.in_(supplier_ids))
+            return query
+
+        totals, by_material = {}, {}
+        status = orders.status
+
+        # Órdenes por proveedor y estado (una orden de varios ítems cuenta una vez)
+        for supplier_id, state, count in scoped(
+            db.query(orders.supplier_id, status, func.count(orders.id))
+        ).group_by(orders.supplier_id, status).all():
+            self._count(totals.setdefault(supplier_id, _empty()), state, count)
+
+        # Órdenes y cantidades por proveedor, material y estado
+        for supplier_id, material_id, state, count, quantity in scoped(
+            db.query(orders.supplier_id, lines.material_id, status,
+                     func.count(distinct(orders.id)), func.sum(lines.quantity))
+            .join(lines, lines.order_id == orders.id)
+        ).group_by(orders.supplier_id, lines.material_id, status).all():
+            quantity = int(quantity or 0)
+            group = by_material.setdefault(supplier_id, {}).setdefault(material_id, _empty())
+            self._count(group, state, count)
+            supplier = totals.setdefault(supplier_id, _empty())
+            if state in (COMPLETED, CANCELLED):
+                group["ordered"] += quantity
+                supplier["ordered"] += quantity
+            if state == COMPLETED:
+                group["received"] += quantity
+                supplier["received"] += quantity
+
+        # Fechas de las órdenes realizadas con fecha de recepción, para los percentiles
+        seen = set()
+        for order_id, supplier_id, material_id, created, completed in scoped(
+            db.query(orders.id, orders.supplier_id, lines.material_id, orders.date, orders.completed_at)
+            .join(lines, lines.order_id == orders.id)
+            .filter(status == COMPLETED, orders.completed_at.isnot(None), orders.date.isnot(None))
+        ).all():
+            days = max((completed - created).total_seconds(), 0) / 86400
+            by_material[supplier_id][material_id]["lead_times"].append(days)
+            if order_id not in seen:
+                seen.add(order_id)
+                totals[supplier_id]["lead_times"].append(days)
+
+        computed_at = datetime.utcnow()
+        return {
+            supplier_id: {
+                "supplier_id": supplier_id,
+                "computed_at": computed_at,
+                **_indicators(group),
+                "materials": [
+                    {"material_id": material_id, **_indicators(material_group)}
+                    for material_id, material_group in sorted(by_material.get(supplier_id, {}).items())
+                ],
+            }
+            for supplier_id, group in totals.items()
+        }
+
+    @staticmethod
+    def _count(group, state, count):
+        group["orders"] += count
+        if state == COMPLETED:
+            group["completed"] += count
+        elif state == CANCELLED:
+            group["cancelled"] += count
+
+
+supplier_stats = SupplierStats()
+change_events.subscribe(CHANNEL, supplier_stats.refresh)
@@ -0,0 +1,252 @@
+"""
+Presupuestos de consultas SQL por endpoint para detectar regresiones N+1.
+
+Cada endpoint declara el máximo de sentencias que puede ejecutar por petición
+(incluida la búsqueda del usuario autenticado). El verificador genera dos
+volúmenes de datos, mide cada endpoint en ambos (en procesos separados, con
+cachés en frío) y falla si se supera el presupuesto o si el número de consultas
+crece con la cantidad de filas.
+
+Uso:
+    python -m benchmarks.budgets                 # SQLite temporal, escalas tiny y small
+    python -m benchmarks.budgets --sizes tiny medium
+    python -m pytest benchmarks                  # lo mismo dentro de la suite (ver test_budgets.py)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from benchmarks.seed import SCALES, use_database
+
+BUDGET_HEADER = "X-Query-Budget"
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+@dataclass(frozen=True)
+class Budget:
+    method: str
+    path: str
+    max_queries: int
+    body: dict = None
+
+    @property
+    def name(self):
+        return f"{self.method} {self.path}"
+
+
+BUDGETS = [
+    # dashboard (en frío, sin caché)
+    Budget("GET", "/dashboard/", 4),
+    # materials
+    Budget("GET", "/materials/", 2),
+    Budget("GET", "/materials/{material_id}", 3),
+    Budget("GET", "/materials/?ids={material_id},{supplier_material_id},999999", 2),
+    Budget("GET", "/materials/{supplier_material_id}/suppliers", 2),
+    Budget("POST", "/materials/", 4, {"name": "Nuevo", "stock": 5, "min_stock": 1}),
+    Budget("PUT", "/materials/{material_id}", 7, {"stock": 999}),
+    Budget("POST", "/materials/{material_id}/add?quantity=2", 6),
+    Budget("POST", "/materials/{material_id}/remove?quantity=1", 6),
+    # products
+    Budget("GET", "/products/", 2),
+    Budget("GET", "/products/?ids={product_id},999999", 2),
+    Budget("POST", "/products/", 3, {"name": "Nuevo", "stock": 5, "min_stock": 1, "sale_price": 10}),
+    Budget("PUT", "/products/{product_id}", 5, {"stock": 999}),
+    Budget("POST", "/products/{product_id}/add?quantity=2", 5),
+    Budget("POST", "/products/{product_id}/remove?quantity=1", 5),
+    Budget("GET", "/products/{product_id}/bom", 2),
+    Budget("PUT", "/products/{product_id}/bom", 5, [{"material_id": "{material_id}", "quantity": 2}]),
+    # production (el material ya tiene stock 999 por el PUT de materials)
+    Budget("POST", "/production/orders", 10, {"product_id": "{product_id}", "quantity": 3}),
+    Budget("GET", "/production/orders", 2),
+    # purchases
+    Budget("GET", "/purchases/orders", 2),
+    Budget("GET", "/purchases/orders?ids={order_id},{cancel_order_id}", 2),
+    # en frío: la primera carga del historial también lee el catálogo de meses archivados
+    Budget("GET", "/purchases/suggestions", 7),
+    Budget("POST", "/purchases/orders", 6, {"supplier_id": "{supplier_id}", "material_id": "{supplier_material_id}", "quantity": 5, "unit_cost": 12.5}),
+    Budget("PUT", "/purchases/orders/{order_id}/complete", 6),
+    Budget("PUT", "/purchases/orders/{cancel_order_id}/cancel", 5),
+    # suppliers
+    Budget("GET", "/suppliers/", 2),
+    Budget("GET", "/suppliers/{supplier_id}", 2),
+    Budget("GET", "/suppliers/?ids={supplier_id},999999", 2),
+    Budget("GET", "/suppliers/by-material/{supplier_material_id}", 2),
+    Budget("GET", "/suppliers/materials/{supplier_material_id}/suppliers", 2),
+    # indicadores en frío: autenticación, tres agregados y los nombres
+    Budget("GET", "/suppliers/analytics", 5),
+    # kardex: constante sin importar el límite; +1 (catálogo del archivo) si la tabla caliente no alcanza
+    Budget("GET", "/kardex/?limit=10", 2),
+    Budget("GET", "/kardex/?limit=1000", 3),
+    Budget("GET", "/kardex/material/{material_id}?limit=10", 3),
+    Budget("GET", "/kardex/material/{material_id}?limit=1000", 4),
+    Budget("GET", "/kardex/product/{product_id}?limit=1000", 4),
+    # búsqueda: solo la autenticación, el índice está en memoria
+    Budget("GET", "/search/?q=vidrio", 1),
+    Budget("GET", "/search/?q=vidro%20azul", 1),
+    # alertas y reportes
+    Budget("GET", "/inventory/alerts/", 1),
+    Budget("GET", "/reports/abc?kind=product", 17),
+    # valorización: una consulta sobre el catálogo, sin importar el historial
+    Budget("GET", "/reports/valuation", 2),
+    # reportes en segundo plano: pedir y consultar no generan el reporte
+    Budget("POST", "/jobs/", 6, {"report": "kardex_export", "params": {}}),
+    Budget("GET", "/jobs/", 2),
+]
+
+
+def _fill(value, ctx):
+    if isinstance(value, str):
+        return value.format(**ctx)
+    if isinstance(value, dict):
+        filled = {k: _fill(v, ctx) for k, v in value.items()}
+        return {k: int(v) if isinstance(v, str) and v.isdigit() else v for k, v in filled.items()}
+    if isinstance(value, list):
+        return [_fill(v, ctx) for v in value]
+    return value
+
+
+def _context():
+    """Ids válidos del primer usuario de benchmark."""
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        supplier = db.query(models.Supplier).filter(models.Supplier.material_id.isnot(None)).first()
+        pending = db.query(models.PurchaseOrder.id).filter(
+            models.PurchaseOrder.user_id == 1, models.PurchaseOrder.status == "pendiente"
+        ).order_by(models.PurchaseOrder.id).limit(2).all()
+        material = db.query(models.Kardex.material_id).filter(
+            models.Kardex.user_id == 1, models.Kardex.material_id.isnot(None)
+        ).first()
+        product = db.query(models.Kardex.product_id).filter(
+            models.Kardex.user_id == 1, models.Kardex.product_id.isnot(None)
+        ).first()
+    finally:
+        db.close()
+    return {
+        "material_id": material[0] if material else 1,
+        "product_id": product[0] if product else 1,
+        "supplier_id": supplier.id,
+        "supplier_material_id": supplier.material_id,
+        "order_id": pending[0].id,
+        "cancel_order_id": pending[1].id,
+    }
+
+
+def measure(database_url):
+    """Ejecuta cada endpoint una vez y devuelve {nombre: consultas}."""
+    use_database(database_url)
+    from app.database import engine
+    from app.main import app
+    from benchmarks import querycount
+    from benchmarks.run import Client, _free_port, login, start_server
+
+    querycount.install(engine)
+    counts = {}
+
+    def on_request(scope, counter):
+        headers = dict(scope.get("headers") or [])
+        key = headers.get(BUDGET_HEADER.lower().encode())
+        if key:
+            counts[key.decode()] = counter.count
+
+    port = _free_port()
+    server, thread = start_server(querycount.QueryCountMiddleware(app, on_request), port)
+    failures = {}
+    try:
+        ctx = _context()
+        client = Client(port, login(port, "bench1"))
+        for budget in BUDGETS:
+            try:
+                status, data = client.request(
+                    budget.method, _fill(budget.path, ctx), _fill(budget.body, ctx),
+                    extra_headers={BUDGET_HEADER: budget.name},
+                )
+            except OSError as exc:
+                failures[budget.name] = f"sin respuesta: {exc}"
+                continue
+            if status >= 400:
+                failures[budget.name] = f"HTTP {status}: {data[:200]!r}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return counts, failures
+
+
+def check(results, sizes):
+    """Compara los conteos por tamaño contra los presupuestos declarados."""
+    problems = []
+    for budget in BUDGETS:
+        counts = [results[size]["counts"].get(budget.name) for size in sizes]
+        for size in sizes:
+            error = results[size]["failures"].get(budget.name)
+            if error:
+                problems.append(f"{budget.name} [{size}]: {error}")
+        if any(c is None for c in counts):
+            problems.append(f"{budget.name}: sin medición")
+            continue
+        if max(counts) > budget.max_queries:
+            problems.append(f"{budget.name}: {max(counts)} consultas > presupuesto {budget.max_queries}")
+        if counts[-1] > counts[0]:
+            problems.append(f"{budget.name}: las consultas crecen con los datos ({' -> '.join(map(str, counts))})")
+    return problems
+
+
+def measure_sizes(sizes, directory):
+    """Siembra cada tamaño en una base SQLite dentro de `directory` y lo mide en frío."""
+    results = {}
+    for size in sizes:
+        url = f"sqlite:///{os.path.join(directory, size + '.db')}"
+        # Cada tamaño en su propio proceso: `app` fija la URL de la base al importarse
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.seed", "--database-url", url, "--scale", size],
+            check=True, capture_output=True, cwd=BACKEND_DIR,
+        )
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.budgets", "--measure", url],
+            check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+        ).stdout
+        # La salida también trae los registros JSON del logging de la app
+        results[size] = next(
+            json.loads(line) for line in reversed(output.strip().splitlines()) if line.startswith('{"counts"')
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica presupuestos de consultas SQL por endpoint")
+    parser.add_argument("--sizes", nargs=2, default=["tiny", "small"], choices=sorted(SCALES))
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        counts, failures = measure(args.measure)
+        print(json.dumps({"counts": counts, "failures": failures}))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = measure_sizes(args.sizes, tmp)
+
+    print(f"{'endpoint':<62}{'máx':>5}" + "".join(f"{s:>8}" for s in args.sizes))
+    for budget in BUDGETS:
+        row = "".join(f"{str(results[s]['counts'].get(budget.name, '-')):>8}" for s in args.sizes)
+        print(f"{budget.name:<62}{budget.max_queries:>5}{row}")
+
+    problems = check(results, args.sizes)
+    if problems:
+        print("\nPRESUPUESTOS EXCEDIDOS:")
+        for p in problems:
+            print(f"  - {p}")
+        return 1
+    print("\nTodos los endpoints dentro de su presupuesto.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,57 @@
+"""
+Plugin de pytest para limitar las consultas SQL de un test.
+
+Activación: conftest.py del backend lo registra para toda la suite (fuera de
+ella, pytest -p benchmarks.pytest_plugin). Lo usan los tests de
+benchmarks/test_budgets.py.
+
+    @pytest.mark.max_queries(3)
+    def test_kardex(client):
+        client.get("/kardex/?limit=500")
+
+    def test_orders(client, query_counter):
+        client.get("/purchases/orders")
+        assert query_counter.count <= 2, query_counter.statements
+
+Los conteos incluyen las consultas hechas por endpoints síncronos, porque el
+threadpool de FastAPI hereda el contexto del test.
+"""
+import pytest
+
+from benchmarks import querycount
+
+
+def _install():
+    from app.database import engine
+
+    querycount.install(engine)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "max_queries(n): falla si el test ejecuta más de n sentencias SQL"
+    )
+
+
+@pytest.fixture
+def query_counter():
+    """Cuenta las sentencias SQL ejecutadas durante el test."""
+    _install()
+    with querycount.counting(keep_statements=True) as counter:
+        yield counter
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("max_queries")
+    if marker is None:
+        return (yield)
+
+    _install()
+    with querycount.counting(keep_statements=True) as counter:
+        result = yield
+    limit = marker.args[0]
+    if counter.count > limit:
+        statements = "\n".join(f"  {s}" for s in counter.statements)
+        pytest.fail(f"{counter.count} consultas SQL > máximo {limit}:\n{statements}", pytrace=False)
+    return result
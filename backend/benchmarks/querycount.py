@@ -0,0 +1,74 @@
+"""
+Conteo de sentencias SQL por petición mediante eventos del engine de SQLAlchemy.
+
+El contador vive en un ContextVar: la petición (o el bloque `with counting()`)
+crea el suyo y las consultas ejecutadas en ese contexto, incluidos los hilos del
+threadpool de FastAPI que heredan el contexto, lo incrementan.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+_current = ContextVar("query_count", default=None)
+_installed = set()
+
+
+class QueryCount:
+    def __init__(self, keep_statements: bool = False):
+        self.count = 0
+        self.keep_statements = keep_statements
+        self.statements = []
+
+    def __repr__(self):
+        return f"QueryCount({self.count})"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current.get()
+    if counter is not None:
+        counter.count += 1
+        if counter.keep_statements:
+            counter.statements.append(statement)
+
+
+def install(engine):
+    """Registra el listener en el engine (una sola vez)."""
+    if id(engine) not in _installed:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        _installed.add(id(engine))
+
+
+@contextmanager
+def counting(keep_statements: bool = False):
+    counter = QueryCount(keep_statements)
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+def route_name(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}"
+
+
+class QueryCountMiddleware:
+    """
+    Middleware ASGI que cuenta las consultas de cada petición y llama a
+    `on_request(scope, counter)` al terminar.
+    """
+
+    def __init__(self, app, on_request):
+        self.app = app
+        self.on_request = on_request
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with counting() as counter:
+            await self.app(scope, receive, send)
+        self.on_request(scope, counter)
@@ -0,0 +1,421 @@
+"""
+Benchmark de carga: levanta la API en el mismo proceso (uvicorn en un hilo) sobre
+una base generada con `benchmarks.seed`, ejecuta una mezcla concurrente de
+peticiones sobre todos los routers y reporta p50/p95/p99, throughput y consultas
+SQL por petición.
+
+Uso:
+    python -m benchmarks.run --database-url sqlite:///bench.db --seed-data --scale small
+    python -m benchmarks.run --database-url sqlite:///bench.db --save-baseline
+    python -m benchmarks.run --database-url sqlite:///bench.db       # compara con el baseline
+
+Si existe un baseline para la misma mezcla y escala, la corrida termina con
+código 1 cuando algún escenario empeora más que la tolerancia.
+"""
+import argparse
+import http.client
+import json
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlencode
+
+import numpy as np
+
+from benchmarks import querycount
+from benchmarks.seed import BENCH_PASSWORD, add_volume_arguments, seed, use_database, volumes_from_args
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+SCENARIO_HEADER = "X-Bench-Scenario"
+
+
+# -------- ESCENARIOS --------
+# Cada escenario devuelve (método, ruta, cuerpo JSON o None, cuerpo de formulario o None)
+
+def s_login(ctx, rng):
+    user = rng.randint(1, ctx["users"])
+    return "POST", "/auth/login", None, {"username": f"bench{user}", "password": BENCH_PASSWORD}
+
+
+def s_list_materials(ctx, rng):
+    return "GET", "/materials/", None, None
+
+
+def s_get_material(ctx, rng):
+    return "GET", f"/materials/{rng.randint(1, ctx['materials'])}", None, None
+
+
+def s_add_material(ctx, rng):
+    return "POST", f"/materials/{rng.randint(1, ctx['materials'])}/add?quantity={rng.randint(1, 20)}", None, None
+
+
+def s_remove_material(ctx, rng):
+    return "POST", f"/materials/{rng.randint(1, ctx['materials'])}/remove?quantity=1", None, None
+
+
+def s_update_material(ctx, rng):
+    return "PUT", f"/materials/{rng.randint(1, ctx['materials'])}", {"min_stock": rng.randint(0, 60)}, None
+
+
+def s_list_products(ctx, rng):
+    return "GET", "/products/", None, None
+
+
+def s_add_product(ctx, rng):
+    return "POST", f"/products/{rng.randint(1, ctx['products'])}/add?quantity={rng.randint(1, 20)}", None, None
+
+
+def s_remove_product(ctx, rng):
+    return "POST", f"/products/{rng.randint(1, ctx['products'])}/remove?quantity=1", None, None
+
+
+def s_list_orders(ctx, rng):
+    return "GET", "/purchases/orders", None, None
+
+
+def s_create_order(ctx, rng):
+    supplier_id, material_id = rng.choice(ctx["supplier_materials"])
+    body = {"supplier_id": supplier_id, "material_id": material_id, "quantity": rng.randint(1, 100)}
+    return "POST", "/purchases/orders", body, None
+
+
+def s_complete_order(ctx, rng):
+    with ctx["lock"]:
+        order_id = ctx["pending_orders"].pop() if ctx["pending_orders"] else None
+    if order_id is None:
+        return s_list_orders(ctx, rng)
+    return "PUT", f"/purchases/orders/{order_id}/complete", None, None
+
+
+def s_list_suppliers(ctx, rng):
+    return "GET", "/suppliers/", None, None
+
+
+def s_get_supplier(ctx, rng):
+    return "GET", f"/suppliers/{rng.randint(1, ctx['suppliers'])}", None, None
+
+
+def s_suppliers_by_material(ctx, rng):
+    _, material_id = rng.choice(ctx["supplier_materials"])
+    return "GET", f"/suppliers/by-material/{material_id}", None, None
+
+
+def s_kardex(ctx, rng):
+    return "GET", "/kardex/?limit=100", None, None
+
+
+def s_kardex_material(ctx, rng):
+    return "GET", f"/kardex/material/{rng.randint(1, ctx['materials'])}", None, None
+
+
+def s_dashboard(ctx, rng):
+    return "GET", "/dashboard/", None, None
+
+
+# Todos los trabajadores mueven el mismo material (ver --hot-shards)
+HOT_MATERIAL_ID = 1
+
+
+def s_add_hot(ctx, rng):
+    return "POST", f"/materials/{HOT_MATERIAL_ID}/add?quantity={rng.randint(1, 5)}", None, None
+
+
+def s_remove_hot(ctx, rng):
+    return "POST", f"/materials/{HOT_MATERIAL_ID}/remove?quantity=1", None, None
+
+
+SCENARIOS = {name[2:]: fn for name, fn in globals().items() if name.startswith("s_")}
+
+MIXES = {
+    # Uso diario: mayormente lecturas puntuales, algunos movimientos e inicios de sesión
+    "default": {
+        "login": 2, "dashboard": 8, "list_materials": 4, "get_material": 10, "add_material": 6,
+        "remove_material": 6, "update_material": 2, "list_products": 3, "add_product": 3,
+        "remove_product": 3, "list_orders": 3, "create_order": 4, "complete_order": 3,
+        "list_suppliers": 3, "get_supplier": 5, "suppliers_by_material": 4, "kardex": 6,
+        "kardex_material": 5,
+    },
+    # Ráfaga de escrituras sobre stock
+    "writes": {
+        "add_material": 30, "remove_material": 30, "add_product": 10, "remove_product": 10,
+        "create_order": 10, "complete_order": 10,
+    },
+    # Listados completos y reportes de kardex
+    "reads": {
+        "list_materials": 20, "list_products": 15, "list_suppliers": 15, "list_orders": 15,
+        "kardex": 20, "kardex_material": 10, "dashboard": 5,
+    },
+    # Contención sobre un único material (comparar con y sin --hot-shards)
+    "hot": {"add_hot": 55, "remove_hot": 45},
+}
+
+
+# -------- SERVIDOR EN PROCESO --------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+# -------- CLIENTE --------
+
+class Client:
+    def __init__(self, port, token=None):
+        self.port = port
+        self.token = token
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+
+    def request(self, method, path, body=None, form=None, scenario=None, extra_headers=None):
+        headers = dict(extra_headers or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if scenario:
+            headers[SCENARIO_HEADER] = scenario
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            payload = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+            raise
+        return response.status, data
+
+
+def login(port, username):
+    status, data = Client(port).request("POST", "/auth/login", form={"username": username, "password": BENCH_PASSWORD})
+    if status != 200:
+        raise RuntimeError(f"No se pudo iniciar sesión como {username}: {status} {data[:200]!r}")
+    return json.loads(data)["access_token"]
+
+
+def build_context(volumes):
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        supplier_materials = db.query(
+            models.SupplierMaterial.supplier_id, models.SupplierMaterial.material_id
+        ).all()
+        pending = db.query(models.PurchaseOrder.id, models.PurchaseOrder.user_id).filter(
+            models.PurchaseOrder.status == "pendiente"
+        ).all()
+    finally:
+        db.close()
+    return {
+        **volumes,
+        "supplier_materials": supplier_materials,
+        "pending_by_user": pending,
+        "lock": threading.Lock(),
+    }
+
+
+def worker(port, token, user_id, ctx, mix, deadline, results, errors, rng_seed):
+    rng = random.Random(rng_seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    client = Client(port, token)
+    # Cada usuario solo puede completar sus propias órdenes
+    local_ctx = dict(ctx, pending_orders=[o for o, u in ctx["pending_by_user"] if u == user_id])
+    rng.shuffle(local_ctx["pending_orders"])
+    while time.perf_counter() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        method, path, body, form = SCENARIOS[scenario](local_ctx, rng)
+        started = time.perf_counter()
+        try:
+            status, _ = client.request(method, path, body, form, scenario=scenario)
+        except Exception:
+            errors[scenario] += 1
+            continue
+        elapsed = time.perf_counter() - started
+        if status >= 500:
+            errors[scenario] += 1
+        results[scenario].append(elapsed)
+
+
+def run(args):
+    use_database(args.database_url)
+    volumes = volumes_from_args(args)
+    if args.seed_data:
+        elapsed = seed(args.database_url, seed_value=args.seed, days=args.days, **volumes)
+        print(f"Datos generados en {elapsed:.1f}s")
+
+    from app.database import engine
+    from app.main import app
+
+    querycount.install(engine)
+    query_counts = defaultdict(list)
+
+    def on_request(scope, counter):
+        headers = dict(scope.get("headers") or [])
+        scenario = headers.get(SCENARIO_HEADER.lower().encode())
+        if scenario:
+            query_counts[scenario.decode()].append(counter.count)
+
+    port = _free_port()
+    server, thread = start_server(querycount.QueryCountMiddleware(app, on_request), port)
+    try:
+        ctx = build_context(volumes)
+        tokens = [login(port, f"bench{(i % volumes['users']) + 1}") for i in range(args.concurrency)]
+        mix = MIXES[args.mix]
+        if args.hot_shards is not None:
+            status, data = Client(port, tokens[0]).request(
+                "PUT", f"/materials/{HOT_MATERIAL_ID}", {"stock_shards": args.hot_shards}
+            )
+            if status != 200:
+                raise RuntimeError(f"No se pudo configurar stock_shards: {status} {data[:200]!r}")
+
+        # Calentamiento (cachés, pool de conexiones) sin registrar resultados
+        warm_results, warm_errors = defaultdict(list), defaultdict(int)
+        deadline = time.perf_counter() + args.warmup
+        _run_workers(port, tokens, volumes, ctx, mix, deadline, warm_results, warm_errors, args.seed)
+        query_counts.clear()
+
+        results, errors = defaultdict(list), defaultdict(int)
+        started = time.perf_counter()
+        deadline = started + args.duration
+        _run_workers(port, tokens, volumes, ctx, mix, deadline, results, errors, args.seed + 1)
+        wall = time.perf_counter() - started
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    return summarize(results, errors, query_counts, wall)
+
+
+def _run_workers(port, tokens, volumes, ctx, mix, deadline, results, errors, seed_value):
+    threads = []
+    for i, token in enumerate(tokens):
+        user_id = (i % volumes["users"]) + 1
+        t = threading.Thread(
+            target=worker,
+            args=(port, token, user_id, ctx, mix, deadline, results, errors, seed_value * 1000 + i),
+            daemon=True,
+        )
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+
+def summarize(results, errors, query_counts, wall):
+    scenarios = {}
+    total = 0
+    for name in sorted(set(results) | set(errors)):
+        latencies = np.asarray(results.get(name, []), dtype=np.float64) * 1000
+        total += len(latencies)
+        queries = query_counts.get(name, [])
+        scenarios[name] = {
+            "requests": int(len(latencies)),
+            "errors": int(errors.get(name, 0)),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2) if len(latencies) else None,
+            "p99_ms": round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+            "queries_per_request": round(float(np.mean(queries)), 2) if queries else None,
+            "max_queries": int(max(queries)) if queries else None,
+        }
+    return {
+        "duration_s": round(wall, 2),
+        "requests": total,
+        "throughput_rps": round(total / wall, 1) if wall else 0.0,
+        "scenarios": scenarios,
+    }
+
+
+def print_report(report):
+    print(f"\n{'escenario':<24}{'req':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/req':>8}")
+    for name, s in report["scenarios"].items():
+        fmt = lambda v: "-" if v is None else f"{v:.1f}"
+        print(f"{name:<24}{s['requests']:>7}{s['errors']:>5}{fmt(s['p50_ms']):>10}{fmt(s['p95_ms']):>10}"
+              f"{fmt(s['p99_ms']):>10}{fmt(s['queries_per_request']):>8}")
+    print(f"\nTotal: {report['requests']} peticiones en {report['duration_s']}s "
+          f"-> {report['throughput_rps']} req/s")
+
+
+def compare(report, baseline, tolerance):
+    """Devuelve la lista de regresiones respecto al baseline."""
+    regressions = []
+    if report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_rps']} < {baseline['throughput_rps']} req/s")
+    for name, base in baseline["scenarios"].items():
+        current = report["scenarios"].get(name)
+        if not current:
+            continue
+        if base["p95_ms"] and current["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms > {base['p95_ms']}ms")
+        if base["queries_per_request"] is not None and current["queries_per_request"] is not None \
+                and current["queries_per_request"] > base["queries_per_request"] + 0.5:
+            regressions.append(
+                f"{name}: {current['queries_per_request']} consultas/petición > {base['queries_per_request']}"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: {current['errors']} errores (baseline {base['errors']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga de la API")
+    parser.add_argument("--database-url", default="sqlite:///bench.db")
+    parser.add_argument("--seed-data", action="store_true", help="Regenerar los datos antes de medir")
+    add_volume_arguments(parser)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos de medición")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Regresión admitida (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="Guardar el reporte JSON en este archivo")
+    parser.add_argument("--hot-shards", type=int, default=None,
+                        help="Contadores parciales para el material caliente (0 los desactiva)")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    shards_suffix = f"-s{args.hot_shards}" if args.hot_shards is not None else ""
+    baseline_path = BASELINE_DIR / f"{args.mix}-{args.scale}-c{args.concurrency}{shards_suffix}.json"
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"Baseline guardado en {baseline_path}")
+        return 0
+
+    if baseline_path.exists():
+        regressions = compare(report, json.loads(baseline_path.read_text()), args.tolerance)
+        if regressions:
+            print("\nREGRESIONES respecto al baseline:")
+            for r in regressions:
+                print(f"  - {r}")
+            return 1
+        print("\nSin regresiones respecto al baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,138 @@
+"""
+Escalado con varios procesos: levanta la API con gunicorn (gunicorn.conf.py) para
+cada cantidad de workers, ejecuta la misma mezcla de `benchmarks.run` y reporta
+el throughput y la latencia de cada configuración relativos a un solo worker.
+
+Uso:
+    python -m benchmarks.scaling --database-url sqlite:///bench.db --seed-data --scale small
+    python -m benchmarks.scaling --database-url mysql+pymysql://... --workers 1 2 4 8 --mix reads
+
+Con --seed-data la base se regenera antes de cada configuración, para que todas
+partan de los mismos datos. En SQLite las escrituras se serializan: la mezcla
+`writes` escala poco ahí; usar MySQL para medir escrituras.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.run import MIXES, _free_port, _run_workers, build_context, login, summarize
+from benchmarks.seed import add_volume_arguments, seed, use_database, volumes_from_args
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def default_workers():
+    counts = [1]
+    while counts[-1] * 2 <= multiprocessing.cpu_count():
+        counts.append(counts[-1] * 2)
+    return counts
+
+
+def start_gunicorn(database_url, workers, port):
+    env = dict(
+        os.environ,
+        MYSQL_ADDON_URI=database_url,
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(port),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn terminó al iniciar: {process.stderr.read().decode()[-2000:]}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        process.kill()
+        raise RuntimeError("gunicorn no respondió a tiempo")
+    # Cada worker carga sus índices al iniciar: esperar a que todos atiendan
+    time.sleep(1 + workers * 0.5)
+    return process
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def measure(args, workers):
+    volumes = volumes_from_args(args)
+    if args.seed_data:
+        seed(args.database_url, seed_value=args.seed, days=args.days, **volumes)
+    ctx = build_context(volumes)
+
+    port = _free_port()
+    process = start_gunicorn(args.database_url, workers, port)
+    try:
+        tokens = [login(port, f"bench{(i % volumes['users']) + 1}") for i in range(args.concurrency)]
+        mix = MIXES[args.mix]
+        deadline = time.perf_counter() + args.warmup
+        _run_workers(port, tokens, volumes, ctx, mix, deadline, defaultdict(list), defaultdict(int), args.seed)
+
+        results, errors = defaultdict(list), defaultdict(int)
+        started = time.perf_counter()
+        _run_workers(port, tokens, volumes, ctx, mix, started + args.duration, results, errors, args.seed + 1)
+        wall = time.perf_counter() - started
+    finally:
+        stop_gunicorn(process)
+    return summarize(results, errors, {}, wall)
+
+
+def _overall(report, percentile):
+    """Percentil ponderado aproximado: el peor de los escenarios con al menos 1 % de las peticiones."""
+    values = [
+        s[percentile] for s in report["scenarios"].values()
+        if s[percentile] is not None and s["requests"] >= report["requests"] * 0.01
+    ]
+    return max(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de la API según la cantidad de workers de gunicorn")
+    parser.add_argument("--database-url", default="sqlite:///bench.db")
+    parser.add_argument("--seed-data", action="store_true", help="Regenerar los datos antes de cada configuración")
+    add_volume_arguments(parser)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers())
+    parser.add_argument("--mix", choices=sorted(MIXES), default="default")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos de medición por configuración")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--output", help="Guardar los reportes JSON en este archivo")
+    args = parser.parse_args()
+    use_database(args.database_url)
+
+    reports = {}
+    for workers in args.workers:
+        print(f"Midiendo con {workers} worker(s)...", flush=True)
+        reports[workers] = measure(args, workers)
+
+    base = reports[args.workers[0]]["throughput_rps"] or 1
+    print(f"\n{'workers':>8}{'req/s':>10}{'escala':>9}{'errores':>9}{'p95 ms':>10}{'p99 ms':>10}")
+    for workers, report in reports.items():
+        errors = sum(s["errors"] for s in report["scenarios"].values())
+        fmt = lambda v: "-" if v is None else f"{v:.1f}"
+        print(f"{workers:>8}{report['throughput_rps']:>10}{report['throughput_rps'] / base:>8.2f}x{errors:>9}"
+              f"{fmt(_overall(report, 'p95_ms')):>10}{fmt(_overall(report, 'p99_ms')):>10}")
+    if args.output:
+        Path(args.output).write_text(json.dumps({str(w): r for w, r in reports.items()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
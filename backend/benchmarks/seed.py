@@ -0,0 +1,255 @@
+"""
+Generador reproducible de datos para benchmarks.
+
+Crea usuarios, materiales, productos, proveedores, órdenes y un kardex cuyas
+cadenas stock_anterior -> stock_nuevo son consistentes con el stock final.
+
+Uso:
+    python -m benchmarks.seed --database-url sqlite:///bench.db --scale small
+    python -m benchmarks.seed --database-url mysql+pymysql://... --materials 10000 --kardex 5000000
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SCALES = {
+    "tiny": dict(users=2, materials=200, products=50, suppliers=40, orders=1_000, kardex=5_000),
+    "small": dict(users=5, materials=1_000, products=200, suppliers=100, orders=10_000, kardex=100_000),
+    "medium": dict(users=10, materials=5_000, products=1_000, suppliers=500, orders=50_000, kardex=1_000_000),
+    "large": dict(users=20, materials=10_000, products=2_000, suppliers=1_000, orders=100_000, kardex=5_000_000),
+}
+
+BENCH_PASSWORD = "bench"
+TYPES = ["Vidrio", "Aluminio", "Espejo", "Templado", "Laminado", "Accesorio"]
+COLORS = ["Incoloro", "Bronce", "Gris", "Azul", "Verde", "Negro"]
+STATUSES = np.array(["pendiente", "realizada", "cancelada"])
+CHUNK = 20_000
+
+
+def use_database(url: str):
+    """Debe llamarse antes de importar `app`, que lee la URL al importarse."""
+    if url:
+        os.environ["MYSQL_ADDON_URI"] = url
+    # Los registros por petición ensuciarían los reportes (LOG_LEVEL=INFO para medirlos)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Todos los clientes del benchmark comparten IP: sin límite de logins por cliente
+    os.environ.setdefault("RATE_LIMIT_LOGIN", "1000000/1")
+    os.environ.setdefault("RATE_LIMIT_HEAVY", "1000000/1")
+
+
+def _insert(conn, table, rows):
+    for i in range(0, len(rows), CHUNK):
+        conn.execute(table.insert(), rows[i:i + CHUNK])
+
+
+def _kardex_chains(rng, n, n_materials, n_products):
+    """
+    Genera movimientos con cadenas consistentes por ítem de forma vectorizada.
+    Devuelve arreglos por fila (en orden de id) y el stock final por ítem.
+    """
+    is_product = rng.random(n) < (n_products / max(n_materials + n_products, 1))
+    item = np.where(is_product, rng.integers(0, max(n_products, 1), n), rng.integers(0, max(n_materials, 1), n))
+    key = np.where(is_product, n_materials + item, item)
+    quantity = rng.integers(1, 21, n)
+    sign = np.where(rng.random(n) < 0.45, 1, -1)
+    delta = sign * quantity
+
+    # Prefijos acumulados por ítem respetando el orden de id
+    order = np.argsort(key, kind="stable")
+    key_sorted = key[order]
+    delta_sorted = delta[order]
+    cumulative = np.cumsum(delta_sorted)
+    starts = np.flatnonzero(np.r_[True, key_sorted[1:] != key_sorted[:-1]])
+    group_sizes = np.diff(np.r_[starts, n])
+    offset = np.repeat(cumulative[starts] - delta_sorted[starts], group_sizes)
+    after_prefix = cumulative - offset
+
+    # Stock inicial suficiente para que nunca sea negativo
+    total_items = n_materials + n_products
+    initial = rng.integers(0, 50, total_items)
+    lowest = np.minimum.reduceat(after_prefix, starts)
+    initial[key_sorted[starts]] += np.maximum(0, -lowest)
+
+    after_sorted = initial[key_sorted] + after_prefix
+    before_sorted = after_sorted - delta_sorted
+    before = np.empty(n, dtype=np.int64)
+    after = np.empty(n, dtype=np.int64)
+    before[order] = before_sorted
+    after[order] = after_sorted
+
+    final = initial.copy()
+    np.add.at(final, key, delta)
+    return is_product, item, quantity, sign, before, after, final
+
+
+def seed(database_url: str = None, seed_value: int = 42, days: int = 3 * 365, **volumes):
+    use_database(database_url)
+    from app import models
+    from app.database import Base, engine
+    from app.routers.auth import get_password_hash
+
+    rng = np.random.default_rng(seed_value)
+    n_users = volumes["users"]
+    n_materials = volumes["materials"]
+    n_products = volumes["products"]
+    n_suppliers = volumes["suppliers"]
+    n_orders = volumes["orders"]
+    n_kardex = volumes["kardex"]
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=days)
+
+    started = time.perf_counter()
+    is_product, item, quantity, sign, before, after, final = _kardex_chains(rng, n_kardex, n_materials, n_products)
+
+    with engine.begin() as conn:
+        password_hash = get_password_hash(BENCH_PASSWORD)
+        _insert(conn, models.User.__table__, [
+            {"id": i + 1, "username": f"bench{i + 1}", "password_hash": password_hash}
+            for i in range(n_users)
+        ])
+
+        min_stock = rng.integers(0, 60, n_materials + n_products)
+        # Costos con un generador aparte para no alterar el resto de los datos
+        cost_rng = np.random.default_rng(seed_value + 3)
+        material_cost = np.round(cost_rng.uniform(1, 200, n_materials), 2)
+        _insert(conn, models.Material.__table__, [
+            {
+                "id": i + 1,
+                "name": f"{TYPES[i % len(TYPES)]} {i + 1}",
+                "type": TYPES[i % len(TYPES)],
+                "color": COLORS[i % len(COLORS)],
+                "stock": int(final[i]),
+                "min_stock": int(min_stock[i]),
+                "avg_cost": float(material_cost[i]),
+            }
+            for i in range(n_materials)
+        ])
+        prices = np.round(rng.uniform(5, 500, n_products), 2)
+        product_cost = np.round(prices * cost_rng.uniform(0.3, 0.7, n_products), 2)
+        _insert(conn, models.Product.__table__, [
+            {
+                "id": i + 1,
+                "name": f"Producto {i + 1}",
+                "type": TYPES[i % len(TYPES)],
+                "color": COLORS[i % len(COLORS)],
+                "stock": int(final[n_materials + i]),
+                "min_stock": int(min_stock[n_materials + i]),
+                "sale_price": float(prices[i]),
+                "avg_cost": float(product_cost[i]),
+            }
+            for i in range(n_products)
+        ])
+
+        supplier_material = rng.integers(1, n_materials + 1, n_suppliers)
+        _insert(conn, models.Supplier.__table__, [
+            {
+                "id": i + 1,
+                "name": f"Proveedor {i + 1}",
+                "contact_person": f"Contacto {i + 1}",
+                "phone": f"9{i:08d}",
+                "email": f"proveedor{i + 1}@example.com",
+                "address": f"Av. Industrial {i + 1}",
+                "material_id": int(supplier_material[i]),
+            }
+            for i in range(n_suppliers)
+        ])
+        # Material principal más 0 a 2 adicionales por proveedor (generador aparte)
+        links_rng = np.random.default_rng(seed_value + 2)
+        supplier_links = []
+        for i in range(n_suppliers):
+            extra = links_rng.integers(1, n_materials + 1, links_rng.integers(0, 3))
+            for material_id in dict.fromkeys([int(supplier_material[i]), *map(int, extra)]):
+                supplier_links.append({"supplier_id": i + 1, "material_id": material_id})
+        _insert(conn, models.SupplierMaterial.__table__, supplier_links)
+
+        order_supplier = rng.integers(0, n_suppliers, n_orders)
+        order_status = STATUSES[rng.choice(3, n_orders, p=[0.3, 0.6, 0.1])]
+        order_offsets = np.sort(rng.integers(0, days * 86400, n_orders))
+        order_users = rng.integers(1, n_users + 1, n_orders)
+        order_qty = rng.integers(1, 200, n_orders)
+        # Lead time por proveedor (generador aparte para no alterar el resto de los datos)
+        lead_rng = np.random.default_rng(seed_value + 1)
+        supplier_lead = lead_rng.uniform(2, 20, n_suppliers)
+        order_lead = lead_rng.gamma(4, supplier_lead[order_supplier] / 4) * 86400
+        order_material = supplier_material[order_supplier]
+        order_cost = np.round(material_cost[order_material - 1] * cost_rng.uniform(0.8, 1.2, n_orders), 2)
+        _insert(conn, models.PurchaseOrder.__table__, [
+            {
+                "id": i + 1,
+                "date": start + timedelta(seconds=int(order_offsets[i])),
+                "quantity": int(order_qty[i]),
+                "unit_cost": float(order_cost[i]),
+                "status": str(order_status[i]),
+                "completed_at": start + timedelta(seconds=int(order_offsets[i] + order_lead[i]))
+                if order_status[i] == "realizada" else None,
+                "cancelled_at": start + timedelta(seconds=int(order_offsets[i] + order_lead[i] / 2))
+                if order_status[i] == "cancelada" else None,
+                "supplier_id": int(order_supplier[i]) + 1,
+                "material_id": int(order_material[i]),
+                "user_id": int(order_users[i]),
+            }
+            for i in range(n_orders)
+        ])
+
+        step = days * 86400 / max(n_kardex, 1)
+        kardex_users = rng.integers(1, n_users + 1, n_kardex)
+        table = models.Kardex.__table__
+        for chunk_start in range(0, n_kardex, CHUNK):
+            chunk_end = min(chunk_start + CHUNK, n_kardex)
+            conn.execute(table.insert(), [
+                {
+                    "id": i + 1,
+                    "date": start + timedelta(seconds=int(i * step)),
+                    "movement_type": "entrada" if sign[i] > 0 else "salida",
+                    "quantity": int(quantity[i]),
+                    "stock_anterior": int(before[i]),
+                    "stock_nuevo": int(after[i]),
+                    "observaciones": "Movimiento de benchmark",
+                    "material_id": None if is_product[i] else int(item[i]) + 1,
+                    "product_id": int(item[i]) + 1 if is_product[i] else None,
+                    "user_id": int(kardex_users[i]),
+                }
+                for i in range(chunk_start, chunk_end)
+            ])
+
+    return time.perf_counter() - started
+
+
+def add_volume_arguments(parser):
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, default=None, help="Sobrescribe el volumen de la escala")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=3 * 365, help="Días de historial a generar")
+
+
+def volumes_from_args(args):
+    volumes = dict(SCALES[args.scale])
+    for name in volumes:
+        value = getattr(args, name)
+        if value is not None:
+            volumes[name] = value
+    return volumes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos de benchmark")
+    parser.add_argument("--database-url", default="sqlite:///bench.db")
+    add_volume_arguments(parser)
+    args = parser.parse_args()
+
+    volumes = volumes_from_args(args)
+    elapsed = seed(args.database_url, seed_value=args.seed, days=args.days, **volumes)
+    print("Datos generados en {:.1f}s: {}".format(
+        elapsed, ", ".join(f"{k}={v}" for k, v in volumes.items())
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Costo en Python por consulta: `db.query(...)` armado en cada llamada frente a las
+sentencias precompiladas de app/queries.py.
+
+Cada caso ejecuta la misma consulta N veces con una sola sesión contra la base
+indicada (por defecto, un SQLite temporal con datos de la escala tiny), así que la
+diferencia entre columnas es la construcción de la expresión y el cálculo de la
+clave de caché de compilación, no el tiempo de la base.
+
+Uso:
+    python -m benchmarks.statements
+    python -m benchmarks.statements --database-url mysql+pymysql://... --iterations 20000
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+
+from benchmarks.seed import SCALES, seed, use_database
+
+
+def _measure(fn, iterations):
+    fn()
+    gc.collect()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def cases(db):
+    from app import models
+    from app.queries import get_by_id, kardex_listing, user_by_username
+
+    user = db.query(models.User).order_by(models.User.id).first()
+    material_id = db.query(models.Material.id).order_by(models.Material.id).first()[0]
+
+    def legacy_kardex():
+        db.query(models.Kardex, models.Material.name, models.Product.name).outerjoin(
+            models.Material, models.Material.id == models.Kardex.material_id
+        ).outerjoin(
+            models.Product, models.Product.id == models.Kardex.product_id
+        ).filter(models.Kardex.user_id == user.id).order_by(models.Kardex.date.desc()).limit(20).all()
+
+    return {
+        "usuario por username": (
+            lambda: db.query(models.User).filter(models.User.username == user.username).first(),
+            lambda: user_by_username(db, user.username),
+        ),
+        "material por id": (
+            lambda: db.query(models.Material).filter(models.Material.id == material_id).first(),
+            lambda: get_by_id(db, models.Material, material_id),
+        ),
+        "listado del kardex (20)": (
+            legacy_kardex,
+            lambda: kardex_listing(db, user.id, 20, with_names=True),
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo por consulta de db.query frente a sentencias precompiladas")
+    parser.add_argument("--database-url", help="Base ya poblada (por defecto, SQLite temporal con la escala tiny)")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    url = args.database_url
+    if url is None:
+        path = os.path.join(tempfile.mkdtemp(), "statements.db")
+        url = f"sqlite:///{path}"
+        seed(url, **SCALES["tiny"])
+    use_database(url)
+
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"{'consulta':<26}{'db.query µs':>13}{'precompilada µs':>17}{'ahorro':>9}")
+        for name, (before, after) in cases(db).items():
+            legacy = _measure(before, args.iterations)
+            cached = _measure(after, args.iterations)
+            print(f"{name:<26}{legacy:>13.1f}{cached:>17.1f}{(1 - cached / legacy):>8.0%}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
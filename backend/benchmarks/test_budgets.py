@@ -0,0 +1,55 @@
+"""
+Presupuestos de consultas SQL dentro de la suite de pytest.
+
+    cd backend && python -m pytest benchmarks
+
+test_budgets_two_sizes corre el verificador completo (escalas tiny y small, cada
+una en su proceso y con cachés en frío). test_endpoint_budget ejecuta cada
+endpoint de BUDGETS con el marcador max_queries del plugin sobre una base tiny
+sembrada para la sesión; las cachés quedan tibias entre tests, así que solo
+puede contar menos consultas que el verificador.
+"""
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.budgets import BACKEND_DIR, BUDGETS, _context, _fill, check, measure_sizes
+from benchmarks.seed import BENCH_PASSWORD, use_database
+
+SIZES = ["tiny", "small"]
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """Cliente con sesión de bench1 sobre una base tiny, cabeceras y los ids de _context()."""
+    url = f"sqlite:///{tmp_path_factory.mktemp('budgets') / 'tiny.db'}"
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.seed", "--database-url", url, "--scale", "tiny"],
+        check=True, capture_output=True, cwd=BACKEND_DIR,
+    )
+    # Antes de importar `app`, que fija la URL de la base al importarse
+    use_database(url)
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        response = client.post("/auth/login", data={"username": "bench1", "password": BENCH_PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        yield client, headers, _context()
+
+
+@pytest.mark.parametrize("budget", [
+    pytest.param(budget, marks=pytest.mark.max_queries(budget.max_queries), id=budget.name)
+    for budget in BUDGETS
+])
+def test_endpoint_budget(api, budget):
+    client, headers, ctx = api
+    response = client.request(
+        budget.method, _fill(budget.path, ctx), json=_fill(budget.body, ctx), headers=headers,
+    )
+    assert response.status_code < 400, response.text
+
+
+def test_budgets_two_sizes(tmp_path):
+    assert check(measure_sizes(SIZES, tmp_path), SIZES) == []
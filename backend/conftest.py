@@ -0,0 +1,2 @@
+# Presupuestos de consultas SQL: marcador max_queries y fixture query_counter
+pytest_plugins = ["benchmarks.pytest_plugin"]
@@ -0,0 +1,67 @@
+"""
+Configuración de gunicorn para servir la API con varios procesos (workers de uvicorn).
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Variables de entorno:
+    PORT                          puerto (8000)
+    WEB_CONCURRENCY               cantidad de workers (núcleos disponibles)
+    GUNICORN_PRELOAD              1 = importar la app en el maestro antes de crear los workers (1)
+    GUNICORN_TIMEOUT              segundos sin respuesta antes de reiniciar un worker (60)
+    GUNICORN_GRACEFUL_TIMEOUT     segundos para terminar las peticiones en curso al reiniciar (30)
+    GUNICORN_KEEPALIVE            segundos de keep-alive (5)
+    GUNICORN_MAX_REQUESTS         reiniciar cada worker tras N peticiones, 0 = nunca (0)
+    GUNICORN_MAX_REQUESTS_JITTER  variación aleatoria de lo anterior (0)
+    FORWARDED_ALLOW_IPS           proxies cuyo X-Forwarded-For se acepta, "*" = todos (ninguno);
+                                  en Render usar "*" para que el límite de login sea por cliente
+
+Reinicio sin cortes: `kill -HUP <pid del maestro>` levanta workers nuevos y
+espera a que los viejos terminen sus peticiones. Con GUNICORN_PRELOAD=1 el
+código no se recarga con HUP; para desplegar código nuevo usar GUNICORN_PRELOAD=0
+o reiniciar el maestro.
+
+Con más de un worker se activan los eventos entre workers (app/coordination.py)
+para mantener sincronizados los índices en memoria, y KARDEX_WRITE_MODE debe ser
+"sync": la escritura agrupada del kardex (app/kardex_writer.py) solo ordena los
+movimientos dentro de un proceso y se rechaza al iniciar.
+
+El control de admisión (app/admission.py) es por worker: las tasas de
+RATE_LIMIT_LOGIN y RATE_LIMIT_HEAVY se dividen por WEB_CONCURRENCY, pero los
+límites de concurrencia de ADMISSION_<CLASE> valen para cada worker (el total es
+WEB_CONCURRENCY veces el configurado).
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+
+# Antes de importar la app: app.coordination, app.kardex_writer y app.admission leen las variables al cargarse
+os.environ["WEB_CONCURRENCY"] = str(workers)
+if workers > 1:
+    os.environ.setdefault("CROSS_WORKER_EVENTS", "1")
+
+
+def on_starting(server):
+    # Completar líneas de órdenes y compactar contadores una sola vez, en el maestro
+    from app.database import engine
+    from app.main import MAINTENANCE_DONE, run_maintenance
+
+    run_maintenance()
+    os.environ[MAINTENANCE_DONE] = "1"
+    engine.dispose()
+
+
+def post_fork(server, worker):
+    # Cada worker abre sus propias conexiones; las heredadas del maestro no se reutilizan
+    from app.database import engine
+
+    engine.dispose(close=False)
@@ -27,7 +27,7 @@ export default function App() {
       try {
         setToken(token);
 
-        const response = await fetch(`${API_URL}/materials/`, {
+        const response = await fetch(`${API_URL}/dashboard/`, {
           headers: {
             'Authorization': `Bearer ${token}`,
             'Content-Type': 'application/json'
@@ -101,9 +101,10 @@ export default function Materials() {
       isSavingRef.current = true;
       setIsSaving(true);
 
-      // SOLO enviar el campo stock que cambió
+      // SOLO enviar el campo stock que cambió, con la versión leída para detectar conflictos
       const updateData = {
-        stock: parsed
+        stock: parsed,
+        version_id: material.version_id
       };
 
       console.log(`Actualizando material ${id} con nuevo stock: ${parsed} (anterior: ${material.stock})`);
@@ -115,6 +116,12 @@ export default function Materials() {
       await fetchMaterials();
     } catch (err) {
       console.error("Error modificando stock:", err);
+      if (err.status === 409 || err.status === 412) {
+        alert("Otro usuario modificó este material. Se recargarán los datos.");
+        setEditingId(null);
+        await fetchMaterials();
+        return;
+      }
       alert("Error al guardar los cambios: " + (err.message || "Error desconocido"));
     } finally {
       isSavingRef.current = false;
@@ -254,13 +254,18 @@ export default function Purchases() {
     }
   };
 
+  // Órdenes de varios ítems: lista de materiales en lugar de un solo material
+  const materialLabel = (order, material) => {
+    if (order.lines?.length > 1) return order.lines.map(l => l.material_name || `ID: ${l.material_id}`).join(', ');
+    return material ? material.name : `ID: ${order.material_id}`;
+  };
+
   const handlePrintOrder = async (order) => {
     try {
       // 1. Obtenemos los datos frescos y completos del proveedor
       const supplierData = await api.getSupplier(order.supplier_id);
 
-      // 2. Buscamos el material (ya lo tenemos en memoria)
-      const material = materials.find(m => m.id === order.material_id);
+      // 2. Los materiales de cada ítem se buscan en memoria al armar la tabla
 
       // 3. Generamos el PDF
       const printWindow = window.open('', '_blank');
@@ -372,12 +377,15 @@ export default function Purchases() {
                   </tr>
                 </thead>
                 <tbody>
-                  <tr>
-                    <td>${order.material_id}</td>
-                    <td><strong>${material ? material.name : 'Material no encontrado'}</strong></td>
-                    <td>${material ? (material.type + ' - ' + material.color) : '-'}</td>
-                    <td style="text-align: right; font-size: 16px; font-weight: bold;">${order.quantity}</td>
-                  </tr>
+                  ${(order.lines?.length ? order.lines : [{ material_id: order.material_id, quantity: order.quantity }]).map(line => {
+                    const lineMaterial = materials.find(m => m.id === line.material_id);
+                    return `<tr>
+                    <td>${line.material_id}</td>
+                    <td><strong>${lineMaterial ? lineMaterial.name : 'Material no encontrado'}</strong></td>
+                    <td>${lineMaterial ? (lineMaterial.type + ' - ' + lineMaterial.color) : '-'}</td>
+                    <td style="text-align: right; font-size: 16px; font-weight: bold;">${line.quantity}</td>
+                  </tr>`;
+                  }).join('')}
                 </tbody>
               </table>
             </div>
@@ -601,7 +609,7 @@ export default function Purchases() {
                         <td className="align-middle"><span className="badge bg-secondary">{order.id}</span></td>
                         <td className="align-middle"><small>{new Date(order.date).toLocaleDateString('es-ES')}</small></td>
                         <td className="align-middle">{order.supplier_name || 'Desconocido'}</td>
-                        <td className="align-middle fw-semibold">{material ? material.name : `ID: ${order.material_id}`}</td>
+                        <td className="align-middle fw-semibold">{materialLabel(order, material)}</td>
                         <td className="align-middle">{order.quantity}</td>
                         <td className="align-middle">
                           <span className={`badge ${order.status === 'realizada' ? 'bg-success' : order.status === 'cancelada' ? 'bg-danger' : 'bg-warning text-dark'}`}>
@@ -664,7 +672,7 @@ export default function Purchases() {
                       <div className="small mb-3">
                         <div className="mb-1"><strong>Fecha:</strong> {new Date(order.date).toLocaleDateString('es-ES')}</div>
                         <div className="mb-1"><strong>Proveedor:</strong> {order.supplier_name || 'Desconocido'}</div>
-                        <div className="mb-1"><strong>Material:</strong> {material ? material.name : `ID: ${order.material_id}`}</div>
+                        <div className="mb-1"><strong>Material:</strong> {materialLabel(order, material)}</div>
                         <div><strong>Cantidad:</strong> {order.quantity}</div>
                       </div>
                       <div className="d-flex gap-2">
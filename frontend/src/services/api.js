@@ -48,9 +48,11 @@ async function request(endpoint, method = "GET", body = null) {
 
   if (!res.ok) {
     const errorData = await res.json().catch(() => ({}));
-    throw new Error(
+    const error = new Error(
       `Error ${res.status}: ${errorData.detail || "Ocurrió un error"}`
     );
+    error.status = res.status;
+    throw error;
   }
 
   return res.json();
@@ -88,7 +90,7 @@ export const api = {
   /**
    * 📦 Materias Primas
    */
-  getMaterials: () => request("/materials/"),
+  getMaterials: (ids) => request(ids ? `/materials/?ids=${ids.join(",")}` : "/materials/"),
   addMaterial: (data) => request("/materials/", "POST", data), //
   updateMaterial: (id, data) => request(`/materials/${id}`, "PUT", data),
   deleteMaterial: (id) => request(`/materials/${id}`, "DELETE"),
@@ -96,7 +98,7 @@ export const api = {
   /**
    * 🛠️ Productos
    */
-  getProducts: () => request("/products/"),
+  getProducts: (ids) => request(ids ? `/products/?ids=${ids.join(",")}` : "/products/"),
   addProduct: (data) => request("/products/", "POST", data),
   updateProduct: (id, data) => request(`/products/${id}/`, "PUT", data),
   deleteProduct: (id) => request(`/products/${id}/`, "DELETE"),
@@ -104,6 +106,15 @@ export const api = {
     request(`/products/${id}/add/?quantity=${quantity}`, "POST"),
   removeStock: (id, quantity = 1) =>
     request(`/products/${id}/remove/?quantity=${quantity}`, "POST"),
+  getBom: (productId) => request(`/products/${productId}/bom`),
+  setBom: (productId, lines) => request(`/products/${productId}/bom`, "PUT", lines),
+
+  /**
+   * 🏭 Producción (descuenta materiales según la lista y suma el producto)
+   */
+  getProductionOrders: () => request("/production/orders"),
+  createProductionOrder: (productId, quantity) =>
+    request("/production/orders", "POST", { product_id: productId, quantity }),
 
   /**
    * 🚨 Alertas
@@ -114,7 +125,7 @@ export const api = {
   /**
    * 📝 Órdenes de Compra
    */
-  getOrders: () => request("/purchases/orders/"),
+  getOrders: (ids) => request(ids ? `/purchases/orders/?ids=${ids.join(",")}` : "/purchases/orders/"),
   createOrder: (data) => request("/purchases/orders/", "POST", data),
   completeOrder: (orderId) => request(`/purchases/orders/${orderId}/complete`, "PUT"),
   cancelOrder: (orderId) => request(`/purchases/orders/${orderId}/cancel`, "PUT"),
@@ -122,13 +133,54 @@ export const api = {
   /**
    * 🏢 Proveedores
    */
-  getSuppliers: () => request("/suppliers/"),
+  getSuppliers: (ids) => request(ids ? `/suppliers/?ids=${ids.join(",")}` : "/suppliers/"),
    getSupplier: (id) => request(`/suppliers/${id}`),
   addSupplier: (data) => request("/suppliers/", "POST", data),
   getMaterialSuppliers: (materialId) => request(`/suppliers/by-material/${materialId}`),
+  addSupplierMaterial: (supplierId, materialId) =>
+    request(`/suppliers/${supplierId}/materials/${materialId}`, "POST"),
+  removeSupplierMaterial: (supplierId, materialId) =>
+    request(`/suppliers/${supplierId}/materials/${materialId}`, "DELETE"),
+  getSupplierAnalytics: (ids) =>
+    request(ids ? `/suppliers/analytics?ids=${ids.join(",")}` : "/suppliers/analytics"),
   /**
    *
    * 📊 Kardex
    */
   getKardex: () => request("/kardex/"),
+
+  /**
+   * 🏠 Dashboard (conteos, stock bajo, órdenes pendientes y últimos movimientos)
+   */
+  getDashboard: () => request("/dashboard/"),
+
+  /**
+   * 🔎 Búsqueda en el catálogo (kind: "material" | "product" | "supplier")
+   */
+  searchCatalog: (q, kind = null, limit = 20) =>
+    request(`/search/?q=${encodeURIComponent(q)}&limit=${limit}${kind ? `&kind=${kind}` : ""}`),
+
+  /**
+   * 💰 Valorización del inventario (kind: "material" | "product"; sin kind, ambos)
+   */
+  getValuation: (kind = null) => request(kind ? `/reports/valuation?kind=${kind}` : "/reports/valuation"),
+
+  /**
+   * 📁 Reportes en segundo plano (kardex_export, abc, period_summary)
+   */
+  submitJob: (report, params = {}) => request("/jobs/", "POST", { report, params }),
+  getJobs: () => request("/jobs/"),
+  getJob: (id) => request(`/jobs/${id}`),
+  downloadJob: async (id) => {
+    const res = await fetch(`${API_URL}/jobs/${id}/download`, {
+      headers: { Authorization: `Bearer ${loadToken()}` },
+    });
+    if (!res.ok) {
+      const errorData = await res.json().catch(() => ({}));
+      const error = new Error(`Error ${res.status}: ${errorData.detail || "Ocurrió un error"}`);
+      error.status = res.status;
+      throw error;
+    }
+    return res.blob();
+  },
 };
\ No newline at end of file